@@ -1,14 +1,14 @@
 
 from __future__ import annotations
 import datetime as dt
+import hashlib
 import json
 from collections import Counter
 from typing import Any, Dict, List, Tuple
 
-import numpy as np
 import pytz
 
-from . import db
+from . import db, rollups
 from .deps import get_settings
 from .utils_openai import generate_insight_openai
 
@@ -34,60 +34,86 @@ def extract_sub_pairs(ops_raw: str | List[Dict]) -> List[Tuple[str, str]]:
                 pairs.append((op["g"], op["p"]))
     return pairs
 
+WINDOW_DAYS = 7
+
+def window_bounds(days: int) -> Tuple[dt.datetime, dt.date]:
+    """
+    Rolling window of `days` x 24 h ending now: (start, first whole UTC day). Whole days
+    come from user_daily_stats; the part of the edge day after `start` is read from the
+    result tables (db.get_partial_day_deltas).
+    """
+    start_ts = dt.datetime.utcnow() - dt.timedelta(days=days)
+    return start_ts, start_ts.date() + dt.timedelta(days=1)
+
+def summarize_window(rows, start_ts: dt.datetime, edge: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """
+    Metrics from user_daily_stats rows of one user plus the edge-day delta. Quantiles come
+    from DDSketches (see sketch.py for the error bound).
+    """
+    agg = rollups.merge_days(list(rows) + ([edge] if edge else []))
+
+    per_n = agg["per_sle_count"]
+    attempts_grammar = agg["grammar_attempts"]
+    per_median = rollups.quantile(agg, "per_sketch", 0.5)
+    latency_p50 = rollups.quantile(agg, "latency_sketch", 0.5)
+    return {
+        "start_ts": start_ts,
+        "attempts_phoneme": agg["phoneme_attempts"],
+        "attempts_grammar": attempts_grammar,
+        "per_sle_avg": round(agg["per_sle_sum"] / per_n, 2) if per_n else None,
+        "per_sle_median": round(per_median, 2) if per_median is not None else None,
+        "edits_per_100w_avg": round(agg["edits100_sum"] / attempts_grammar, 2) if attempts_grammar else None,
+        "latency_ms_p50": int(round(latency_p50)) if latency_p50 is not None else None,
+        "top_phone_subs": [{"pair": k, "count": v} for k, v in Counter(agg["sub_pairs"]).most_common(5)],
+        "top_grammar_weaknesses": [{"category": k, "count": v} for k, v in Counter(agg["grammar_weaknesses"]).most_common(5)],
+        "top_pronunciation_weaknesses": [{"category": k, "count": v} for k, v in Counter(agg["pron_weaknesses"]).most_common(5)],
+    }
+
+async def window_stats(user_id: str, days: int) -> Dict[str, Any]:
+    start_ts, first_day = window_bounds(days)
+    rows = await db.get_user_daily_stats(user_id, first_day)
+    edge = (await db.get_partial_day_deltas([user_id], start_ts, first_day)).get(user_id)
+    return summarize_window(rows, start_ts, edge)
+
 async def compute_last7d(user_id: str) -> dict:
+    stats = await window_stats(user_id, WINDOW_DAYS)
+    return await build_last7d(user_id, stats, await db.get_user_analytics_cache(user_id))
+
+def _previous_headline(previous, insight_key: str, now: dt.datetime) -> str | None:
+    """The stored headline, if its inputs are unchanged or the last insight call was too recent."""
+    if previous is None or not previous.headline_msg:
+        return None
+    if previous.insight_key == insight_key:
+        return previous.headline_msg
+    insight_at = db.to_utc_naive(previous.insight_at)
+    min_interval = dt.timedelta(seconds=get_settings().ANALYTICS_INSIGHT_MIN_INTERVAL_SECONDS)
+    if insight_at is not None and now - insight_at < min_interval:
+        return previous.headline_msg
+    return None
+
+async def build_last7d(user_id: str, stats: Dict[str, Any], previous=None) -> dict:
+    """
+    Cache payload (with LLM headline) from summarize_window() output. `previous` is the
+    user's current user_analytics_cache row: its headline is kept, without an LLM call,
+    when the insight inputs are unchanged or it is younger than the minimum interval.
+    """
     settings = get_settings()
-    WINDOW_DAYS = 7
     CACHE_TTL_HOURS = settings.ANALYTICS_CACHE_TTL_HOURS
     TZ = settings.TIMEZONE
 
     end_ts = now_tz(TZ)
-    start_ts = end_ts - dt.timedelta(days=WINDOW_DAYS)
-
-    phoneme_results = await db.get_phoneme_results_last_n_days(user_id, days=WINDOW_DAYS)
-    grammar_results = await db.get_grammar_results_last_n_days(user_id, days=WINDOW_DAYS)
+    start_ts = stats["start_ts"].replace(tzinfo=pytz.utc).astimezone(end_ts.tzinfo)
 
     # --- Metrics --- 
-    attempts_phoneme = len(phoneme_results)
-    attempts_grammar = len(grammar_results)
-
-    per_vals = [r.per_sle for r in phoneme_results if r.per_sle is not None]
-    per_sle_avg = round(float(np.mean(per_vals)), 2) if per_vals else None
-    per_sle_median = round(float(np.median(per_vals)), 2) if per_vals else None
-
-    edits100 = []
-    latencies = []
-    grammar_weaknesses = Counter()
-    for r in grammar_results:
-        edits = json.loads(r.edits) if isinstance(r.edits, str) else (r.edits or [])
-        words = max(1, len((r.final_text or "").split()))
-        edits100.append(len(edits) * 100.0 / words)
-        if r.latency_ms is not None:
-            latencies.append(r.latency_ms)
-        
-        cats = json.loads(r.weakness_categories) if isinstance(r.weakness_categories, str) else r.weakness_categories
-        if cats:
-            grammar_weaknesses.update(cats)
-
-    edits_per_100w_avg = round(float(np.mean(edits100)), 2) if edits100 else None
-    latency_ms_p50 = int(np.percentile(latencies, 50)) if latencies else None
-    top_grammar_weaknesses = [{"category": k, "count": v} for k, v in grammar_weaknesses.most_common(5)]
-
-    subs_counts = Counter()
-    pronunciation_weaknesses = Counter()
-    for r in phoneme_results:
-        # Refined top_phone_subs to only include actual errors
-        ops = json.loads(r.ops_raw) if isinstance(r.ops_raw, str) else r.ops_raw
-        if ops:
-            for op in ops:
-                if op.get("op") == "S" and op.get("g") and op.get("p"):
-                    subs_counts[f"{op['g']}->{op['p']}"] += 1
-        
-        cats = json.loads(r.weakness_categories) if isinstance(r.weakness_categories, str) else r.weakness_categories
-        if cats:
-            pronunciation_weaknesses.update(cats)
-
-    top_subs = [{"pair": k, "count": v} for k, v in subs_counts.most_common(5)]
-    top_pronunciation_weaknesses = [{"category": k, "count": v} for k, v in pronunciation_weaknesses.most_common(5)]
+    attempts_phoneme = stats["attempts_phoneme"]
+    attempts_grammar = stats["attempts_grammar"]
+    per_sle_avg = stats["per_sle_avg"]
+    per_sle_median = stats["per_sle_median"]
+    edits_per_100w_avg = stats["edits_per_100w_avg"]
+    latency_ms_p50 = stats["latency_ms_p50"]
+    top_subs = stats["top_phone_subs"]
+    top_grammar_weaknesses = stats["top_grammar_weaknesses"]
+    top_pronunciation_weaknesses = stats["top_pronunciation_weaknesses"]
 
     badge = "Most Improved" if (per_sle_avg is not None and per_sle_avg < 15) else "Keep Going"
 
@@ -105,11 +131,18 @@ async def compute_last7d(user_id: str) -> dict:
         "attempts": {"phoneme": attempts_phoneme, "grammar": attempts_grammar},
         "badge": badge
     }
-    insight = await generate_insight_openai(insight_payload)
-    headline = insight["headline"] if insight else "Keep up the great work! Practice regularly to improve your scores."
+    now = dt.datetime.utcnow()
+    insight_key = hashlib.sha256(json.dumps(insight_payload, sort_keys=True).encode()).hexdigest()
+    headline = _previous_headline(previous, insight_key, now)
+    if headline is not None:
+        insight_key, insight_at = previous.insight_key, previous.insight_at
+    else:
+        insight = await generate_insight_openai(insight_payload)
+        headline = insight["headline"] if insight else "Keep up the great work! Practice regularly to improve your scores."
+        # a failed call is rate-limited too, but not remembered as answering these inputs
+        insight_key, insight_at = (insight_key if insight else None), now
 
     # --- Final Payload --- 
-    now = dt.datetime.utcnow()
     return {
         "user_id": user_id,
         "window_label": f"{WINDOW_DAYS}d",
@@ -126,6 +159,8 @@ async def compute_last7d(user_id: str) -> dict:
         "top_pronunciation_weaknesses": top_pronunciation_weaknesses,
         "badge": badge,
         "headline_msg": headline,
+        "insight_key": insight_key,
+        "insight_at": insight_at,
         "updated_at": now,
         "expires_at": now + dt.timedelta(hours=CACHE_TTL_HOURS)
     }
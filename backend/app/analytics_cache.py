@@ -0,0 +1,84 @@
+from __future__ import annotations
+import asyncio
+import datetime as dt
+from typing import Dict, Set
+
+from sqlalchemy import Row
+
+from . import db, metrics
+from .analytics import compute_last7d
+from .cache import TTLCache
+from .deps import get_settings
+
+# Read path for user_analytics_cache:
+#   - an in-process TTL layer in front of the DB row, so hot dashboards don't query per view;
+#   - stale-while-revalidate: an expired row is served as-is while a refresh runs in the background;
+#   - single-flight: concurrent refreshes for one user share a single compute (and LLM call).
+
+settings = get_settings()
+_memory = TTLCache(maxsize=settings.ANALYTICS_MEMORY_CACHE_SIZE, ttl_seconds=settings.ANALYTICS_MEMORY_TTL_SECONDS)
+_inflight: Dict[str, asyncio.Task] = {}
+_background: Set[asyncio.Task] = set()
+
+_hits_memory = metrics.counter("analytics_cache_hits_memory")
+_hits_db = metrics.counter("analytics_cache_hits_db")
+_stale_served = metrics.counter("analytics_cache_stale_served")
+_recomputes = metrics.counter("analytics_recomputes")
+_coalesced = metrics.counter("analytics_recomputes_coalesced")
+
+def is_expired(row: Row) -> bool:
+    expires_at = db.to_utc_naive(row.expires_at)
+    return expires_at is None or expires_at <= dt.datetime.utcnow()
+
+async def _recompute(user_id: str) -> Row:
+    _recomputes.inc()
+    data = await compute_last7d(user_id)
+    await db.upsert_user_analytics_cache(data)
+    # Re-fetch from DB to get a consistent row object
+    row = await db.get_user_analytics_cache(user_id)
+    _memory.set(user_id, row)
+    return row
+
+async def refresh(user_id: str) -> Row:
+    """Recompute now, joining a refresh already running for this user if there is one."""
+    task = _inflight.get(user_id)
+    if task is None:
+        task = asyncio.create_task(_recompute(user_id))
+        _inflight[user_id] = task
+        task.add_done_callback(lambda t: _inflight.pop(user_id, None) if _inflight.get(user_id) is t else None)
+    else:
+        _coalesced.inc()
+    # shield: a caller that disconnects must not cancel the compute other callers wait on
+    return await asyncio.shield(task)
+
+def refresh_in_background(user_id: str):
+    if user_id in _inflight:
+        _coalesced.inc()
+        return
+    task = asyncio.create_task(refresh(user_id))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    task.add_done_callback(_log_failure)
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[WARN] Background analytics refresh failed: {task.exception()}")
+
+def invalidate(user_id: str):
+    _memory.pop(user_id)
+
+async def get(user_id: str) -> Row:
+    row = _memory.get(user_id)
+    if row is not None:
+        _hits_memory.inc()
+    else:
+        row = await db.get_user_analytics_cache(user_id)
+        if row is None:
+            # Nothing to serve yet: compute inline (still single-flight)
+            return await refresh(user_id)
+        _hits_db.inc()
+        _memory.set(user_id, row)
+    if is_expired(row):
+        _stale_served.inc()
+        refresh_in_background(user_id)
+    return row
@@ -0,0 +1,30 @@
+"""
+Backfill weakness_events for results stored before the table existed.
+
+    cd backend && python -m app.backfill --batch 5000
+
+Migration v8 runs the same backfill once at startup; this command re-runs it by hand
+(e.g. after restoring old rows). Results that already have events are skipped, so it is
+safe to run repeatedly and next to live traffic.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+
+from . import db
+
+async def _run(batch_size: int):
+    await db.init_db()
+    try:
+        await db.backfill_weakness_events(batch_size=batch_size)
+    finally:
+        await db.engine.dispose()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--batch", type=int, default=5000, help="results read per transaction")
+    args = ap.parse_args()
+    asyncio.run(_run(max(1, args.batch)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Tuple
+
+from fastapi import HTTPException
+
+from . import metrics
+
+
+class MicroBatcher:
+    """
+    Dynamic batching queue. Callers `submit()` single items; a collector task waits for
+    a free slot, then gathers items for up to `max_wait_ms` (or until `max_batch_size`)
+    and hands them to `process_batch` in one call. Each caller's future gets the result
+    at its own index.
+
+    While all `concurrency` slots are busy, new items keep queueing, so batches grow
+    under load and stay at size 1 when the system is idle.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        concurrency: int = 1,
+        max_queue: int = 64,
+    ):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(1, max_queue)
+        self._queue: asyncio.Queue[Tuple[Any, asyncio.Future, float]] | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._collector: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()  # keep references to in-flight batches
+
+        self._h_size = metrics.histogram(f"{name}_batch_size", metrics.BATCH_SIZE_BUCKETS)
+        self._h_wait = metrics.histogram(f"{name}_queue_wait_ms", metrics.WAIT_MS_BUCKETS)
+        self._c_rejected = metrics.counter(f"{name}_rejected")
+
+    def _ensure_started(self):
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._collector = asyncio.create_task(self._collect(), name=f"{self.name}-batcher")
+
+    async def submit(self, item: Any) -> Any:
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, fut, time.perf_counter()))
+        except asyncio.QueueFull:
+            self._c_rejected.inc()
+            raise HTTPException(status_code=503, detail=f"{self.name} queue is full, retry later")
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        try:
+            # Drop callers that went away while queued
+            batch = [b for b in batch if not b[1].done()]
+            if not batch:
+                return
+            now = time.perf_counter()
+            self._h_size.observe(len(batch))
+            for _, _, enq in batch:
+                self._h_wait.observe((now - enq) * 1000.0)
+            try:
+                results = await self.process_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: process_batch returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            for (_, fut, _), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+        finally:
+            self._slots.release()
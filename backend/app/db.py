@@ -1,11 +1,13 @@
 from __future__ import annotations
-import os, json, datetime as dt, hashlib
+import os, json, datetime as dt, hashlib, base64, heapq, asyncio, socket, time
 from pathlib import Path
 from typing import Any, Dict, List
-from collections import Counter
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy import text, bindparam, Row
 from sqlalchemy.dialects.postgresql import JSONB
+from .deps import get_settings
+from .migrations import MIGRATIONS
+from . import phone_codec, rollups
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///app/data/app.db")
 
@@ -33,7 +35,7 @@ CREATE TABLE IF NOT EXISTS phoneme_results (
   user_id TEXT NOT NULL,
   audio_sha256 TEXT NOT NULL,
   ref_text TEXT,
-  pred_phones TEXT NOT NULL,         -- JSON string
+  pred_phones TEXT,                  -- JSON string (NULL when alignment is set)
   ref_phones TEXT,                   -- JSON string
   ops_raw TEXT,                      -- JSON string
   per_strict REAL,
@@ -41,8 +43,12 @@ CREATE TABLE IF NOT EXISTS phoneme_results (
   wer REAL,
   word_analysis TEXT,              -- JSON string
   weakness_categories TEXT,        -- JSON string
+  model_rev TEXT,                  -- phoneme model fingerprint
+  rules_rev TEXT,                  -- pronunciation guardrails fingerprint
+  alignment BLOB,                  -- phone_codec encoding of phones, ops and word_analysis
   created_at TIMESTAMP NOT NULL
 );
+CREATE INDEX IF NOT EXISTS idx_phoneme_results_audio ON phoneme_results (audio_sha256);
 CREATE TABLE IF NOT EXISTS grammar_results (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id TEXT NOT NULL,
@@ -54,6 +60,9 @@ CREATE TABLE IF NOT EXISTS grammar_results (
   guardrails TEXT,                   -- JSON string
   latency_ms INTEGER,
   weakness_categories TEXT,        -- JSON string
+  weakness_status TEXT,            -- pending | processing | done | skipped (LLM enrichment)
+  weakness_claimed_at TIMESTAMP,
+  weakness_attempts INTEGER NOT NULL DEFAULT 0, -- LLM replies that left this row out
   created_at TIMESTAMP NOT NULL
 );
 CREATE TABLE IF NOT EXISTS user_analytics_cache (
@@ -72,10 +81,87 @@ CREATE TABLE IF NOT EXISTS user_analytics_cache (
   top_pronunciation_weaknesses TEXT, -- JSON
   badge                VARCHAR(64),
   headline_msg         TEXT,
+  insight_key          TEXT,      -- sha256 of the inputs the headline was generated from
+  insight_at           TIMESTAMP, -- last LLM insight call
   updated_at           TIMESTAMP NOT NULL,
   expires_at           TIMESTAMP NOT NULL
 );
 CREATE INDEX IF NOT EXISTS idx_user_analytics_cache_expires ON user_analytics_cache (expires_at);
+CREATE TABLE IF NOT EXISTS gec_cache (
+  cache_key            TEXT PRIMARY KEY,   -- sha256 of (model, guardrails, sle_mode, max_new_tokens, text)
+  text_sha256          TEXT NOT NULL,      -- sha256 of the whitespace-normalized input
+  model_id             TEXT NOT NULL,
+  guardrails_version   TEXT NOT NULL,
+  sle_mode             BOOLEAN NOT NULL,
+  max_new_tokens       INTEGER NOT NULL,
+  raw_corrected        TEXT NOT NULL,
+  final_text           TEXT NOT NULL,
+  edits                TEXT,               -- JSON
+  guardrails           TEXT,               -- JSON
+  weakness_categories  TEXT,               -- JSON
+  created_at           TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_daily_stats (
+  user_id              TEXT NOT NULL,
+  day                  TEXT NOT NULL,      -- UTC date, YYYY-MM-DD
+  phoneme_attempts     INTEGER NOT NULL DEFAULT 0,
+  per_sle_count        INTEGER NOT NULL DEFAULT 0,
+  per_sle_sum          REAL NOT NULL DEFAULT 0,
+  per_sketch           TEXT,               -- JSON DDSketch of per_sle
+  sub_pairs            TEXT,               -- JSON {"g->p": count}
+  pron_weaknesses      TEXT,               -- JSON {category: count}
+  grammar_attempts     INTEGER NOT NULL DEFAULT 0,
+  edits100_sum         REAL NOT NULL DEFAULT 0,
+  latency_count        INTEGER NOT NULL DEFAULT 0,
+  latency_sum          REAL NOT NULL DEFAULT 0,
+  latency_sketch       TEXT,               -- JSON DDSketch of latency_ms
+  grammar_weaknesses   TEXT,               -- JSON {category: count}
+  updated_at           TIMESTAMP NOT NULL,
+  PRIMARY KEY (user_id, day)
+);
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+  job_name             TEXT PRIMARY KEY,
+  run_key              TEXT NOT NULL,      -- one run, e.g. the date it was scheduled for
+  last_key             TEXT,               -- last item fully processed (jobs iterate in key order)
+  processed            INTEGER NOT NULL DEFAULT 0,
+  started_at           TIMESTAMP NOT NULL,
+  updated_at           TIMESTAMP NOT NULL,
+  finished_at          TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS scheduler_leases (
+  name                 TEXT PRIMARY KEY,
+  holder               TEXT NOT NULL,      -- host:pid:nonce of the process holding the lease
+  expires_at           TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_runs (
+  id                   INTEGER PRIMARY KEY AUTOINCREMENT,
+  job_name             TEXT NOT NULL,
+  scheduled_for        TEXT NOT NULL,      -- schedule occurrence, each runs at most once
+  holder               TEXT NOT NULL,
+  status               TEXT NOT NULL,      -- running | ok | failed | cancelled
+  error                TEXT,
+  started_at           TIMESTAMP NOT NULL,
+  finished_at          TIMESTAMP,
+  duration_ms          INTEGER,
+  lease_expires_at     TIMESTAMP,          -- renewed by the holder while running, a stale run can be taken over
+  UNIQUE (job_name, scheduled_for)
+);
+CREATE TABLE IF NOT EXISTS analytics_dirty (
+  user_id              TEXT PRIMARY KEY,
+  first_dirty_at       TIMESTAMP NOT NULL, -- oldest write not yet reflected in user_analytics_cache
+  last_write_at        TIMESTAMP NOT NULL,
+  attempts             INTEGER NOT NULL DEFAULT 0, -- failed refreshes in a row
+  next_attempt_at      TIMESTAMP           -- backoff after a failed refresh
+);
+CREATE TABLE IF NOT EXISTS weakness_events (
+  id                   INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id              TEXT NOT NULL,
+  created_at           TIMESTAMP NOT NULL, -- copied from the result row
+  source               TEXT NOT NULL,      -- grammar | pronunciation (categories) | phone (alignment ops)
+  result_id            INTEGER NOT NULL,   -- grammar_results.id or phoneme_results.id
+  kind                 TEXT NOT NULL,      -- category | S | I | D
+  label                TEXT NOT NULL       -- category name, "g -> p" pair, or phone
+);
 """
 
 DDL_PG = """
@@ -84,7 +170,7 @@ CREATE TABLE IF NOT EXISTS phoneme_results (
   user_id TEXT NOT NULL,
   audio_sha256 TEXT NOT NULL,
   ref_text TEXT,
-  pred_phones JSONB NOT NULL,
+  pred_phones JSONB,
   ref_phones JSONB,
   ops_raw JSONB,
   per_strict DOUBLE PRECISION,
@@ -92,8 +178,12 @@ CREATE TABLE IF NOT EXISTS phoneme_results (
   wer DOUBLE PRECISION,
   word_analysis JSONB,
   weakness_categories JSONB,
+  model_rev TEXT,
+  rules_rev TEXT,
+  alignment BYTEA,
   created_at TIMESTAMPTZ NOT NULL
 );
+CREATE INDEX IF NOT EXISTS idx_phoneme_results_audio ON phoneme_results (audio_sha256);
 CREATE TABLE IF NOT EXISTS grammar_results (
   id BIGSERIAL PRIMARY KEY,
   user_id TEXT NOT NULL,
@@ -105,6 +195,9 @@ CREATE TABLE IF NOT EXISTS grammar_results (
   guardrails JSONB,
   latency_ms INTEGER,
   weakness_categories JSONB,
+  weakness_status TEXT,
+  weakness_claimed_at TIMESTAMPTZ,
+  weakness_attempts INTEGER NOT NULL DEFAULT 0,
   created_at TIMESTAMPTZ NOT NULL
 );
 CREATE TABLE IF NOT EXISTS user_analytics_cache (
@@ -123,10 +216,87 @@ CREATE TABLE IF NOT EXISTS user_analytics_cache (
   top_pronunciation_weaknesses JSONB,
   badge                VARCHAR(64),
   headline_msg         TEXT,
+  insight_key          TEXT,
+  insight_at           TIMESTAMPTZ,
   updated_at           TIMESTAMPTZ NOT NULL,
   expires_at           TIMESTAMPTZ NOT NULL
 );
 CREATE INDEX IF NOT EXISTS idx_user_analytics_cache_expires ON user_analytics_cache (expires_at);
+CREATE TABLE IF NOT EXISTS gec_cache (
+  cache_key            TEXT PRIMARY KEY,
+  text_sha256          TEXT NOT NULL,
+  model_id             TEXT NOT NULL,
+  guardrails_version   TEXT NOT NULL,
+  sle_mode             BOOLEAN NOT NULL,
+  max_new_tokens       INTEGER NOT NULL,
+  raw_corrected        TEXT NOT NULL,
+  final_text           TEXT NOT NULL,
+  edits                JSONB,
+  guardrails           JSONB,
+  weakness_categories  JSONB,
+  created_at           TIMESTAMPTZ NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_daily_stats (
+  user_id              TEXT NOT NULL,
+  day                  DATE NOT NULL,
+  phoneme_attempts     INTEGER NOT NULL DEFAULT 0,
+  per_sle_count        INTEGER NOT NULL DEFAULT 0,
+  per_sle_sum          DOUBLE PRECISION NOT NULL DEFAULT 0,
+  per_sketch           JSONB,
+  sub_pairs            JSONB,
+  pron_weaknesses      JSONB,
+  grammar_attempts     INTEGER NOT NULL DEFAULT 0,
+  edits100_sum         DOUBLE PRECISION NOT NULL DEFAULT 0,
+  latency_count        INTEGER NOT NULL DEFAULT 0,
+  latency_sum          DOUBLE PRECISION NOT NULL DEFAULT 0,
+  latency_sketch       JSONB,
+  grammar_weaknesses   JSONB,
+  updated_at           TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (user_id, day)
+);
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+  job_name             TEXT PRIMARY KEY,
+  run_key              TEXT NOT NULL,
+  last_key             TEXT,
+  processed            INTEGER NOT NULL DEFAULT 0,
+  started_at           TIMESTAMPTZ NOT NULL,
+  updated_at           TIMESTAMPTZ NOT NULL,
+  finished_at          TIMESTAMPTZ
+);
+CREATE TABLE IF NOT EXISTS scheduler_leases (
+  name                 TEXT PRIMARY KEY,
+  holder               TEXT NOT NULL,
+  expires_at           TIMESTAMPTZ NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_runs (
+  id                   BIGSERIAL PRIMARY KEY,
+  job_name             TEXT NOT NULL,
+  scheduled_for        TEXT NOT NULL,
+  holder               TEXT NOT NULL,
+  status               TEXT NOT NULL,
+  error                TEXT,
+  started_at           TIMESTAMPTZ NOT NULL,
+  finished_at          TIMESTAMPTZ,
+  duration_ms          INTEGER,
+  lease_expires_at     TIMESTAMPTZ,
+  UNIQUE (job_name, scheduled_for)
+);
+CREATE TABLE IF NOT EXISTS analytics_dirty (
+  user_id              TEXT PRIMARY KEY,
+  first_dirty_at       TIMESTAMPTZ NOT NULL,
+  last_write_at        TIMESTAMPTZ NOT NULL,
+  attempts             INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at      TIMESTAMPTZ
+);
+CREATE TABLE IF NOT EXISTS weakness_events (
+  id                   BIGSERIAL PRIMARY KEY,
+  user_id              TEXT NOT NULL,
+  created_at           TIMESTAMPTZ NOT NULL,
+  source               TEXT NOT NULL,
+  result_id            BIGINT NOT NULL,
+  kind                 TEXT NOT NULL,
+  label                TEXT NOT NULL
+);
 """
 
 def _is_pg() -> bool:
@@ -146,15 +316,45 @@ async def init_db():
             "ALTER TABLE phoneme_results ADD COLUMN wer REAL",
             "ALTER TABLE phoneme_results ADD COLUMN word_analysis TEXT",
             "ALTER TABLE phoneme_results ADD COLUMN weakness_categories TEXT",
+            "ALTER TABLE phoneme_results ADD COLUMN model_rev TEXT",
+            "ALTER TABLE phoneme_results ADD COLUMN rules_rev TEXT",
+            "ALTER TABLE phoneme_results ADD COLUMN alignment BLOB",
             # grammar_results
             "ALTER TABLE grammar_results ADD COLUMN weakness_categories TEXT",
+            "ALTER TABLE grammar_results ADD COLUMN weakness_status TEXT",
+            "ALTER TABLE grammar_results ADD COLUMN weakness_claimed_at TIMESTAMP",
+            "ALTER TABLE grammar_results ADD COLUMN weakness_attempts INTEGER NOT NULL DEFAULT 0",
+            # user_daily_stats
+            "ALTER TABLE user_daily_stats ADD COLUMN per_sketch TEXT",
+            "ALTER TABLE user_daily_stats ADD COLUMN latency_sketch TEXT",
+            # job_runs
+            "ALTER TABLE job_runs ADD COLUMN lease_expires_at TIMESTAMP",
+            # analytics_dirty
+            "ALTER TABLE analytics_dirty ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE analytics_dirty ADD COLUMN next_attempt_at TIMESTAMP",
+            # user_analytics_cache
+            "ALTER TABLE user_analytics_cache ADD COLUMN insight_key TEXT",
+            "ALTER TABLE user_analytics_cache ADD COLUMN insight_at TIMESTAMP",
         ]
         if _is_pg():
             alter_commands = [
                 "ALTER TABLE phoneme_results ADD COLUMN wer DOUBLE PRECISION",
                 "ALTER TABLE phoneme_results ADD COLUMN word_analysis JSONB",
                 "ALTER TABLE phoneme_results ADD COLUMN weakness_categories JSONB",
+                "ALTER TABLE phoneme_results ADD COLUMN model_rev TEXT",
+                "ALTER TABLE phoneme_results ADD COLUMN rules_rev TEXT",
+                "ALTER TABLE phoneme_results ADD COLUMN alignment BYTEA",
                 "ALTER TABLE grammar_results ADD COLUMN weakness_categories JSONB",
+                "ALTER TABLE grammar_results ADD COLUMN weakness_status TEXT",
+                "ALTER TABLE grammar_results ADD COLUMN weakness_claimed_at TIMESTAMPTZ",
+                "ALTER TABLE grammar_results ADD COLUMN weakness_attempts INTEGER NOT NULL DEFAULT 0",
+                "ALTER TABLE user_daily_stats ADD COLUMN per_sketch JSONB",
+                "ALTER TABLE user_daily_stats ADD COLUMN latency_sketch JSONB",
+                "ALTER TABLE job_runs ADD COLUMN lease_expires_at TIMESTAMPTZ",
+                "ALTER TABLE analytics_dirty ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+                "ALTER TABLE analytics_dirty ADD COLUMN next_attempt_at TIMESTAMPTZ",
+                "ALTER TABLE user_analytics_cache ADD COLUMN insight_key TEXT",
+                "ALTER TABLE user_analytics_cache ADD COLUMN insight_at TIMESTAMPTZ",
             ]
 
         for cmd in alter_commands:
@@ -174,71 +374,260 @@ async def init_db():
             if "does not exist" not in str(e) and "no such column" not in str(e):
                  print(f"[DB-MIGRATE-WARN] Rename command failed: {rename_cmd} | {e}")
 
-async def save_phoneme_result(user_id: str, audio_bytes: bytes, result: Dict[str, Any]):
-    audio_sha = hashlib.sha256(audio_bytes).hexdigest()
+    # Indexes (and anything else versioned) come after the ALTERs they may depend on
+    await apply_migrations()
+
+async def apply_migrations():
+    """
+    Apply pending entries of migrations.MIGRATIONS in version order. A version is recorded
+    in schema_migrations only after its schema step ran; a data hook (_MIGRATION_HOOKS)
+    then runs in one process at a time, under a lease, and sets hook_done_at when it
+    finishes, so a hook that crashed is picked up again on the next start.
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL, hook_done_at TIMESTAMP)"
+        ))
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("ALTER TABLE schema_migrations ADD COLUMN hook_done_at TIMESTAMP"))
+            # versions recorded before the column existed had their hooks run at the time
+            await conn.execute(text("UPDATE schema_migrations SET hook_done_at = applied_at"))
+    except Exception as e:
+        if "already exists" not in str(e) and "duplicate column" not in str(e):
+            print(f"[DB-MIGRATE-WARN] Could not add schema_migrations.hook_done_at: {e}")
+    async with engine.begin() as conn:
+        rows = (await conn.execute(text("SELECT version, hook_done_at FROM schema_migrations"))).fetchall()
+    applied = {r.version: r.hook_done_at is not None for r in rows}
+
+    for version, name, sqlite_stmts, pg_stmts in MIGRATIONS:
+        hook = _MIGRATION_HOOKS.get(version)
+        if version in applied and (hook is None or applied[version]):
+            continue
+        t0 = dt.datetime.utcnow()
+        if version not in applied:
+            if not await _apply_schema_step(version, sqlite_stmts, pg_stmts):
+                print(f"[DB-MIGRATE] v{version} ({name}) is being applied by another process")
+                continue
+            await _record_migration(version, name)
+        if hook is not None and not await _run_exclusive(f"migration:v{version}", lambda: _run_hook(version, hook)):
+            print(f"[DB-MIGRATE] v{version} ({name}) data step is running in another process")
+            continue
+        print(f"[DB-MIGRATE] Applied v{version} ({name}) in {(dt.datetime.utcnow() - t0).total_seconds():.1f}s")
+
+async def _apply_schema_step(version: int, sqlite_stmts: List[str], pg_stmts: List[str]) -> bool:
+    """Run a version's (idempotent) DDL; False if its SQLite rebuild is running elsewhere."""
+    if _is_pg():
+        # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for stmt in pg_stmts:
+                await conn.execute(text(stmt))
+        return True
+    async with engine.begin() as conn:
+        for stmt in sqlite_stmts:
+            await conn.execute(text(stmt))
+    step = _SQLITE_SCHEMA_STEPS.get(version)
+    return step is None or await _run_exclusive(f"migration:v{version}:schema", step)
+
+async def _run_hook(version: int, hook):
+    async with engine.begin() as conn:
+        done = (await conn.execute(text("SELECT hook_done_at FROM schema_migrations WHERE version = :version"),
+                                   {"version": version})).scalar()
+    if done is not None:
+        return      # finished by another process while we waited for the lease
+    await hook()
+    async with engine.begin() as conn:
+        await conn.execute(text("UPDATE schema_migrations SET hook_done_at = :now WHERE version = :version"),
+                           {"version": version, "now": dt.datetime.utcnow()})
+
+_MIGRATION_HOLDER = f"{socket.gethostname()}:{os.getpid()}"
+
+async def _run_exclusive(lease_name: str, fn) -> bool:
+    """Run `fn` holding a scheduler_leases lease, renewed while it runs; False if another process holds it."""
+    ttl = get_settings().SCHEDULER_LEASE_SECONDS
+    if not await acquire_lease(lease_name, _MIGRATION_HOLDER, ttl):
+        return False
+
+    async def _renew():
+        while True:
+            await asyncio.sleep(max(1.0, ttl / 3))
+            try:
+                await acquire_lease(lease_name, _MIGRATION_HOLDER, ttl)
+            except Exception as e:
+                print(f"[WARN] Could not renew lease {lease_name}: {e}")
+
+    renewer = asyncio.create_task(_renew())
+    try:
+        await fn()
+    finally:
+        renewer.cancel()
+        await release_lease(lease_name, _MIGRATION_HOLDER)
+    return True
+
+async def _record_migration(version: int, name: str) -> bool:
+    """Insert the schema_migrations row; False if another process already recorded it."""
+    async with engine.begin() as conn:
+        res = await conn.execute(
+            text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at) ON CONFLICT (version) DO NOTHING"),
+            {"version": version, "name": name, "applied_at": dt.datetime.utcnow()},
+        )
+        return (res.rowcount or 0) == 1
+
+# Packed rows store pred_phones as NULL, which v9 allows; until then rows keep the JSON
+# columns (alignment NULL) and v9's compaction packs them later.
+_pred_phones_nullable = False
+_nullable_checked_at: float | None = None
+
+async def _can_pack_alignment() -> bool:
+    global _pred_phones_nullable, _nullable_checked_at
+    if _pred_phones_nullable or (_nullable_checked_at is not None and time.monotonic() - _nullable_checked_at < 30):
+        return _pred_phones_nullable
+    _nullable_checked_at = time.monotonic()
+    async with engine.connect() as conn:
+        if _is_pg():
+            nullable = (await conn.execute(text(
+                "SELECT is_nullable FROM information_schema.columns WHERE table_name = 'phoneme_results' AND column_name = 'pred_phones'"
+            ))).scalar() == "YES"
+        else:
+            table_sql = (await conn.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'phoneme_results'"
+            ))).scalar() or ""
+            nullable = "pred_phones TEXT NOT NULL" not in table_sql
+    _pred_phones_nullable = nullable
+    return nullable
+
+def _alignment_columns(pred_phones, ref_phones, ops, word_analysis, pack: bool = True) -> Dict[str, Any]:
+    """phoneme_results column values: the packed alignment, or the JSON columns if it can't (or may not) be packed."""
+    blob = phone_codec.encode(pred_phones, ref_phones, ops, word_analysis) if pack else None
+    if blob is not None:
+        return {"pred_phones": None, "ref_phones": None, "ops_raw": None, "word_analysis": None, "alignment": blob}
+    return {"pred_phones": pred_phones, "ref_phones": ref_phones, "ops_raw": ops, "word_analysis": word_analysis, "alignment": None}
+
+def phoneme_alignment(row) -> Dict[str, Any]:
+    """pred_phones, ref_phones, ops_raw and word_analysis of a phoneme_results row, from either storage."""
+    if getattr(row, "alignment", None) is not None:
+        pred, ref, ops, words = phone_codec.decode(row.alignment)
+        return {"pred_phones": pred, "ref_phones": ref, "ops_raw": ops, "word_analysis": words}
+    return {
+        "pred_phones": parse_json(getattr(row, "pred_phones", None)),
+        "ref_phones": parse_json(getattr(row, "ref_phones", None)),
+        "ops_raw": parse_json(getattr(row, "ops_raw", None)),
+        "word_analysis": parse_json(getattr(row, "word_analysis", None)),
+    }
+
+async def save_phoneme_result(user_id: str, audio_bytes: bytes, result: Dict[str, Any],
+                              audio_sha256: str | None = None, model_rev: str | None = None, rules_rev: str | None = None):
+    audio_sha = audio_sha256 or hashlib.sha256(audio_bytes).hexdigest()
     now = dt.datetime.utcnow()
 
     details = result.get("details", {})
+    columns = _alignment_columns(
+        details.get("pred_phones", result.get("pred_phones", [])),
+        details.get("ref_phones"), details.get("ops_after_rules"), result.get("word_analysis"),
+        pack=await _can_pack_alignment(),
+    )
     if _is_pg():
         sql = text("""
           INSERT INTO phoneme_results
-          (user_id, audio_sha256, ref_text, pred_phones, ref_phones, ops_raw, per_strict, per_sle, wer, word_analysis, weakness_categories, created_at)
-          VALUES (:user_id, :audio_sha256, :ref_text, :pred_phones, :ref_phones, :ops_raw, :per_strict, :per_sle, :wer, :word_analysis, :weakness_categories, :created_at)
+          (user_id, audio_sha256, ref_text, pred_phones, ref_phones, ops_raw, per_strict, per_sle, wer, word_analysis, weakness_categories, model_rev, rules_rev, alignment, created_at)
+          VALUES (:user_id, :audio_sha256, :ref_text, :pred_phones, :ref_phones, :ops_raw, :per_strict, :per_sle, :wer, :word_analysis, :weakness_categories, :model_rev, :rules_rev, :alignment, :created_at)
+          RETURNING id
         """).bindparams(
-            bindparam("pred_phones", type_=JSONB),
-            bindparam("ref_phones", type_=JSONB),
-            bindparam("ops_raw", type_=JSONB),
-            bindparam("word_analysis", type_=JSONB),
+            bindparam("pred_phones", type_=JSONB(none_as_null=True)),
+            bindparam("ref_phones", type_=JSONB(none_as_null=True)),
+            bindparam("ops_raw", type_=JSONB(none_as_null=True)),
+            bindparam("word_analysis", type_=JSONB(none_as_null=True)),
             bindparam("weakness_categories", type_=JSONB),
         )
         payload = dict(
             user_id=user_id,
             audio_sha256=audio_sha,
             ref_text=details.get("ref_text"),
-            pred_phones=details.get("pred_phones", []),
-            ref_phones=details.get("ref_phones"),
-            ops_raw=details.get("ops_after_rules"),
+            **columns,
             per_strict=details.get("per_strict"),
             per_sle=details.get("per_sle"),
             wer=result.get("wer"), # This can be None
-            word_analysis=result.get("word_analysis"),
             weakness_categories=result.get("weakness_categories"),
+            model_rev=model_rev,
+            rules_rev=rules_rev,
             created_at=now,
         )
     else:
         sql = text("""
           INSERT INTO phoneme_results
-          (user_id, audio_sha256, ref_text, pred_phones, ref_phones, ops_raw, per_strict, per_sle, wer, word_analysis, weakness_categories, created_at)
-          VALUES (:user_id, :audio_sha256, :ref_text, :pred_phones, :ref_phones, :ops_raw, :per_strict, :per_sle, :wer, :word_analysis, :weakness_categories, :created_at)
+          (user_id, audio_sha256, ref_text, pred_phones, ref_phones, ops_raw, per_strict, per_sle, wer, word_analysis, weakness_categories, model_rev, rules_rev, alignment, created_at)
+          VALUES (:user_id, :audio_sha256, :ref_text, :pred_phones, :ref_phones, :ops_raw, :per_strict, :per_sle, :wer, :word_analysis, :weakness_categories, :model_rev, :rules_rev, :alignment, :created_at)
+          RETURNING id
         """)
+        if columns["alignment"] is None:
+            columns.update({k: json.dumps(v) for k, v in columns.items() if k != "alignment"})
         payload = dict(
             user_id=user_id,
             audio_sha256=audio_sha,
             ref_text=details.get("ref_text"),
-            pred_phones=json.dumps(details.get("pred_phones", [])),
-            ref_phones=json.dumps(details.get("ref_phones")),
-            ops_raw=json.dumps(details.get("ops_after_rules")),
+            **columns,
             per_strict=details.get("per_strict"),
             per_sle=details.get("per_sle"),
             wer=result.get("wer"), # This can be None
-            word_analysis=json.dumps(result.get("word_analysis")),
             weakness_categories=json.dumps(result.get("weakness_categories")),
+            model_rev=model_rev,
+            rules_rev=rules_rev,
             created_at=now,
         )
+    delta = rollups.phoneme_delta(details.get("per_sle"), details.get("ops_after_rules"), result.get("weakness_categories"))
     async with Session() as s:
-        await s.execute(sql, payload)
+        result_id = (await s.execute(sql, payload)).scalar_one()
+        await _insert_weakness_events(s, weakness_event_rows(
+            user_id, now, "pronunciation", result_id, categories=result.get("weakness_categories"), ops=details.get("ops_after_rules")))
+        await _bump_daily_stats(s, user_id, now.date(), delta)
+        await _mark_analytics_dirty(s, user_id, now)
         await s.commit()
 
+async def find_phoneme_results_by_audio(audio_sha256: str, model_rev: str, limit: int = 20) -> List[Row]:
+    """Most recent stored scorings of the same audio under the same model revision."""
+    sql = text("""
+        SELECT ref_text, pred_phones, ref_phones, ops_raw, per_strict, per_sle, wer, word_analysis, weakness_categories, rules_rev, alignment
+        FROM phoneme_results
+        WHERE audio_sha256 = :audio_sha256 AND model_rev = :model_rev
+        ORDER BY created_at DESC
+        LIMIT :limit
+    """)
+    async with Session() as s:
+        res = await s.execute(sql, {"audio_sha256": audio_sha256, "model_rev": model_rev, "limit": limit})
+        return res.fetchall()
+
+def _weakness_status(input_text: str, result: Dict[str, Any]) -> str:
+    """
+    Rows with a real correction but no categories yet are queued for LLM enrichment, as long
+    as the enrichment worker runs at all; otherwise they would sit in the queue forever.
+    """
+    gec = result.get("gec") or {}
+    if result.get("weakness_categories") is not None:
+        return "done"
+    if (get_settings().enrichment_active and gec.get("final_text")
+            and gec["final_text"] != (result.get("input") or input_text)):
+        return "pending"
+    return "skipped"
+
+def _model_latency_ms(result: Dict[str, Any]) -> int | None:
+    # a cache hit's latency is the lookup, not a model run; keep it out of latency_ms and the rollups
+    m = result.get("metrics") or {}
+    return None if m.get("cache") else m.get("latency_ms")
+
 async def save_grammar_result(user_id: str, input_text: str, result: Dict[str, Any]):
     text_sha = hashlib.sha256(input_text.encode("utf-8")).hexdigest()
     now = dt.datetime.utcnow()
     gec = result.get("gec") or {}
+    weakness_status = _weakness_status(input_text, result)
 
     if _is_pg():
         sql = text("""
           INSERT INTO grammar_results
-          (user_id, text_sha256, input_text, raw_corrected, final_text, edits, guardrails, latency_ms, weakness_categories, created_at)
-          VALUES (:user_id, :text_sha256, :input_text, :raw_corrected, :final_text, :edits, :guardrails, :latency_ms, :weakness_categories, :created_at)
+          (user_id, text_sha256, input_text, raw_corrected, final_text, edits, guardrails, latency_ms, weakness_categories, weakness_status, created_at)
+          VALUES (:user_id, :text_sha256, :input_text, :raw_corrected, :final_text, :edits, :guardrails, :latency_ms, :weakness_categories, :weakness_status, :created_at)
+          RETURNING id
         """).bindparams(
             bindparam("edits", type_=JSONB),
             bindparam("guardrails", type_=JSONB),
@@ -252,15 +641,17 @@ async def save_grammar_result(user_id: str, input_text: str, result: Dict[str, A
             final_text=gec.get("final_text"),
             edits=gec.get("edits"),                      # <— Python list
             guardrails=result.get("guardrails"),         # <— Python list
-            latency_ms=(result.get("metrics") or {}).get("latency_ms"),
+            latency_ms=_model_latency_ms(result),
             weakness_categories=result.get("weakness_categories"),
+            weakness_status=weakness_status,
             created_at=now,
         )
     else:
         sql = text("""
           INSERT INTO grammar_results
-          (user_id, text_sha256, input_text, raw_corrected, final_text, edits, guardrails, latency_ms, weakness_categories, created_at)
-          VALUES (:user_id, :text_sha256, :input_text, :raw_corrected, :final_text, :edits, :guardrails, :latency_ms, :weakness_categories, :created_at)
+          (user_id, text_sha256, input_text, raw_corrected, final_text, edits, guardrails, latency_ms, weakness_categories, weakness_status, created_at)
+          VALUES (:user_id, :text_sha256, :input_text, :raw_corrected, :final_text, :edits, :guardrails, :latency_ms, :weakness_categories, :weakness_status, :created_at)
+          RETURNING id
         """)
         payload = dict(
             user_id=user_id,
@@ -270,80 +661,662 @@ async def save_grammar_result(user_id: str, input_text: str, result: Dict[str, A
             final_text=gec.get("final_text"),
             edits=json.dumps(gec.get("edits")),          # <— TEXT JSON for SQLite
             guardrails=json.dumps(result.get("guardrails")),
-            latency_ms=(result.get("metrics") or {}).get("latency_ms"),
+            latency_ms=_model_latency_ms(result),
             weakness_categories=json.dumps(result.get("weakness_categories")),
+            weakness_status=weakness_status,
             created_at=now,
         )
+    delta = rollups.grammar_delta(gec.get("final_text"), gec.get("edits"), payload["latency_ms"], result.get("weakness_categories"))
     async with Session() as s:
-        await s.execute(sql, payload)
+        result_id = (await s.execute(sql, payload)).scalar_one()
+        await _insert_weakness_events(s, weakness_event_rows(user_id, now, "grammar", result_id, categories=result.get("weakness_categories")))
+        await _bump_daily_stats(s, user_id, now.date(), delta)
+        await _mark_analytics_dirty(s, user_id, now)
         await s.commit()
 
-# backend/app/db.py (append at bottom)
-import json
-
-async def fetch_user_results(user_id: str, limit: int = 50):
-    # Grammar
-    sql_grammar = text("""
-      SELECT input_text, raw_corrected, final_text, edits, guardrails, latency_ms, created_at
-      FROM grammar_results
-      WHERE user_id = :user_id
-      ORDER BY created_at DESC
-      LIMIT :limit
+# --- Weakness events ---
+# One row per weakness (category, or phone substitution/insertion/deletion) per result,
+# written with the result, so summaries are indexed GROUP BYs instead of JSON scans.
+
+def weakness_event_rows(user_id: str, created_at, source: str, result_id: int,
+                        categories: List[str] | None = None, ops: List[Dict[str, Any]] | None = None) -> List[Dict[str, Any]]:
+    rows = [
+        {"user_id": user_id, "created_at": created_at, "source": source, "result_id": result_id, "kind": "category", "label": c}
+        for c in (categories or []) if c
+    ]
+    for op in ops or []:
+        kind = op.get("op")
+        if kind == "S" and op.get("g") and op.get("p"):
+            label = f"{op['g']} -> {op['p']}"
+        elif kind == "D" and op.get("g") and op["g"] != "'":      # apostrophes are not sounds
+            label = op["g"]
+        elif kind == "I" and op.get("p") and op["p"] != "'":
+            label = op["p"]
+        else:
+            continue
+        rows.append({"user_id": user_id, "created_at": created_at, "source": "phone", "result_id": result_id, "kind": kind, "label": label})
+    return rows
+
+async def _insert_weakness_events(s, rows: List[Dict[str, Any]]):
+    if rows:
+        await s.execute(text("""
+            INSERT INTO weakness_events (user_id, created_at, source, result_id, kind, label)
+            VALUES (:user_id, :created_at, :source, :result_id, :kind, :label)
+        """), rows)
+
+async def backfill_weakness_events(batch_size: int = 5000) -> tuple[int, int]:
+    """
+    Write events for results stored before weakness_events existed. Results that already
+    have events are skipped, so this is safe to re-run and to run next to live traffic.
+    """
+    specs = [
+        ("grammar_results", "grammar", "NULL AS ops_raw, NULL AS alignment", ("grammar",)),
+        ("phoneme_results", "pronunciation", "ops_raw, alignment", ("pronunciation", "phone")),
+    ]
+    counts = []
+    for table, source, ops_col, sources in specs:
+        async with Session() as s:
+            upto = (await s.execute(text(f"SELECT MAX(id) FROM {table}"))).scalar() or 0
+        after, written = 0, 0
+        sql = text(f"""
+            SELECT r.id, r.user_id, r.created_at, r.weakness_categories, {ops_col}
+            FROM {table} r
+            WHERE r.id > :after AND r.id <= :upto
+              AND NOT EXISTS (SELECT 1 FROM weakness_events e WHERE e.source IN :sources AND e.result_id = r.id)
+            ORDER BY r.id
+            LIMIT :limit
+        """).bindparams(bindparam("sources", expanding=True))
+        while after < upto:
+            async with Session() as s:
+                rows = (await s.execute(sql, {"after": after, "upto": upto, "limit": batch_size, "sources": list(sources)})).fetchall()
+                if not rows:
+                    break
+                events = []
+                for r in rows:
+                    cats = parse_json(r.weakness_categories)
+                    ops = phoneme_alignment(r)["ops_raw"]
+                    events += weakness_event_rows(r.user_id, r.created_at, source, r.id,
+                                                  categories=cats if isinstance(cats, list) else None,
+                                                  ops=ops if isinstance(ops, list) else None)
+                await _insert_weakness_events(s, events)
+                await s.commit()
+            after = rows[-1].id
+            written += len(events)
+        counts.append(written)
+    print(f"[DB-MIGRATE] weakness_events backfilled: {counts[0]} grammar and {counts[1]} pronunciation events")
+    return counts[0], counts[1]
+
+# --- Per-user daily rollups ---
+
+def _day_param(day: dt.date):
+    return day if _is_pg() else day.isoformat()
+
+async def _bump_daily_stats(s, user_id: str, day: dt.date, delta: Dict[str, Any]):
+    """Fold one result into user_daily_stats inside the caller's transaction."""
+    key = {"user_id": user_id, "day": _day_param(day)}
+    now = dt.datetime.utcnow()
+    await s.execute(text(
+        "INSERT INTO user_daily_stats (user_id, day, updated_at) VALUES (:user_id, :day, :updated_at) "
+        "ON CONFLICT (user_id, day) DO NOTHING"
+    ), dict(key, updated_at=now))
+    # Row lock on PG; SQLite already holds the database write lock at this point
+    lock = " FOR UPDATE" if _is_pg() else ""
+    row = (await s.execute(text(f"SELECT * FROM user_daily_stats WHERE user_id = :user_id AND day = :day{lock}"), key)).fetchone()
+    merged = rollups.merge(row._asdict(), delta)
+
+    json_fields = rollups.MAP_FIELDS + rollups.SKETCH_FIELDS
+    fields = rollups.COUNT_FIELDS + rollups.SUM_FIELDS + json_fields
+    sql = text(
+        "UPDATE user_daily_stats SET "
+        + ", ".join(f"{f} = :{f}" for f in fields)
+        + ", updated_at = :updated_at WHERE user_id = :user_id AND day = :day"
+    )
+    params = dict(key, updated_at=now, **{f: merged[f] for f in rollups.COUNT_FIELDS + rollups.SUM_FIELDS})
+    if _is_pg():
+        sql = sql.bindparams(*(bindparam(f, type_=JSONB) for f in json_fields))
+        params.update({f: merged[f] for f in json_fields})
+    else:
+        params.update({f: json.dumps(merged[f]) if merged[f] is not None else None for f in json_fields})
+    await s.execute(sql, params)
+
+async def get_user_daily_stats(user_id: str, start_day: dt.date) -> List[Row]:
+    sql = text("SELECT * FROM user_daily_stats WHERE user_id = :user_id AND day >= :start_day ORDER BY day")
+    async with Session() as s:
+        res = await s.execute(sql, {"user_id": user_id, "start_day": _day_param(start_day)})
+        return res.fetchall()
+
+async def get_user_daily_stats_many(user_ids: List[str], start_day: dt.date) -> Dict[str, List[Row]]:
+    """get_user_daily_stats for a batch of users in one query."""
+    if not user_ids:
+        return {}
+    sql = text(
+        "SELECT * FROM user_daily_stats WHERE user_id IN :user_ids AND day >= :start_day ORDER BY user_id, day"
+    ).bindparams(bindparam("user_ids", expanding=True))
+    out: Dict[str, List[Row]] = {}
+    async with Session() as s:
+        res = await s.execute(sql, {"user_ids": list(user_ids), "start_day": _day_param(start_day)})
+        for row in res.fetchall():
+            out.setdefault(row.user_id, []).append(row)
+    return out
+
+async def get_partial_day_deltas(user_ids: List[str], start: dt.datetime, end_day: dt.date) -> Dict[str, Dict[str, Any]]:
+    """
+    Rollup deltas of results saved from `start` up to the start of `end_day`, per user: the
+    part of a day that a rolling window covers, which user_daily_stats cannot split.
+    """
+    if not user_ids:
+        return {}
+    params = {"user_ids": list(user_ids), "start": start, "end": dt.datetime.combine(end_day, dt.time.min)}
+    where = "WHERE user_id IN :user_ids AND created_at >= :start AND created_at < :end"
+    out: Dict[str, Dict[str, Any]] = {}
+    async with Session() as s:
+        p_rows = (await s.execute(text(
+            f"SELECT user_id, per_sle, ops_raw, alignment, weakness_categories FROM phoneme_results {where}"
+        ).bindparams(bindparam("user_ids", expanding=True)), params)).fetchall()
+        g_rows = (await s.execute(text(
+            f"SELECT user_id, final_text, edits, latency_ms, weakness_categories FROM grammar_results {where}"
+        ).bindparams(bindparam("user_ids", expanding=True)), params)).fetchall()
+    for r in p_rows:
+        delta = rollups.phoneme_delta(r.per_sle, phoneme_alignment(r)["ops_raw"], parse_json(r.weakness_categories))
+        out[r.user_id] = rollups.merge(out.get(r.user_id) or rollups.empty_day(), delta)
+    for r in g_rows:
+        delta = rollups.grammar_delta(r.final_text, parse_json(r.edits), r.latency_ms, parse_json(r.weakness_categories))
+        out[r.user_id] = rollups.merge(out.get(r.user_id) or rollups.empty_day(), delta)
+    return out
+
+async def _backfill_table(select_sql: str, after: int, upto_id: int, to_delta, batch_size: int,
+                          job_name: str, key_prefix: str) -> int:
+    rows_done = 0
+    while after < upto_id:
+        async with Session() as s:
+            rows = (await s.execute(text(select_sql), {"after": after, "upto": upto_id, "limit": batch_size})).fetchall()
+            if not rows:
+                break
+            # Pre-merge per (user, day) so each chunk touches every rollup row once
+            pending: Dict[tuple, Dict[str, Any]] = {}
+            for r in rows:
+                k = (r.user_id, to_utc_naive(r.created_at).date())
+                pending[k] = rollups.merge(pending.get(k) or rollups.empty_day(), to_delta(r))
+            for (user_id, day), delta in pending.items():
+                await _bump_daily_stats(s, user_id, day, delta)
+            # same transaction as the bumps: a resumed backfill never counts a row twice
+            await _advance_checkpoint(s, job_name, f"{key_prefix}:{rows[-1].id}", len(rows))
+            await s.commit()
+        after = rows[-1].id
+        rows_done += len(rows)
+    return rows_done
+
+async def _backfill_rollups(job_name: str, fields, batch_size: int) -> tuple[int, int]:
+    """
+    Fold `fields` of results stored before the rollup (or those columns) existed into
+    user_daily_stats. Only rows present when the backfill first starts are read (the
+    bounds are kept in the job_checkpoints run_key); anything newer was already counted
+    on insert. Progress is checkpointed per batch, so an interrupted backfill resumes.
+    """
+    cp = await get_job_checkpoint(job_name)
+    if cp is not None and cp.finished_at is not None:
+        return 0, 0
+    if cp is not None:
+        max_p, max_g = (int(v) for v in cp.run_key.split(":"))
+        table, last = (cp.last_key or "p:0").split(":")
+        after_p, after_g = (int(last), 0) if table == "p" else (max_p, int(last))
+    else:
+        async with Session() as s:
+            max_p = (await s.execute(text("SELECT MAX(id) FROM phoneme_results"))).scalar() or 0
+            max_g = (await s.execute(text("SELECT MAX(id) FROM grammar_results"))).scalar() or 0
+        await start_job_checkpoint(job_name, f"{max_p}:{max_g}")
+        after_p = after_g = 0
+
+    n_p = await _backfill_table(
+        "SELECT id, user_id, per_sle, ops_raw, alignment, weakness_categories, created_at FROM phoneme_results "
+        "WHERE id > :after AND id <= :upto ORDER BY id LIMIT :limit",
+        after_p, max_p,
+        lambda r: rollups.pick(rollups.phoneme_delta(r.per_sle, phoneme_alignment(r)["ops_raw"], parse_json(r.weakness_categories)), fields),
+        batch_size, job_name, "p",
+    )
+    n_g = await _backfill_table(
+        "SELECT id, user_id, final_text, edits, latency_ms, weakness_categories, created_at FROM grammar_results "
+        "WHERE id > :after AND id <= :upto ORDER BY id LIMIT :limit",
+        after_g, max_g,
+        lambda r: rollups.pick(rollups.grammar_delta(r.final_text, parse_json(r.edits), r.latency_ms, parse_json(r.weakness_categories)), fields),
+        batch_size, job_name, "g",
+    )
+    await finish_job_checkpoint(job_name)
+    return n_p, n_g
+
+async def backfill_user_daily_stats(batch_size: int = 5000):
+    # Sketch columns are filled by their own migration (v5), which also runs on fresh installs
+    n_p, n_g = await _backfill_rollups("backfill_user_daily_stats", rollups.COUNT_FIELDS + rollups.SUM_FIELDS + rollups.MAP_FIELDS, batch_size)
+    print(f"[DB-MIGRATE] user_daily_stats backfilled from {n_p} phoneme and {n_g} grammar rows")
+
+async def backfill_daily_sketches(batch_size: int = 5000):
+    n_p, n_g = await _backfill_rollups("backfill_daily_sketches", rollups.SKETCH_FIELDS, batch_size)
+    print(f"[DB-MIGRATE] user_daily_stats sketches backfilled from {n_p} phoneme and {n_g} grammar rows")
+
+async def _sqlite_relax_pred_phones(batch_size: int = 5000):
+    """
+    Drop NOT NULL from phoneme_results.pred_phones on an existing SQLite DB. SQLite needs a
+    table rebuild: rows are copied in batches while writers keep using the old table (rows
+    are only ever appended), then the tail is copied and the tables swapped in one short
+    transaction. An interrupted copy resumes from phoneme_results_new.
+    """
+    async with engine.begin() as conn:
+        table_sql = (await conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'phoneme_results'"
+        ))).scalar()
+        if not table_sql or "pred_phones TEXT NOT NULL" not in table_sql:
+            return
+        exists = (await conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'phoneme_results_new'"
+        ))).scalar()
+        if not exists:
+            new_sql = table_sql.replace("pred_phones TEXT NOT NULL", "pred_phones TEXT").replace("phoneme_results", "phoneme_results_new", 1)
+            await conn.execute(text(new_sql))
+        after = (await conn.execute(text("SELECT MAX(id) FROM phoneme_results_new"))).scalar() or 0
+
+    copy_sql = text("INSERT INTO phoneme_results_new SELECT * FROM phoneme_results WHERE id > :after ORDER BY id LIMIT :limit")
+    while True:
+        async with engine.begin() as conn:
+            copied = (await conn.execute(copy_sql, {"after": after, "limit": batch_size})).rowcount
+            after = (await conn.execute(text("SELECT MAX(id) FROM phoneme_results_new"))).scalar() or 0
+        if copied < batch_size:
+            break
+
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO phoneme_results_new SELECT * FROM phoneme_results WHERE id > :after"), {"after": after})
+        index_sqls = (await conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'phoneme_results' AND sql IS NOT NULL"
+        ))).scalars().all()
+        await conn.execute(text("DROP TABLE phoneme_results"))
+        await conn.execute(text("ALTER TABLE phoneme_results_new RENAME TO phoneme_results"))
+        for stmt in index_sqls:
+            await conn.execute(text(stmt))
+
+async def compact_phoneme_alignments(batch_size: int = 2000):
+    """Re-encode stored JSON alignments with phone_codec and clear the JSON columns."""
+    async with Session() as s:
+        upto = (await s.execute(text("SELECT MAX(id) FROM phoneme_results"))).scalar() or 0
+    select_sql = text("""
+        SELECT id, pred_phones, ref_phones, ops_raw, word_analysis FROM phoneme_results
+        WHERE id > :after AND id <= :upto AND alignment IS NULL
+        ORDER BY id LIMIT :limit
     """)
-    # Phoneme
-    sql_phoneme = text("""
-      SELECT ref_text, pred_phones, ref_phones, ops_raw, per_strict, per_sle, created_at
-      FROM phoneme_results
-      WHERE user_id = :user_id
-      ORDER BY created_at DESC
-      LIMIT :limit
+    update_sql = text("""
+        UPDATE phoneme_results
+        SET alignment = :alignment, pred_phones = NULL, ref_phones = NULL, ops_raw = NULL, word_analysis = NULL
+        WHERE id = :id AND alignment IS NULL
     """)
+    after, packed, kept = 0, 0, 0
+    while after < upto:
+        async with Session() as s:
+            rows = (await s.execute(select_sql, {"after": after, "upto": upto, "limit": batch_size})).fetchall()
+            if not rows:
+                break
+            updates = []
+            for r in rows:
+                a = phoneme_alignment(r)
+                blob = phone_codec.encode(a["pred_phones"] or [], a["ref_phones"], a["ops_raw"], a["word_analysis"])
+                if blob is not None:
+                    updates.append({"id": r.id, "alignment": blob})
+            if updates:
+                await s.execute(update_sql, updates)
+            await s.commit()
+        after = rows[-1].id
+        packed += len(updates)
+        kept += len(rows) - len(updates)
+    print(f"[DB-MIGRATE] phoneme_results alignments packed: {packed} rows, {kept} left as JSON")
+
+# Schema changes SQLite can't express in DDL, run before the version is recorded
+_SQLITE_SCHEMA_STEPS = {
+    9: _sqlite_relax_pred_phones,
+}
+
+# Data steps run once the version is recorded (see apply_migrations)
+_MIGRATION_HOOKS = {
+    4: backfill_user_daily_stats,
+    5: backfill_daily_sketches,
+    8: backfill_weakness_events,
+    9: compact_phoneme_alignments,
+}
 
-    out = {"grammar": [], "phoneme": []}
-    async with Session() as s:
-        # grammar
-        gr = await s.execute(sql_grammar, {"user_id": user_id, "limit": limit})
-        for row in gr.fetchall():
-            edits = row.edits
-            guards = row.guardrails
-            # SQLite stores JSON as TEXT -> parse; PG returns str too via text() -> parse
-            try: edits = json.loads(edits) if isinstance(edits, str) and edits else edits
-            except Exception: pass
-            try: guards = json.loads(guards) if isinstance(guards, str) and guards else guards
-            except Exception: pass
-            out["grammar"].append({
-                "input_text": row.input_text,
-                "raw_corrected": row.raw_corrected,
-                "final_text": row.final_text,
-                "edits": edits,
-                "guardrails": guards,
-                "latency_ms": row.latency_ms,
-                "created_at": row.created_at.isoformat() if hasattr(row.created_at, "isoformat") else str(row.created_at),
-            })
-
-        # phoneme
-        pr = await s.execute(sql_phoneme, {"user_id": user_id, "limit": limit})
-        for row in pr.fetchall():
-            pred = row.pred_phones
-            refp = row.ref_phones
-            ops = row.ops_raw
-            try: pred = json.loads(pred) if isinstance(pred, str) and pred else pred
-            except Exception: pass
-            try: refp = json.loads(refp) if isinstance(refp, str) and refp else refp
-            except Exception: pass
-            try: ops = json.loads(ops) if isinstance(ops, str) and ops else ops
-            except Exception: pass
-            out["phoneme"].append({
-                "ref_text": row.ref_text,
-                "pred_phones": pred,
-                "ref_phones": refp,
-                "ops_raw": ops,
-                "per_strict": row.per_strict,
-                "per_sle": row.per_sle,
-                "created_at": row.created_at.isoformat() if hasattr(row.created_at, "isoformat") else str(row.created_at),
-            })
+# --- Analytics invalidation ---
+
+async def _mark_analytics_dirty(s, user_id: str, now: dt.datetime):
+    """Flag the user's analytics for recompute; runs inside the writer's transaction."""
+    await s.execute(text("""
+        INSERT INTO analytics_dirty (user_id, first_dirty_at, last_write_at) VALUES (:user_id, :now, :now)
+        ON CONFLICT (user_id) DO UPDATE SET last_write_at = excluded.last_write_at
+    """), {"user_id": user_id, "now": now})
+
+async def get_due_dirty_users(quiet_before: dt.datetime, overdue_before: dt.datetime, limit: int,
+                              now: dt.datetime, max_attempts: int) -> List[Row]:
+    """
+    Dirty users with no write since `quiet_before`, or waiting since before `overdue_before`.
+    Users backing off after a failed refresh, or past `max_attempts` failures, are left to
+    the nightly pass so they cannot hold up the users queued behind them.
+    """
+    sql = text("""
+        SELECT user_id, last_write_at, attempts FROM analytics_dirty
+        WHERE (last_write_at < :quiet_before OR first_dirty_at < :overdue_before)
+          AND attempts < :max_attempts AND (next_attempt_at IS NULL OR next_attempt_at <= :now)
+        ORDER BY first_dirty_at
+        LIMIT :limit
+    """)
+    async with Session() as s:
+        res = await s.execute(sql, {"quiet_before": quiet_before, "overdue_before": overdue_before, "limit": limit,
+                                    "now": now, "max_attempts": max_attempts})
+        return res.fetchall()
+
+async def defer_analytics_dirty(entries: List[tuple]):
+    """`entries`: (user_id, next_attempt_at) for users whose refresh failed."""
+    if not entries:
+        return
+    sql = text("UPDATE analytics_dirty SET attempts = attempts + 1, next_attempt_at = :next_attempt_at WHERE user_id = :user_id")
+    async with Session() as s:
+        await s.execute(sql, [{"user_id": u, "next_attempt_at": t} for u, t in entries])
+        await s.commit()
+
+async def get_dirty_users(after: str | None = None) -> List[Row]:
+    """All dirty users in user_id order (optionally after a checkpoint)."""
+    sql = text(
+        "SELECT user_id, last_write_at FROM analytics_dirty"
+        + (" WHERE user_id > :after" if after is not None else "")
+        + " ORDER BY user_id"
+    )
+    async with Session() as s:
+        return (await s.execute(sql, {"after": after})).fetchall()
+
+async def clear_analytics_dirty(entries: List[tuple]):
+    """`entries`: (user_id, last_write_at) as read; users written to since then stay dirty."""
+    if not entries:
+        return
+    params = [{"user_id": u, "last_write_at": t} for u, t in entries]
+    async with Session() as s:
+        await s.execute(text("DELETE FROM analytics_dirty WHERE user_id = :user_id AND last_write_at = :last_write_at"), params)
+        # the refresh worked, so whoever stays dirty starts over without backoff
+        await s.execute(text("UPDATE analytics_dirty SET attempts = 0, next_attempt_at = NULL WHERE user_id = :user_id"),
+                        [{"user_id": p["user_id"]} for p in params])
+        await s.commit()
+
+async def analytics_dirty_count() -> int:
+    async with Session() as s:
+        return int((await s.execute(text("SELECT COUNT(*) FROM analytics_dirty"))).scalar() or 0)
+
+# --- Grammar weakness enrichment queue ---
+
+def to_utc_naive(v) -> dt.datetime | None:
+    """Timestamps come back as str from SQLite and as aware datetimes from PG."""
+    if v is None:
+        return None
+    if isinstance(v, str):
+        v = dt.datetime.fromisoformat(v)
+    if v.tzinfo is not None:
+        v = v.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return v
+
+async def claim_pending_grammar_rows(limit: int, stale_after_s: int = 300) -> List[Row]:
+    """
+    Atomically move up to `limit` pending rows to 'processing' and return them. Rows stuck
+    in 'processing' longer than `stale_after_s` (crashed worker) are claimed again.
+    """
+    now = dt.datetime.utcnow()
+    lock = "FOR UPDATE SKIP LOCKED" if _is_pg() else ""
+    sql = text(f"""
+        UPDATE grammar_results
+        SET weakness_status = 'processing', weakness_claimed_at = :now
+        WHERE id IN (
+            SELECT id FROM grammar_results
+            WHERE weakness_status = 'pending'
+               OR (weakness_status = 'processing' AND weakness_claimed_at < :stale_before)
+            ORDER BY id
+            LIMIT :limit
+            {lock}
+        )
+        RETURNING id, input_text, final_text, weakness_attempts
+    """)
+    async with Session() as s:
+        res = await s.execute(sql, {"now": now, "stale_before": now - dt.timedelta(seconds=stale_after_s), "limit": limit})
+        rows = res.fetchall()
+        await s.commit()
+    return rows
+
+async def complete_grammar_enrichment(updates: List[Dict[str, Any]]):
+    """
+    `updates`: [{"id": ..., "weakness_categories": [...]}]; marks the rows done and adds the
+    categories to the row's daily rollup. A row already completed by another worker is skipped.
+    """
+    if not updates:
+        return
+    sql = text("""
+        UPDATE grammar_results
+        SET weakness_categories = :weakness_categories, weakness_status = 'done', weakness_claimed_at = NULL
+        WHERE id = :id AND weakness_status = 'processing'
+        RETURNING id, user_id, created_at
+    """)
+    if _is_pg():
+        sql = sql.bindparams(bindparam("weakness_categories", type_=JSONB))
+    async with Session() as s:
+        for u in updates:
+            cats = u["weakness_categories"]
+            row = (await s.execute(sql, {"id": u["id"], "weakness_categories": cats if _is_pg() else json.dumps(cats)})).fetchone()
+            if row is not None and cats:
+                await _bump_daily_stats(s, row.user_id, to_utc_naive(row.created_at).date(), rollups.grammar_weakness_delta(cats))
+                await _insert_weakness_events(s, weakness_event_rows(row.user_id, row.created_at, "grammar", row.id, categories=cats))
+                await _mark_analytics_dirty(s, row.user_id, dt.datetime.utcnow())
+        await s.commit()
+
+async def release_grammar_rows(ids: List[int], count_attempt: bool = False):
+    """
+    Put claimed rows back in the queue. A failed LLM call does not count against the rows;
+    `count_attempt` is for rows a successful reply left out.
+    """
+    if not ids:
+        return
+    bump = ", weakness_attempts = weakness_attempts + 1" if count_attempt else ""
+    sql = text(f"UPDATE grammar_results SET weakness_status = 'pending', weakness_claimed_at = NULL{bump} WHERE id = :id")
+    async with Session() as s:
+        await s.execute(sql, [{"id": i} for i in ids])
+        await s.commit()
+
+async def grammar_enrichment_backlog() -> tuple[int, dt.datetime | None]:
+    """(rows waiting for categorization, created_at of the oldest one)."""
+    sql = text("""
+        SELECT COUNT(*) AS n, MIN(created_at) AS oldest
+        FROM grammar_results
+        WHERE weakness_status IN ('pending', 'processing')
+    """)
+    async with Session() as s:
+        row = (await s.execute(sql)).fetchone()
+    return int(row.n or 0), to_utc_naive(row.oldest)
+
+async def find_cached_gec_categories(text_sha256: str, final_text: str) -> List[str] | None:
+    """Categories already known for this (normalized input, correction) pair, if any."""
+    sql = text("""
+        SELECT weakness_categories FROM gec_cache
+        WHERE text_sha256 = :text_sha256 AND final_text = :final_text AND weakness_categories IS NOT NULL
+        LIMIT 1
+    """)
+    async with Session() as s:
+        row = (await s.execute(sql, {"text_sha256": text_sha256, "final_text": final_text})).fetchone()
+    cats = parse_json(row.weakness_categories) if row else None
+    return cats if isinstance(cats, list) else None
+
+async def set_gec_cache_categories(text_sha256: str, final_text: str, categories: List[str]) -> List[str]:
+    """Store categories on every cached correction of this pair; returns their cache keys."""
+    sql = text("""
+        UPDATE gec_cache SET weakness_categories = :weakness_categories
+        WHERE text_sha256 = :text_sha256 AND final_text = :final_text
+        RETURNING cache_key
+    """)
+    if _is_pg():
+        sql = sql.bindparams(bindparam("weakness_categories", type_=JSONB))
+        cats = categories
+    else:
+        cats = json.dumps(categories)
+    async with Session() as s:
+        keys = (await s.execute(sql, {"text_sha256": text_sha256, "final_text": final_text, "weakness_categories": cats})).scalars().all()
+        await s.commit()
+    return list(keys)
+
+# --- Keyset pagination ---
+# Cursors are opaque to clients: urlsafe base64 of a small JSON position. Timestamps are
+# kept exactly as the driver returned them (ISO text on SQLite, aware datetimes on PG) so
+# the keyset comparison sees the same value that was stored.
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    """Raises ValueError for anything that isn't a cursor we issued."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(data, dict):
+        raise ValueError("Invalid cursor")
+    return data
+
+def _ts_key(v) -> str:
+    return v if isinstance(v, str) else v.isoformat()
+
+def _ts_param(v: str):
+    return dt.datetime.fromisoformat(v) if _is_pg() else v
+
+def _position(value) -> tuple | None:
+    """(created_at, id) from a cursor entry; None = start of the table."""
+    if value is None:
+        return None
+    try:
+        ts, row_id = value
+        return _ts_param(str(ts)), int(row_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def _iso(v) -> str:
+    return v.isoformat() if hasattr(v, "isoformat") else str(v)
+
+async def fetch_user_results(user_id: str, limit: int = 50, cursor: str | None = None) -> Dict[str, Any]:
+    """
+    Newest-first grammar and phoneme results, up to `limit` of each per page. The cursor
+    carries a (created_at, id) position per table, so pages stay stable while new rows
+    arrive and each one costs an index range scan however deep it is.
+    """
+    pos = decode_cursor(cursor) if cursor else {}
+    out: Dict[str, Any] = {"grammar": [], "phoneme": [], "next_cursor": None}
+    next_pos: Dict[str, Any] = {}
+
+    tables = {
+        "g": ("grammar_results", "input_text, raw_corrected, final_text, edits, guardrails, latency_ms"),
+        "p": ("phoneme_results", "ref_text, pred_phones, ref_phones, ops_raw, alignment, per_strict, per_sle"),
+    }
+    async with Session() as s:
+        for key, (table, cols) in tables.items():
+            if pos.get(key) == "end":
+                next_pos[key] = "end"
+                continue
+            after = _position(pos.get(key))
+            sql = text(f"""
+              SELECT id, {cols}, created_at
+              FROM {table}
+              WHERE user_id = :user_id {"AND (created_at, id) < (:after_ts, :after_id)" if after else ""}
+              ORDER BY created_at DESC, id DESC
+              LIMIT :limit
+            """)
+            params = {"user_id": user_id, "limit": limit + 1}
+            if after:
+                params.update(after_ts=after[0], after_id=after[1])
+            rows = (await s.execute(sql, params)).fetchall()
+            page = rows[:limit]
+            next_pos[key] = [_ts_key(page[-1].created_at), page[-1].id] if len(rows) > limit else "end"
+
+            for row in page:
+                if key == "g":
+                    out["grammar"].append({
+                        "input_text": row.input_text,
+                        "raw_corrected": row.raw_corrected,
+                        "final_text": row.final_text,
+                        "edits": parse_json(row.edits),
+                        "guardrails": parse_json(row.guardrails),
+                        "latency_ms": row.latency_ms,
+                        "created_at": _iso(row.created_at),
+                    })
+                else:
+                    alignment = phoneme_alignment(row)
+                    out["phoneme"].append({
+                        "ref_text": row.ref_text,
+                        "pred_phones": alignment["pred_phones"],
+                        "ref_phones": alignment["ref_phones"],
+                        "ops_raw": alignment["ops_raw"],
+                        "per_strict": row.per_strict,
+                        "per_sle": row.per_sle,
+                        "created_at": _iso(row.created_at),
+                    })
+
+    if any(v != "end" for v in next_pos.values()):
+        out["next_cursor"] = encode_cursor(next_pos)
     return out
 
+# --- GEC result cache ---
+
+def parse_json(v):
+    """JSON columns come back as str from SQLite and as decoded objects from PG."""
+    if isinstance(v, str):
+        try:
+            return json.loads(v)
+        except json.JSONDecodeError:
+            return None
+    return v
+
+async def get_gec_cache(cache_key: str) -> Dict[str, Any] | None:
+    sql = text("""
+        SELECT raw_corrected, final_text, edits, guardrails, weakness_categories
+        FROM gec_cache WHERE cache_key = :cache_key
+    """)
+    async with Session() as s:
+        row = (await s.execute(sql, {"cache_key": cache_key})).fetchone()
+    if row is None:
+        return None
+    return {
+        "raw_corrected": row.raw_corrected,
+        "final_text": row.final_text,
+        "edits": parse_json(row.edits) or [],
+        "guardrails": parse_json(row.guardrails) or [],
+        "weakness_categories": parse_json(row.weakness_categories),
+    }
+
+async def upsert_gec_cache(payload: Dict[str, Any]):
+    payload = dict(payload, created_at=dt.datetime.utcnow())
+    sql = text("""
+        INSERT INTO gec_cache (cache_key, text_sha256, model_id, guardrails_version, sle_mode, max_new_tokens, raw_corrected, final_text, edits, guardrails, weakness_categories, created_at)
+        VALUES (:cache_key, :text_sha256, :model_id, :guardrails_version, :sle_mode, :max_new_tokens, :raw_corrected, :final_text, :edits, :guardrails, :weakness_categories, :created_at)
+        ON CONFLICT (cache_key) DO UPDATE SET
+            raw_corrected = excluded.raw_corrected, final_text = excluded.final_text, edits = excluded.edits, guardrails = excluded.guardrails,
+            weakness_categories = COALESCE(excluded.weakness_categories, gec_cache.weakness_categories), created_at = excluded.created_at
+    """)
+    if _is_pg():
+        sql = sql.bindparams(
+            bindparam("edits", type_=JSONB),
+            bindparam("guardrails", type_=JSONB),
+            bindparam("weakness_categories", type_=JSONB),
+        )
+    else:
+        for k in ("edits", "guardrails", "weakness_categories"):
+            # keep SQL NULL (not the string 'null') so "not categorized yet" stays detectable
+            payload[k] = json.dumps(payload[k]) if payload.get(k) is not None else None
+    async with Session() as s:
+        await s.execute(sql, payload)
+        await s.commit()
+
+async def purge_gec_cache(model_ids: List[str], guardrails_version: str) -> int:
+    """Drop cached corrections produced by another model (or split setting) or guardrail set."""
+    sql = text("DELETE FROM gec_cache WHERE model_id NOT IN :model_ids OR guardrails_version != :guardrails_version").bindparams(
+        bindparam("model_ids", expanding=True))
+    async with Session() as s:
+        res = await s.execute(sql, {"model_ids": list(model_ids), "guardrails_version": guardrails_version})
+        await s.commit()
+        return res.rowcount or 0
+
 # --- Analytics --- 
 
 async def get_user_analytics_cache(user_id: str) -> Row | None:
@@ -352,144 +1325,283 @@ async def get_user_analytics_cache(user_id: str) -> Row | None:
         result = await s.execute(sql, {"user_id": user_id})
         return result.fetchone()
 
+async def get_user_analytics_cache_many(user_ids: List[str]) -> Dict[str, Row]:
+    if not user_ids:
+        return {}
+    sql = text("SELECT * FROM user_analytics_cache WHERE user_id IN :user_ids AND window_label = '7d'").bindparams(
+        bindparam("user_ids", expanding=True))
+    async with Session() as s:
+        return {r.user_id: r for r in (await s.execute(sql, {"user_ids": list(user_ids)})).fetchall()}
+
 async def upsert_user_analytics_cache(payload: dict):
+    await upsert_user_analytics_cache_many([payload])
+
+async def upsert_user_analytics_cache_many(payloads: List[dict]):
+    """Write several users' analytics rows in one executemany round trip."""
+    if not payloads:
+        return
     if _is_pg():
         sql = text("""
-            INSERT INTO user_analytics_cache (user_id, window_label, from_ts, to_ts, attempts_phoneme, attempts_grammar, per_sle_avg, per_sle_median, edits_per_100w_avg, latency_ms_p50, top_phone_subs, top_grammar_weaknesses, top_pronunciation_weaknesses, badge, headline_msg, updated_at, expires_at)
-            VALUES (:user_id, :window_label, :from_ts, :to_ts, :attempts_phoneme, :attempts_grammar, :per_sle_avg, :per_sle_median, :edits_per_100w_avg, :latency_ms_p50, :top_phone_subs, :top_grammar_weaknesses, :top_pronunciation_weaknesses, :badge, :headline_msg, :updated_at, :expires_at)
+            INSERT INTO user_analytics_cache (user_id, window_label, from_ts, to_ts, attempts_phoneme, attempts_grammar, per_sle_avg, per_sle_median, edits_per_100w_avg, latency_ms_p50, top_phone_subs, top_grammar_weaknesses, top_pronunciation_weaknesses, badge, headline_msg, insight_key, insight_at, updated_at, expires_at)
+            VALUES (:user_id, :window_label, :from_ts, :to_ts, :attempts_phoneme, :attempts_grammar, :per_sle_avg, :per_sle_median, :edits_per_100w_avg, :latency_ms_p50, :top_phone_subs, :top_grammar_weaknesses, :top_pronunciation_weaknesses, :badge, :headline_msg, :insight_key, :insight_at, :updated_at, :expires_at)
             ON CONFLICT (user_id) DO UPDATE SET
-                from_ts = EXCLUDED.from_ts, to_ts = EXCLUDED.to_ts, attempts_phoneme = EXCLUDED.attempts_phoneme, attempts_grammar = EXCLUDED.attempts_grammar, per_sle_avg = EXCLUDED.per_sle_avg, per_sle_median = EXCLUDED.per_sle_median, edits_per_100w_avg = EXCLUDED.edits_per_100w_avg, latency_ms_p50 = EXCLUDED.latency_ms_p50, top_phone_subs = EXCLUDED.top_phone_subs, top_grammar_weaknesses = EXCLUDED.top_grammar_weaknesses, top_pronunciation_weaknesses = EXCLUDED.top_pronunciation_weaknesses, badge = EXCLUDED.badge, headline_msg = EXCLUDED.headline_msg, updated_at = EXCLUDED.updated_at, expires_at = EXCLUDED.expires_at;
+                from_ts = EXCLUDED.from_ts, to_ts = EXCLUDED.to_ts, attempts_phoneme = EXCLUDED.attempts_phoneme, attempts_grammar = EXCLUDED.attempts_grammar, per_sle_avg = EXCLUDED.per_sle_avg, per_sle_median = EXCLUDED.per_sle_median, edits_per_100w_avg = EXCLUDED.edits_per_100w_avg, latency_ms_p50 = EXCLUDED.latency_ms_p50, top_phone_subs = EXCLUDED.top_phone_subs, top_grammar_weaknesses = EXCLUDED.top_grammar_weaknesses, top_pronunciation_weaknesses = EXCLUDED.top_pronunciation_weaknesses, badge = EXCLUDED.badge, headline_msg = EXCLUDED.headline_msg, insight_key = EXCLUDED.insight_key, insight_at = EXCLUDED.insight_at, updated_at = EXCLUDED.updated_at, expires_at = EXCLUDED.expires_at;
         """).bindparams(
             bindparam("top_phone_subs", type_=JSONB),
             bindparam("top_grammar_weaknesses", type_=JSONB),
             bindparam("top_pronunciation_weaknesses", type_=JSONB),
         )
+        params = [dict(p) for p in payloads]
     else: # SQLite
         sql = text("""
-            INSERT INTO user_analytics_cache (user_id, window_label, from_ts, to_ts, attempts_phoneme, attempts_grammar, per_sle_avg, per_sle_median, edits_per_100w_avg, latency_ms_p50, top_phone_subs, top_grammar_weaknesses, top_pronunciation_weaknesses, badge, headline_msg, updated_at, expires_at)
-            VALUES (:user_id, :window_label, :from_ts, :to_ts, :attempts_phoneme, :attempts_grammar, :per_sle_avg, :per_sle_median, :edits_per_100w_avg, :latency_ms_p50, :top_phone_subs, :top_grammar_weaknesses, :top_pronunciation_weaknesses, :badge, :headline_msg, :updated_at, :expires_at)
+            INSERT INTO user_analytics_cache (user_id, window_label, from_ts, to_ts, attempts_phoneme, attempts_grammar, per_sle_avg, per_sle_median, edits_per_100w_avg, latency_ms_p50, top_phone_subs, top_grammar_weaknesses, top_pronunciation_weaknesses, badge, headline_msg, insight_key, insight_at, updated_at, expires_at)
+            VALUES (:user_id, :window_label, :from_ts, :to_ts, :attempts_phoneme, :attempts_grammar, :per_sle_avg, :per_sle_median, :edits_per_100w_avg, :latency_ms_p50, :top_phone_subs, :top_grammar_weaknesses, :top_pronunciation_weaknesses, :badge, :headline_msg, :insight_key, :insight_at, :updated_at, :expires_at)
             ON CONFLICT (user_id) DO UPDATE SET
-                from_ts = excluded.from_ts, to_ts = excluded.to_ts, attempts_phoneme = excluded.attempts_phoneme, attempts_grammar = excluded.attempts_grammar, per_sle_avg = excluded.per_sle_avg, per_sle_median = excluded.per_sle_median, edits_per_100w_avg = excluded.edits_per_100w_avg, latency_ms_p50 = excluded.latency_ms_p50, top_phone_subs = excluded.top_phone_subs, top_grammar_weaknesses = excluded.top_grammar_weaknesses, top_pronunciation_weaknesses = excluded.top_pronunciation_weaknesses, badge = excluded.badge, headline_msg = excluded.headline_msg, updated_at = excluded.updated_at, expires_at = excluded.expires_at;
+                from_ts = excluded.from_ts, to_ts = excluded.to_ts, attempts_phoneme = excluded.attempts_phoneme, attempts_grammar = excluded.attempts_grammar, per_sle_avg = excluded.per_sle_avg, per_sle_median = excluded.per_sle_median, edits_per_100w_avg = excluded.edits_per_100w_avg, latency_ms_p50 = excluded.latency_ms_p50, top_phone_subs = excluded.top_phone_subs, top_grammar_weaknesses = excluded.top_grammar_weaknesses, top_pronunciation_weaknesses = excluded.top_pronunciation_weaknesses, badge = excluded.badge, headline_msg = excluded.headline_msg, insight_key = excluded.insight_key, insight_at = excluded.insight_at, updated_at = excluded.updated_at, expires_at = excluded.expires_at;
         """)
-        # For SQLite, convert JSON objects to strings
-        if payload.get("top_phone_subs") is not None:
-            payload["top_phone_subs"] = json.dumps(payload.get("top_phone_subs"))
-        if payload.get("top_grammar_weaknesses") is not None:
-            payload["top_grammar_weaknesses"] = json.dumps(payload.get("top_grammar_weaknesses"))
-        if payload.get("top_pronunciation_weaknesses") is not None:
-            payload["top_pronunciation_weaknesses"] = json.dumps(payload.get("top_pronunciation_weaknesses"))
+        # For SQLite, convert JSON objects to strings (on copies; callers may reuse the payload)
+        params = []
+        for p in payloads:
+            p = dict(p)
+            for k in ("top_phone_subs", "top_grammar_weaknesses", "top_pronunciation_weaknesses"):
+                if p.get(k) is not None:
+                    p[k] = json.dumps(p[k])
+            params.append(p)
 
     async with Session() as s:
-        await s.execute(sql, payload)
+        await s.execute(sql, params)
+        await s.commit()
+
+# --- Job checkpoints ---
+
+async def get_job_checkpoint(job_name: str) -> Row | None:
+    sql = text("SELECT * FROM job_checkpoints WHERE job_name = :job_name")
+    async with Session() as s:
+        return (await s.execute(sql, {"job_name": job_name})).fetchone()
+
+async def start_job_checkpoint(job_name: str, run_key: str):
+    now = dt.datetime.utcnow()
+    sql = text("""
+        INSERT INTO job_checkpoints (job_name, run_key, last_key, processed, started_at, updated_at, finished_at)
+        VALUES (:job_name, :run_key, NULL, 0, :now, :now, NULL)
+        ON CONFLICT (job_name) DO UPDATE SET
+            run_key = excluded.run_key, last_key = NULL, processed = 0, started_at = excluded.started_at,
+            updated_at = excluded.updated_at, finished_at = NULL
+    """)
+    async with Session() as s:
+        await s.execute(sql, {"job_name": job_name, "run_key": run_key, "now": now})
         await s.commit()
 
-async def get_phoneme_results_last_n_days(user_id: str, days: int) -> List[Row]:
-    sql = text("SELECT per_sle, ops_raw, weakness_categories, created_at FROM phoneme_results WHERE user_id = :user_id AND created_at >= :start_date")
-    start_date = dt.datetime.utcnow() - dt.timedelta(days=days)
+async def advance_job_checkpoint(job_name: str, last_key: str, processed: int):
+    sql = text("UPDATE job_checkpoints SET last_key = :last_key, processed = :processed, updated_at = :now WHERE job_name = :job_name")
     async with Session() as s:
-        result = await s.execute(sql, {"user_id": user_id, "start_date": start_date})
-        return result.fetchall()
+        await s.execute(sql, {"job_name": job_name, "last_key": last_key, "processed": processed, "now": dt.datetime.utcnow()})
+        await s.commit()
 
-async def get_grammar_results_last_n_days(user_id: str, days: int) -> List[Row]:
-    sql = text("SELECT final_text, edits, latency_ms, weakness_categories, created_at FROM grammar_results WHERE user_id = :user_id AND created_at >= :start_date")
-    start_date = dt.datetime.utcnow() - dt.timedelta(days=days)
+async def _advance_checkpoint(s, job_name: str, last_key: str, n: int):
+    """advance_job_checkpoint inside the caller's transaction, adding `n` to processed."""
+    sql = text("UPDATE job_checkpoints SET last_key = :last_key, processed = processed + :n, updated_at = :now WHERE job_name = :job_name")
+    await s.execute(sql, {"job_name": job_name, "last_key": last_key, "n": n, "now": dt.datetime.utcnow()})
+
+async def finish_job_checkpoint(job_name: str):
+    now = dt.datetime.utcnow()
+    sql = text("UPDATE job_checkpoints SET finished_at = :now, updated_at = :now WHERE job_name = :job_name")
     async with Session() as s:
-        result = await s.execute(sql, {"user_id": user_id, "start_date": start_date})
-        return result.fetchall()
+        await s.execute(sql, {"job_name": job_name, "now": now})
+        await s.commit()
+
+# --- Scheduler lease and job history ---
 
-async def fetch_user_weaknesses(user_id: str, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
-    """Fetches a paginated list of all weaknesses for a user."""
+async def acquire_lease(name: str, holder: str, ttl_seconds: float) -> bool:
+    """Take the lease if it is free or expired, or extend it if `holder` already has it."""
+    now = dt.datetime.utcnow()
     sql = text("""
-        SELECT type, text, categories, created_at FROM (
-            SELECT 'grammar' as type, input_text as text, weakness_categories as categories, created_at
-            FROM grammar_results
-            WHERE user_id = :user_id AND weakness_categories IS NOT NULL AND weakness_categories != '[]' AND weakness_categories != 'null'
-            UNION ALL
-            SELECT 'pronunciation' as type, ref_text as text, weakness_categories as categories, created_at
-            FROM phoneme_results
-            WHERE user_id = :user_id AND weakness_categories IS NOT NULL AND weakness_categories != '[]' AND weakness_categories != 'null'
-        )
-        ORDER BY created_at DESC
-        LIMIT :limit OFFSET :offset
+        INSERT INTO scheduler_leases (name, holder, expires_at) VALUES (:name, :holder, :expires_at)
+        ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+        WHERE scheduler_leases.holder = excluded.holder OR scheduler_leases.expires_at < :now
+        RETURNING holder
     """)
-    
-    results = []
     async with Session() as s:
-        res = await s.execute(sql, {"user_id": user_id, "limit": limit, "offset": offset})
-        for row in res.fetchall():
-            categories = row.categories
-            result_text = row.text or ""
-            try:
-                categories = json.loads(categories) if isinstance(categories, str) else (categories or [])
-            except json.JSONDecodeError:
-                categories = []
-            
-            results.append({
-                "type": row.type,
-                "text": result_text,
-                "categories": categories,
-                "created_at": row.created_at.isoformat(),
-            })
-    return results
+        row = (await s.execute(sql, {"name": name, "holder": holder, "now": now,
+                                     "expires_at": now + dt.timedelta(seconds=ttl_seconds)})).fetchone()
+        await s.commit()
+    return row is not None
 
-async def fetch_user_weakness_summary(user_id: str, limit: int = 100) -> Dict[str, Any]:
-    """Fetches a summary of a user's weaknesses from their last N entries."""
-    # 1. Get last N grammar results
-    sql_grammar = text("""
-        SELECT weakness_categories 
-        FROM grammar_results 
-        WHERE user_id = :user_id AND weakness_categories IS NOT NULL AND weakness_categories != '[]' AND weakness_categories != 'null'
-        ORDER BY created_at DESC
-        LIMIT :limit
+async def release_lease(name: str, holder: str):
+    async with Session() as s:
+        await s.execute(text("DELETE FROM scheduler_leases WHERE name = :name AND holder = :holder"), {"name": name, "holder": holder})
+        await s.commit()
+
+async def start_job_run(job_name: str, scheduled_for: str, holder: str, ttl_seconds: float) -> int | None:
+    """Record a run; None if this occurrence was already started (by any process)."""
+    now = dt.datetime.utcnow()
+    sql = text("""
+        INSERT INTO job_runs (job_name, scheduled_for, holder, status, started_at, lease_expires_at)
+        VALUES (:job_name, :scheduled_for, :holder, 'running', :now, :expires_at)
+        ON CONFLICT (job_name, scheduled_for) DO NOTHING
+        RETURNING id
     """)
+    async with Session() as s:
+        row = (await s.execute(sql, {"job_name": job_name, "scheduled_for": scheduled_for, "holder": holder,
+                                     "now": now, "expires_at": now + dt.timedelta(seconds=ttl_seconds)})).fetchone()
+        await s.commit()
+    return row.id if row else None
 
-    # 2. Get last N phoneme results
-    sql_pron = text("""
-        SELECT ops_raw 
-        FROM phoneme_results 
-        WHERE user_id = :user_id AND ops_raw IS NOT NULL AND ops_raw != '[]' AND ops_raw != 'null'
-        ORDER BY created_at DESC
-        LIMIT :limit
+async def renew_job_runs(holder: str, ttl_seconds: float):
+    """Extend the lease of every run `holder` is still executing."""
+    sql = text("UPDATE job_runs SET lease_expires_at = :expires_at WHERE holder = :holder AND status = 'running'")
+    async with Session() as s:
+        await s.execute(sql, {"holder": holder, "expires_at": dt.datetime.utcnow() + dt.timedelta(seconds=ttl_seconds)})
+        await s.commit()
+
+async def get_running_job_run(job_name: str) -> Row | None:
+    """The newest run of `job_name` still marked running (its holder may be dead)."""
+    sql = text("""
+        SELECT id, holder, lease_expires_at FROM job_runs
+        WHERE job_name = :job_name AND status = 'running'
+        ORDER BY id DESC LIMIT 1
+    """)
+    async with Session() as s:
+        return (await s.execute(sql, {"job_name": job_name})).fetchone()
+
+async def take_over_job_run(run_id: int, holder: str, ttl_seconds: float) -> bool:
+    """Become the holder of a running job whose lease has expired; False if it is still owned."""
+    now = dt.datetime.utcnow()
+    sql = text("""
+        UPDATE job_runs SET holder = :holder, lease_expires_at = :expires_at
+        WHERE id = :id AND status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < :now)
+        RETURNING id
+    """)
+    async with Session() as s:
+        row = (await s.execute(sql, {"id": run_id, "holder": holder, "now": now,
+                                     "expires_at": now + dt.timedelta(seconds=ttl_seconds)})).fetchone()
+        await s.commit()
+    return row is not None
+
+async def finish_job_run(run_id: int, status: str, error: str | None, duration_ms: int):
+    sql = text("""
+        UPDATE job_runs SET status = :status, error = :error, finished_at = :now, duration_ms = :duration_ms
+        WHERE id = :id
+    """)
+    async with Session() as s:
+        await s.execute(sql, {"id": run_id, "status": status, "error": error, "duration_ms": duration_ms,
+                              "now": dt.datetime.utcnow()})
+        await s.commit()
+
+async def recent_job_runs(limit: int = 20) -> List[Row]:
+    sql = text("""
+        SELECT job_name, scheduled_for, holder, status, error, started_at, finished_at, duration_ms
+        FROM job_runs ORDER BY id DESC LIMIT :limit
     """)
+    async with Session() as s:
+        return (await s.execute(sql, {"limit": limit})).fetchall()
+
+# Weakness feed order: newest first; at equal timestamps grammar before pronunciation, then id desc
+_WEAKNESS_SOURCES = (
+    # (type / events source, rank, result table, text column)
+    ("grammar", 0, "grammar_results", "input_text"),
+    ("pronunciation", 1, "phoneme_results", "ref_text"),
+)
+
+async def fetch_user_weaknesses(user_id: str, limit: int = 20, cursor: str | None = None) -> Dict[str, Any]:
+    """
+    One page of a user's results that have weakness categories, across both result tables.
+    Each source is paged with its own keyset query over weakness_events (at most limit+1
+    results) and the two sorted streams are merged here, so page cost does not grow with depth.
+    """
+    pos = decode_cursor(cursor) if cursor else None
+    if pos is not None:
+        try:
+            c_ts, c_rank, c_id = _ts_param(str(pos["ts"])), int(pos["rank"]), int(pos["id"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError("Invalid cursor") from e
+
+    streams = []
+    async with Session() as s:
+        for kind, rank, table, text_col in _WEAKNESS_SOURCES:
+            params: Dict[str, Any] = {"user_id": user_id, "source": kind, "limit": limit + 1}
+            bound = ""
+            if pos is not None:
+                params.update(c_ts=c_ts, c_id=c_id)
+                if rank == c_rank:
+                    bound = "AND (created_at, result_id) < (:c_ts, :c_id)"
+                elif rank < c_rank:
+                    bound = "AND created_at < :c_ts"        # its rows at c_ts were already served
+                else:
+                    bound = "AND created_at <= :c_ts"       # its rows at c_ts come after the cursor
+            sql = text(f"""
+                SELECT page.result_id AS id, page.created_at, r.{text_col} AS text, e.label
+                FROM (
+                    SELECT DISTINCT result_id, created_at FROM weakness_events
+                    WHERE user_id = :user_id AND source = :source AND kind = 'category' {bound}
+                    ORDER BY created_at DESC, result_id DESC
+                    LIMIT :limit
+                ) page
+                JOIN {table} r ON r.id = page.result_id
+                JOIN weakness_events e ON e.source = :source AND e.result_id = page.result_id AND e.kind = 'category'
+                ORDER BY page.created_at DESC, page.result_id DESC, e.id
+            """)
+            results: List[Dict[str, Any]] = []
+            for row in (await s.execute(sql, params)).fetchall():
+                if not results or results[-1]["id"] != row.id:
+                    results.append({"id": row.id, "created_at": row.created_at, "text": row.text, "categories": []})
+                results[-1]["categories"].append(row.label)
+            streams.append([(kind, rank, r) for r in results])
+
+    def _order(item):
+        _, rank, r = item
+        return (_ts_key(r["created_at"]), -rank, r["id"])
+
+    merged = list(heapq.merge(*streams, key=_order, reverse=True))
+    page = merged[:limit]
+    items = [
+        {"type": kind, "text": r["text"] or "", "categories": r["categories"], "created_at": _iso(r["created_at"])}
+        for kind, _, r in page
+    ]
+    next_cursor = None
+    if len(merged) > limit:
+        _, rank, last = page[-1]
+        next_cursor = encode_cursor({"ts": _ts_key(last["created_at"]), "rank": rank, "id": last["id"]})
+    return {"items": items, "next_cursor": next_cursor}
+
+async def fetch_user_weakness_summary(user_id: str, limit: int = 100) -> Dict[str, Any]:
+    """Weakness counts over the user's last `limit` results that have any (per source)."""
+    def _recent(source: str, kinds: str) -> str:
+        return f"""
+            SELECT result_id FROM weakness_events
+            WHERE user_id = :user_id AND source = '{source}' AND kind IN ({kinds})
+            GROUP BY result_id, created_at
+            ORDER BY created_at DESC, result_id DESC
+            LIMIT :limit
+        """
+    sql_grammar = text(f"""
+        SELECT label, COUNT(*) AS n FROM weakness_events
+        WHERE user_id = :user_id AND source = 'grammar' AND kind = 'category'
+          AND result_id IN ({_recent('grammar', "'category'")})
+        GROUP BY label
+        ORDER BY n DESC, label
+    """)
+    sql_pron = text(f"""
+        SELECT kind, label, COUNT(*) AS n FROM weakness_events
+        WHERE user_id = :user_id AND source = 'phone'
+          AND result_id IN ({_recent('phone', "'S', 'I', 'D'")})
+        GROUP BY kind, label
+        ORDER BY n DESC, label
+    """)
+
+    async with Session() as s:
+        params = {"user_id": user_id, "limit": limit}
+        grammar_rows = (await s.execute(sql_grammar, params)).fetchall()
+        pron_rows = (await s.execute(sql_pron, params)).fetchall()
 
-    grammar_counts = Counter()
-    subs = Counter()
-    ins = Counter()
-    dels = Counter()
-
-    async with Session() as s:
-        # Process grammar results
-        res_grammar = await s.execute(sql_grammar, {"user_id": user_id, "limit": limit})
-        for row in res_grammar.fetchall():
-            cats = json.loads(row.weakness_categories) if isinstance(row.weakness_categories, str) else row.weakness_categories
-            if cats: grammar_counts.update(cats)
-
-        # Process phoneme results
-        res_pron = await s.execute(sql_pron, {"user_id": user_id, "limit": limit})
-        for row in res_pron.fetchall():
-            ops = json.loads(row.ops_raw) if isinstance(row.ops_raw, str) else row.ops_raw
-            if not ops: continue
-
-            for op in ops:
-                if op["op"] == "S":
-                    subs[f"{op['g']} -> {op['p']}"] += 1
-                elif op["op"] == "D":
-                    if op['g'] != "'": # Ignore apostrophe deletions
-                        dels[op['g']] += 1
-                elif op["op"] == "I":
-                    if op['p'] != "'": # Ignore apostrophe insertions
-                        ins[op['p']] += 1
-
-    grammar_summary = [{"category": k, "count": v} for k, v in grammar_counts.most_common()]
-    top_substitutions = [{"pair": k, "count": v} for k, v in subs.most_common(3)]
-    top_insertions = [{"phoneme": k, "count": v} for k, v in ins.most_common(3)]
-    top_deletions = [{"phoneme": k, "count": v} for k, v in dels.most_common(3)]
+    def _top(kind: str, key: str) -> List[Dict[str, Any]]:
+        return [{key: r.label, "count": r.n} for r in pron_rows if r.kind == kind][:3]
 
     return {
         "pronunciation_summary": {
-            "most_common_substitutions": top_substitutions,
-            "most_common_insertions": top_insertions,
-            "most_common_deletions": top_deletions,
+            "most_common_substitutions": _top("S", "pair"),
+            "most_common_insertions": _top("I", "phoneme"),
+            "most_common_deletions": _top("D", "phoneme"),
         },
-        "grammar_summary": grammar_summary,
-    }
\ No newline at end of file
+        "grammar_summary": [{"category": r.label, "count": r.n} for r in grammar_rows],
+    }
@@ -9,13 +9,101 @@ class Settings(BaseSettings):
     # Inference configs
     WHISPER_SIZE: str = "tiny"
     GEC_MODEL_ID: str = "vennify/t5-base-grammar-correction"
+    GEC_BACKEND: str = "torch"                  # torch (fp32) | torch-int8 | onnx (needs optimum[onnxruntime])
+    GEC_ONNX_PATH: str = "app/gec_onnx"         # written by `python -m app.export_onnx gec`
+    # beam: always 4 beams | adaptive: greedy first, beams only for edits or low-confidence no-edits
+    GEC_DECODING: str = "beam"
+    GEC_GREEDY_MIN_LOGPROB: float = -0.2        # mean token log-prob to trust a greedy no-edit
+    GEC_TOKEN_RATIO: float = 1.5                # adaptive: max_new_tokens = ratio * input tokens + 8 (capped by the request)
+    # inputs over GEC_SENTENCE_MAX_WORDS words or the token budget are corrected sentence by sentence in one batch
+    # (max_new_tokens applies per sentence); shorter inputs take a single pass
+    GEC_SENTENCE_SPLIT: bool = True
+    GEC_SENTENCE_MAX_WORDS: int = 64            # run-on sentences are cut at this many words
     HUGGINGFACE_TOKEN: str | None = None
     OPENAI_API_KEY: str | None = None
+    OPENAI_BASE_URL: str | None = None          # e.g. a local stub server for tests
+    OPENAI_TIMEOUT_SECONDS: float = 8.0
+    OPENAI_CONNECT_TIMEOUT_SECONDS: float = 2.0
+    OPENAI_TRANSCRIBE_TIMEOUT_SECONDS: float = 30.0
+    OPENAI_MAX_RETRIES: int = 1
+    OPENAI_MAX_CONCURRENCY: int = 16
+    OPENAI_BREAKER_FAILURES: int = 5
+    OPENAI_BREAKER_RESET_SECONDS: float = 30.0
+
+    # Inference executors (threads per model, extra calls allowed to wait)
+    GEC_WORKERS: int = 1
+    GEC_MAX_QUEUE: int = 16
+    PHONEME_WORKERS: int = 1
+    PHONEME_MAX_QUEUE: int = 16
+    WHISPER_WORKERS: int = 1
+    WHISPER_MAX_QUEUE: int = 8
+    AUDIO_WORKERS: int = 2
+    AUDIO_MAX_QUEUE: int = 32
+
+    # GEC micro-batching
+    GEC_BATCH_MAX_SIZE: int = 8
+    GEC_BATCH_WINDOW_MS: float = 10.0
+
+    # wav2vec2 micro-batching (utterances whose lengths differ by more than the ratio run separately)
+    PHONEME_BATCH_MAX_SIZE: int = 8
+    PHONEME_BATCH_WINDOW_MS: float = 10.0
+    PHONEME_BUCKET_MAX_RATIO: float = 1.25
+
+    # Long recordings: energy-VAD windows of at most PHONEME_CHUNK_SECONDS (plus overlap on each side),
+    # PHONEME_BATCH_MAX_SIZE at a time, with the CTC logits stitched back together. 0 = one forward pass
+    PHONEME_CHUNK_SECONDS: float = 20.0
+    PHONEME_CHUNK_OVERLAP_SECONDS: float = 0.5
+    PHONEME_VAD_SILENCE_DB: float = -40.0       # frames this far below the loudest one count as pauses
+
+    # wav2vec2 inference backend: torch (fp32) | torch-int8 (dynamic int8 Linear) | onnx (needs onnxruntime)
+    PHONEME_BACKEND: str = "torch"
+    PHONEME_ONNX_PATH: str = "app/model/model.onnx"   # written by `python -m app.export_onnx phoneme`
+
+    # GEC result cache (in-process LRU in front of the gec_cache table)
+    GEC_CACHE_ENABLED: bool = True
+    GEC_CACHE_SIZE: int = 5000
+    GEC_CACHE_TTL_SECONDS: int = 3600
+    GEC_SENTENCE_CACHE_SIZE: int = 20000        # in-process model outputs per sentence, for split inputs
+
+    # Phoneme dedup cache (pred_phones per audio hash; full results come from phoneme_results)
+    PHONEME_CACHE_ENABLED: bool = True
+    PHONEME_CACHE_SIZE: int = 2000
+    PHONEME_CACHE_TTL_SECONDS: int = 3600
+    PHONEME_MODEL_REV: str | None = None   # override the fingerprint computed from app/model
+
+    # Background grammar categorization (LLM enrichment)
+    ENRICH_ENABLED: bool = True
+    ENRICH_BATCH_SIZE: int = 50
+    ENRICH_ITEMS_PER_CALL: int = 10
+    ENRICH_POLL_SECONDS: float = 5.0
+    ENRICH_CLAIM_TIMEOUT_SECONDS: int = 300
+    ENRICH_MAX_ATTEMPTS: int = 3            # LLM replies that may omit a row before it is stored uncategorized
 
     # Analytics
     ANALYTICS_CACHE_TTL_HOURS: int = 24
+    ANALYTICS_JOB_CONCURRENCY: int = 8      # users recomputed at once (each may make one LLM call)
+    ANALYTICS_JOB_BATCH_SIZE: int = 200     # users per batched read/upsert and checkpoint
+    ANALYTICS_MEMORY_CACHE_SIZE: int = 10000   # in-process rows in front of user_analytics_cache
+    ANALYTICS_MEMORY_TTL_SECONDS: int = 60
+    # Writes mark a user dirty; recompute once writes pause for DEBOUNCE, at most MAX_DELAY after the first
+    ANALYTICS_DIRTY_DEBOUNCE_SECONDS: int = 60
+    ANALYTICS_DIRTY_MAX_DELAY_SECONDS: int = 600
+    ANALYTICS_DIRTY_POLL_SECONDS: float = 15.0
+    # A failed refresh is retried after RETRY * 2^(failures - 1) s; after MAX_ATTEMPTS only the nightly pass retries
+    ANALYTICS_DIRTY_RETRY_SECONDS: int = 60
+    ANALYTICS_DIRTY_MAX_ATTEMPTS: int = 5
+    # A recompute reuses the stored headline unless its inputs changed and the last LLM insight is older than this
+    ANALYTICS_INSIGHT_MIN_INTERVAL_SECONDS: int = 3600
     TIMEZONE: str = "Asia/Colombo"
 
+    # Scheduled jobs run only in the process holding this DB lease
+    SCHEDULER_LEASE_SECONDS: int = 30
+
+    @property
+    def enrichment_active(self) -> bool:
+        """The enrichment worker only runs with an OpenAI key; without one nothing may be queued for it."""
+        return self.ENRICH_ENABLED and bool(self.OPENAI_API_KEY)
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,114 @@
+from __future__ import annotations
+import asyncio
+import datetime as dt
+from typing import Dict, List, Tuple
+
+from . import db, gec_cache, metrics
+from .deps import get_settings
+from .gec_cache import text_sha256
+from .utils_openai import categorize_grammar_errors
+
+# Background back-fill of grammar_results.weakness_categories. Requests save their row
+# as 'pending' and return immediately; this worker claims pending rows in batches,
+# reuses categories already known for the same correction, and sends the rest to the
+# LLM several edits per call.
+
+settings = get_settings()
+
+_backlog = metrics.gauge("enrichment_backlog")
+_lag = metrics.gauge("enrichment_lag_seconds")
+_processed = metrics.counter("enrichment_rows_processed")
+_llm_calls = metrics.counter("enrichment_llm_calls")
+_from_cache = metrics.counter("enrichment_categories_from_cache")
+_released = metrics.counter("enrichment_rows_released")
+_omitted = metrics.counter("enrichment_rows_omitted")
+_gave_up = metrics.counter("enrichment_rows_gave_up")
+
+async def refresh_backlog_metrics():
+    count, oldest = await db.grammar_enrichment_backlog()
+    _backlog.set(count)
+    _lag.set(round((dt.datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0.0)
+
+async def enrich_once() -> int:
+    """Process one batch of pending rows; returns how many rows were completed."""
+    rows = await db.claim_pending_grammar_rows(settings.ENRICH_BATCH_SIZE, stale_after_s=settings.ENRICH_CLAIM_TIMEOUT_SECONDS)
+    if not rows:
+        return 0
+
+    # Identical (input, correction) pairs share one categorization
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    attempts: Dict[int, int] = {}
+    for r in rows:
+        groups.setdefault((r.input_text, r.final_text), []).append(r.id)
+        attempts[r.id] = r.weakness_attempts or 0
+
+    resolved: Dict[Tuple[str, str], List[str]] = {}
+    todo: List[Tuple[str, str]] = []
+    for pair in groups:
+        cats = await db.find_cached_gec_categories(text_sha256(pair[0]), pair[1])
+        if cats is not None:
+            resolved[pair] = cats
+            _from_cache.inc()
+        else:
+            todo.append(pair)
+
+    failed_ids: List[int] = []
+    omitted_ids: List[int] = []
+    step = max(1, settings.ENRICH_ITEMS_PER_CALL)
+    for start in range(0, len(todo), step):
+        chunk = todo[start:start + step]
+        _llm_calls.inc()
+        try:
+            results = await categorize_grammar_errors(chunk)
+        except Exception as e:
+            # Unexpected reply: count it like an omission so a row that keeps breaking the call gives up
+            print(f"[WARN] Enrichment chunk of {len(chunk)} failed: {e}")
+            results = [None] * len(chunk)
+        if results is None:
+            for pair in chunk:
+                failed_ids.extend(groups[pair])
+            continue
+        for pair, cats in zip(chunk, results):
+            if cats is None:
+                # Left out of the reply: retry later, up to ENRICH_MAX_ATTEMPTS, then store it uncategorized
+                for i in groups[pair]:
+                    if attempts[i] + 1 >= settings.ENRICH_MAX_ATTEMPTS:
+                        resolved.setdefault(pair, [])
+                        _gave_up.inc()
+                    else:
+                        omitted_ids.append(i)
+                continue
+            resolved[pair] = cats
+            if cats:
+                try:
+                    await gec_cache.set_categories(pair[0], pair[1], cats)
+                except Exception as e:
+                    print(f"[WARN] Could not attach categories to the GEC cache: {e}")
+
+    omitted = set(omitted_ids)
+    updates = [
+        {"id": i, "weakness_categories": cats}
+        for pair, cats in resolved.items() for i in groups[pair] if i not in omitted
+    ]
+    await db.complete_grammar_enrichment(updates)
+    await db.release_grammar_rows(failed_ids)
+    await db.release_grammar_rows(omitted_ids, count_attempt=True)
+    _processed.inc(len(updates))
+    _released.inc(len(failed_ids) + len(omitted_ids))
+    _omitted.inc(len(omitted_ids))
+    return len(updates)
+
+async def run_forever():
+    print(f"[ENRICH] Grammar categorization worker started (batch={settings.ENRICH_BATCH_SIZE}, per_call={settings.ENRICH_ITEMS_PER_CALL}).")
+    while True:
+        try:
+            await refresh_backlog_metrics()
+            done = await enrich_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[WARN] Enrichment pass failed: {e}")
+            done = 0
+        # Keep draining while full batches come back; otherwise wait for new rows
+        if done < settings.ENRICH_BATCH_SIZE:
+            await asyncio.sleep(settings.ENRICH_POLL_SECONDS)
@@ -0,0 +1,77 @@
+"""
+Export models to ONNX for the onnx inference backends.
+
+    cd backend && python -m app.export_onnx phoneme [--out app/model/model.onnx]
+    cd backend && python -m app.export_onnx gec [--out app/gec_onnx]
+
+Needs torch and onnx at export time (plus optimum for gec), and onnxruntime to serve the result.
+"""
+from __future__ import annotations
+import argparse
+
+import torch
+from transformers import AutoFeatureExtractor, AutoModelForCTC
+
+from .deps import get_settings
+
+settings = get_settings()
+
+
+class _LogitsOnly(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_values, attention_mask=None):
+        return self.model(input_values=input_values, attention_mask=attention_mask).logits
+
+
+def export_phoneme(out_path: str, opset: int = 17):
+    """wav2vec2 CTC from app/model, fp32, dynamic batch and length."""
+    feat = AutoFeatureExtractor.from_pretrained("app/model")
+    model = AutoModelForCTC.from_pretrained("app/model", torch_dtype=torch.float32).eval()
+    with_mask = bool(getattr(feat, "return_attention_mask", True))
+
+    dummy = torch.zeros(1, 16000, dtype=torch.float32)
+    args = (dummy, torch.ones(1, 16000, dtype=torch.int64)) if with_mask else (dummy,)
+    names = ["input_values", "attention_mask"] if with_mask else ["input_values"]
+    axes = {n: {0: "batch", 1: "samples"} for n in names}
+    axes["logits"] = {0: "batch", 1: "frames"}
+    with torch.no_grad():
+        torch.onnx.export(
+            _LogitsOnly(model), args, out_path,
+            input_names=names, output_names=["logits"], dynamic_axes=axes,
+            opset_version=opset, do_constant_folding=True,
+        )
+    print(f"Exported phoneme model to {out_path} (inputs: {', '.join(names)})")
+
+
+def export_gec(out_dir: str):
+    """GEC_MODEL_ID as encoder + decoder (with past key/values) graphs, plus its tokenizer."""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer
+
+    token = settings.HUGGINGFACE_TOKEN or None
+    model = ORTModelForSeq2SeqLM.from_pretrained(settings.GEC_MODEL_ID, export=True, use_cache=True, token=token)
+    model.save_pretrained(out_dir)
+    AutoTokenizer.from_pretrained(settings.GEC_MODEL_ID, use_fast=True, token=token).save_pretrained(out_dir)
+    print(f"Exported {settings.GEC_MODEL_ID} to {out_dir}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="model", required=True)
+    ph = sub.add_parser("phoneme", help="wav2vec2 CTC model in app/model")
+    ph.add_argument("--out", default=settings.PHONEME_ONNX_PATH)
+    ph.add_argument("--opset", type=int, default=17)
+    gec = sub.add_parser("gec", help="GEC_MODEL_ID seq2seq model")
+    gec.add_argument("--out", default=settings.GEC_ONNX_PATH)
+    args = ap.parse_args()
+    if args.model == "phoneme":
+        export_phoneme(args.out, args.opset)
+    else:
+        export_gec(args.out)
+
+
+if __name__ == "__main__":
+    main()
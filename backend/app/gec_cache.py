@@ -0,0 +1,137 @@
+from __future__ import annotations
+import copy
+import hashlib
+import time
+import uuid
+from typing import Any, Dict, List
+
+from . import db, metrics
+from .cache import TTLCache
+from .deps import get_settings
+from .utils_gec import GUARDRAILS_VERSION, gec_model_rev
+
+# Two-tier cache for GEC results: in-process LRU+TTL in front of the gec_cache table.
+# Keys cover (normalized text, GEC_MODEL_ID + GEC_BACKEND + GEC_DECODING, guardrail set, sle_mode, max_new_tokens),
+# so a model, backend, decoding or rule change can never serve an old correction. Inputs corrected sentence by
+# sentence (inference.gec_sentence_spans) are keyed under SPLIT_REV, which adds the split settings.
+
+settings = get_settings()
+MODEL_REV = gec_model_rev(settings.GEC_MODEL_ID, settings.GEC_BACKEND, settings.GEC_DECODING)
+SPLIT_REV = f"{MODEL_REV}+split{settings.GEC_SENTENCE_MAX_WORDS}"
+_memory = TTLCache(maxsize=settings.GEC_CACHE_SIZE, ttl_seconds=settings.GEC_CACHE_TTL_SECONDS)
+# raw model output per sentence of split inputs, so an edited paragraph only re-runs the changed sentences
+_sentences = TTLCache(maxsize=settings.GEC_SENTENCE_CACHE_SIZE, ttl_seconds=settings.GEC_CACHE_TTL_SECONDS)
+
+_hits_memory = metrics.counter("gec_cache_hits_memory")
+_hits_db = metrics.counter("gec_cache_hits_db")
+_misses = metrics.counter("gec_cache_misses")
+_hit_rate = metrics.gauge("gec_cache_hit_rate")
+_sentence_hits = metrics.counter("gec_sentence_cache_hits")
+_sentence_misses = metrics.counter("gec_sentence_cache_misses")
+
+def normalize(text: str) -> str:
+    # GEC edits are indexed on str.split() tokens, so whitespace is the only safe thing to fold
+    return " ".join(text.split())
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+
+def cache_key(text: str, sle_mode: bool, max_new_tokens: int, split: bool = False) -> str:
+    parts = [SPLIT_REV if split else MODEL_REV, GUARDRAILS_VERSION, str(int(sle_mode)), str(max_new_tokens), text_sha256(text)]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def _update_hit_rate():
+    hits = _hits_memory.value + _hits_db.value
+    total = hits + _misses.value
+    _hit_rate.set(round(hits / total, 4) if total else None)
+
+def sentence_get(sentence: str, max_new_tokens: int) -> str | None:
+    if not settings.GEC_CACHE_ENABLED:
+        return None
+    raw = _sentences.get((normalize(sentence), max_new_tokens))
+    (_sentence_misses if raw is None else _sentence_hits).inc()
+    return raw
+
+def sentence_set(sentence: str, max_new_tokens: int, raw: str):
+    if settings.GEC_CACHE_ENABLED:
+        _sentences.set((normalize(sentence), max_new_tokens), raw)
+
+async def invalidate_stale():
+    """Remove persisted entries from other models/guardrail sets; called at startup."""
+    removed = await db.purge_gec_cache([MODEL_REV, SPLIT_REV], GUARDRAILS_VERSION)
+    if removed:
+        print(f"[GEC-CACHE] Purged {removed} entries from a previous model or guardrail set.")
+
+async def lookup(text: str, sle_mode: bool, return_edits: bool, max_new_tokens: int,
+                 split: bool = False) -> Dict[str, Any] | None:
+    """Return a full GEC response payload on a hit, else None."""
+    if not settings.GEC_CACHE_ENABLED:
+        return None
+    t0 = time.time()
+    key = cache_key(text, sle_mode, max_new_tokens, split)
+    entry = _memory.get(key)
+    source = "memory"
+    if entry is None:
+        entry = await db.get_gec_cache(key)
+        source = "db"
+        if entry is not None:
+            _memory.set(key, entry)
+    if entry is None:
+        _misses.inc()
+        _update_hit_rate()
+        return None
+    (_hits_memory if source == "memory" else _hits_db).inc()
+    _update_hit_rate()
+
+    payload = {
+        "id": f"utt_{uuid.uuid4().hex[:8]}",
+        "input": text,
+        "model": {"hf_id": settings.GEC_MODEL_ID, "device": "cpu", "backend": settings.GEC_BACKEND},
+        "gec": {
+            "raw_corrected": entry["raw_corrected"],
+            # copies: callers may mutate the payload, the entry stays shared in _memory
+            "edits": copy.deepcopy(entry["edits"]) if (return_edits or sle_mode) else [],
+            "final_text": entry["final_text"],
+        },
+        "guardrails": copy.deepcopy(entry["guardrails"]),
+        "metrics": {"latency_ms": int((time.time() - t0) * 1000), "cache": source},
+    }
+    if entry.get("weakness_categories") is not None:
+        payload["weakness_categories"] = list(entry["weakness_categories"])
+    return payload
+
+async def set_categories(text: str, final_text: str, categories: List[str]):
+    """Attach enrichment categories to cached corrections of (text, final_text), in the table and in memory."""
+    for key in await db.set_gec_cache_categories(text_sha256(text), final_text, categories):
+        # next hit reloads the row with its categories
+        _memory.pop(key)
+
+async def store(text: str, sle_mode: bool, return_edits: bool, max_new_tokens: int, result: Dict[str, Any],
+                split: bool = False):
+    # Without edits the payload is incomplete for other callers, so don't cache it
+    if not settings.GEC_CACHE_ENABLED or not (return_edits or sle_mode):
+        return
+    gec = result.get("gec") or {}
+    if gec.get("raw_corrected") is None or gec.get("final_text") is None:
+        return
+    key = cache_key(text, sle_mode, max_new_tokens, split)
+    entry = {
+        "raw_corrected": gec["raw_corrected"],
+        "final_text": gec["final_text"],
+        "edits": gec.get("edits") or [],
+        "guardrails": result.get("guardrails") or [],
+        "weakness_categories": result.get("weakness_categories"),
+    }
+    _memory.set(key, entry)
+    try:
+        await db.upsert_gec_cache({
+            "cache_key": key,
+            "text_sha256": text_sha256(text),
+            "model_id": SPLIT_REV if split else MODEL_REV,
+            "guardrails_version": GUARDRAILS_VERSION,
+            "sle_mode": bool(sle_mode),
+            "max_new_tokens": int(max_new_tokens),
+            **entry,
+        })
+    except Exception as e:
+        print(f"[WARN] GEC cache write failed: {e}")
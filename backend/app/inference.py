@@ -0,0 +1,227 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+from transformers import AutoTokenizer
+
+from . import gec_cache
+from .batching import MicroBatcher
+from .deps import get_settings
+from .utils_asr import transcribe_array
+from .utils_audio import decode_audio
+from .utils_gec import GEC, split_sentences
+from .utils_phone import (
+    is_long_recording, phoneme_logits, phoneme_logits_batch, pred_phones_from_logits, score_phonemes,
+)
+
+
+class InferencePool:
+    """
+    Bounded executor for one model. At most `workers` calls run at once and at most
+    `max_queue` more may wait; anything beyond that is rejected with a 503 so the
+    event loop never piles up blocking work.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"infer-{name}")
+        self._in_flight = 0  # only touched from the event loop thread
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self._in_flight >= self.workers + self.max_queue:
+            raise HTTPException(status_code=503, detail=f"{self.name} inference queue is full, retry later")
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers, "max_queue": self.max_queue, "in_flight": self._in_flight}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+settings = get_settings()
+
+POOLS: Dict[str, InferencePool] = {
+    "gec": InferencePool("gec", settings.GEC_WORKERS, settings.GEC_MAX_QUEUE),
+    "phoneme": InferencePool("phoneme", settings.PHONEME_WORKERS, settings.PHONEME_MAX_QUEUE),
+    "whisper": InferencePool("whisper", settings.WHISPER_WORKERS, settings.WHISPER_MAX_QUEUE),
+    "audio": InferencePool("audio", settings.AUDIO_WORKERS, settings.AUDIO_MAX_QUEUE),
+}
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    return {name: p.stats() for name, p in POOLS.items()}
+
+def shutdown_pools():
+    for p in POOLS.values():
+        p.shutdown()
+
+# ---- Lazy GEC loader (runs inside the GEC pool, so the first load never blocks the loop)
+_gec = None
+_gec_lock = threading.Lock()
+def get_gec() -> GEC:
+    global _gec
+    if _gec is None:
+        with _gec_lock:
+            if _gec is None:
+                _gec = GEC(settings.GEC_MODEL_ID, settings.HUGGINGFACE_TOKEN or None,
+                           backend=settings.GEC_BACKEND, onnx_path=settings.GEC_ONNX_PATH,
+                           decoding=settings.GEC_DECODING, min_greedy_logprob=settings.GEC_GREEDY_MIN_LOGPROB,
+                           token_ratio=settings.GEC_TOKEN_RATIO)
+    return _gec
+
+_gec_tokenizer = None
+def _get_gec_tokenizer():
+    """The GEC tokenizer on its own, so split decisions on cache lookups don't wait for the model."""
+    global _gec_tokenizer
+    if _gec is not None:
+        return _gec.tokenizer
+    if _gec_tokenizer is None:
+        with _gec_lock:
+            if _gec_tokenizer is None:
+                _gec_tokenizer = AutoTokenizer.from_pretrained(settings.GEC_MODEL_ID, use_fast=True,
+                                                               token=settings.HUGGINGFACE_TOKEN or None)
+    return _gec_tokenizer
+
+def _gec_correct_batch_sync(items: List[Tuple[str, int]]) -> List[str]:
+    """Correct (text, max_new_tokens) items; one `generate` call per distinct token budget."""
+    gec = get_gec()
+    out: List[str] = [""] * len(items)
+    groups: Dict[int, List[int]] = {}
+    for idx, (_, max_new) in enumerate(items):
+        groups.setdefault(max_new, []).append(idx)
+    for max_new, idxs in groups.items():
+        corrected = gec.correct_batch([items[i][0] for i in idxs], max_new_tokens=max_new)
+        for i, c in zip(idxs, corrected):
+            out[i] = c
+    return out
+
+async def _gec_process_batch(items: List[Tuple[str, int]]) -> List[str]:
+    return await POOLS["gec"].run(_gec_correct_batch_sync, items)
+
+gec_batcher = MicroBatcher(
+    "gec",
+    _gec_process_batch,
+    max_batch_size=settings.GEC_BATCH_MAX_SIZE,
+    max_wait_ms=settings.GEC_BATCH_WINDOW_MS,
+    concurrency=POOLS["gec"].workers,
+    max_queue=POOLS["gec"].max_queue,
+)
+
+# ---- wav2vec2 batching: concurrent utterances share padded forward passes
+def _phoneme_phones_batch_sync(waves: List[Any]) -> List[List[str]]:
+    logits = phoneme_logits_batch(waves, max_ratio=settings.PHONEME_BUCKET_MAX_RATIO)
+    return [pred_phones_from_logits(lg) for lg in logits]
+
+async def _phoneme_process_batch(waves: List[Any]) -> List[List[str]]:
+    return await POOLS["phoneme"].run(_phoneme_phones_batch_sync, waves)
+
+phoneme_batcher = MicroBatcher(
+    "phoneme",
+    _phoneme_process_batch,
+    max_batch_size=settings.PHONEME_BATCH_MAX_SIZE,
+    max_wait_ms=settings.PHONEME_BATCH_WINDOW_MS,
+    concurrency=POOLS["phoneme"].workers,
+    max_queue=POOLS["phoneme"].max_queue,
+)
+
+def _phoneme_phones_long_sync(wav: np.ndarray) -> List[str]:
+    return pred_phones_from_logits(phoneme_logits(wav))
+
+# ---- Async entry points used by the API handlers
+
+async def _gec_correct_sentences(sentences: List[str], max_new_tokens: int) -> List[str]:
+    """Raw model output per sentence; cached sentences are skipped, the rest go through the batcher together."""
+    raws: Dict[str, str] = {}
+    todo: List[str] = []
+    for s in sentences:
+        if s in raws or s in todo:
+            continue
+        hit = gec_cache.sentence_get(s, max_new_tokens)
+        if hit is None:
+            todo.append(s)
+        else:
+            raws[s] = hit
+    # at most one batch in flight per request, so a long paragraph cannot fill the queue on its own
+    step = gec_batcher.max_batch_size
+    for i in range(0, len(todo), step):
+        chunk = todo[i:i + step]
+        for s, raw in zip(chunk, await asyncio.gather(*(gec_batcher.submit((s, max_new_tokens)) for s in chunk))):
+            gec_cache.sentence_set(s, max_new_tokens, raw)
+            raws[s] = raw
+    return [raws[s] for s in sentences]
+
+async def gec_sentence_spans(text: str, max_new_tokens: int) -> List[Tuple[int, int]]:
+    """
+    Sentence spans to correct one by one, or [] for a single pass. Only inputs longer than
+    GEC_SENTENCE_MAX_WORDS words, or than the token budget (max_new_tokens, or what the
+    model reads), are split; short inputs keep their single-pass output and cache key.
+    """
+    if not settings.GEC_SENTENCE_SPLIT:
+        return []
+    if len(text.split()) <= settings.GEC_SENTENCE_MAX_WORDS:
+        if _gec is None and _gec_tokenizer is None:
+            await asyncio.to_thread(_get_gec_tokenizer)     # first call loads it off the loop
+        tokenizer = _get_gec_tokenizer()
+        n_tokens = len(tokenizer(text)["input_ids"])
+        if n_tokens <= max_new_tokens and n_tokens <= tokenizer.model_max_length:
+            return []
+    spans = split_sentences(text, settings.GEC_SENTENCE_MAX_WORDS)
+    return spans if len(spans) > 1 else []
+
+async def gec_respond(text: str, sle_mode: bool = True, return_edits: bool = True, max_new_tokens: int = 96,
+                      spans: List[Tuple[int, int]] | None = None) -> Dict[str, Any]:
+    """`spans`: gec_sentence_spans() output, if the caller already has it."""
+    t0 = time.time()
+    if spans is None:
+        spans = await gec_sentence_spans(text, max_new_tokens)
+    if not spans:
+        raw = await gec_batcher.submit((text, max_new_tokens))
+        segments = None
+    else:
+        # long inputs: per-sentence outputs, diffed per sentence and shifted back to offsets in `text`
+        toks = text.split()
+        sentences = [" ".join(toks[a:b]) for a, b in spans]
+        raws = await _gec_correct_sentences(sentences, max_new_tokens)
+        raw = " ".join(r for r in raws if r)
+        segments = [(a, s, r) for (a, _), s, r in zip(spans, sentences, raws)]
+    # Diffing and guardrails are cheap pure-Python work; no need to hop threads for them
+    return get_gec().respond(
+        text, sle_mode=sle_mode, return_edits=return_edits, max_new_tokens=max_new_tokens, raw=raw, started_at=t0,
+        segments=segments,
+    )
+
+async def phoneme_pred_phones(wav: np.ndarray) -> List[str]:
+    """`wav` is the mono 16 kHz buffer produced by `decode()`."""
+    if is_long_recording(len(wav)):
+        # windows of a long recording are batched among themselves, not with other requests
+        return await POOLS["phoneme"].run(_phoneme_phones_long_sync, wav)
+    return await phoneme_batcher.submit(wav)
+
+async def phoneme_rescore(pred_phones: List[str], ref_text: str | None = None) -> Dict[str, Any]:
+    """G2P + alignment only; no neural forward pass."""
+    return await POOLS["phoneme"].run(score_phonemes, pred_phones, ref_text=ref_text)
+
+async def transcribe(wav: np.ndarray, language: str = "en", model_size: str = "tiny"):
+    """`wav` is the mono 16 kHz buffer produced by `decode()`; no temp files involved."""
+    return await POOLS["whisper"].run(transcribe_array, wav, language=language, model_size=model_size)
+
+async def decode(audio: bytes) -> np.ndarray:
+    """Upload bytes -> mono 16 kHz float32, decoded once and shared by every consumer."""
+    return await POOLS["audio"].run(decode_audio, audio)
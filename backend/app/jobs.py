@@ -1,29 +1,163 @@
+from __future__ import annotations
+import asyncio
+import datetime as dt
+import time
+from typing import Any, Dict, List
 
-from . import db
-from .analytics import compute_last7d
-
-async def recompute_all_users_analytics():
-    # This is a placeholder. In a real app, you'd get a list of active users.
-    # For now, we'll just recompute for users we have recent results for.
-    print("Starting daily analytics recomputation...")
-    user_ids = set()
-    
-    # A more efficient way would be a single query to get distinct user IDs
-    # but this is fine for a small number of users.
-    phoneme_results = await db.get_phoneme_results_last_n_days(user_id="%", days=7) # Wildcard might not work, depends on DB
-    grammar_results = await db.get_grammar_results_last_n_days(user_id="%", days=7)
-
-    for r in phoneme_results:
-        user_ids.add(r.user_id)
-    for r in grammar_results:
-        user_ids.add(r.user_id)
-
-    print(f"Found {len(user_ids)} active users to recompute analytics for.")
-    for user_id in user_ids:
+from . import analytics_cache, db, leader, metrics
+from .analytics import WINDOW_DAYS, window_bounds, summarize_window, build_last7d
+from .deps import get_settings
+
+JOB_NAME = "recompute_analytics_7d"
+# job_runs name of the nightly run (main.py schedules it under this name)
+SCHEDULED_JOB = "recompute_all_users_analytics"
+
+settings = get_settings()
+
+_users_done = metrics.counter("analytics_job_users")
+_users_failed = metrics.counter("analytics_job_failures")
+_throughput = metrics.gauge("analytics_job_users_per_s")
+_dirty_refreshed = metrics.counter("analytics_dirty_refreshed")
+_dirty_backlog = metrics.gauge("analytics_dirty_backlog")
+_dirty_failed = metrics.counter("analytics_dirty_failures")
+
+async def _recompute_user(user_id: str, rows: List[Any], start_ts: dt.datetime, edge: Dict[str, Any] | None,
+                          previous: Any, sem: asyncio.Semaphore) -> Dict[str, Any] | None:
+    async with sem:
         try:
-            analytics_data = await compute_last7d(user_id)
-            await db.upsert_user_analytics_cache(analytics_data)
-            print(f"Successfully recomputed analytics for user: {user_id}")
+            return await build_last7d(user_id, summarize_window(rows, start_ts, edge), previous)
         except Exception as e:
             print(f"[ERROR] Failed to recompute analytics for user {user_id}: {e}")
-    print("Daily analytics recomputation finished.")
+            return None
+
+async def recompute_all_users_analytics(run_key: str | None = None):
+    """
+    Recompute the 7-day analytics cache for every user still marked dirty (written to
+    since their last recompute); run_dirty_refresher handles most of them during the day,
+    so this is a catch-up pass whose work scales with activity. Idle users are not
+    touched: their row expires after ANALYTICS_CACHE_TTL_HOURS and is refreshed on read.
+
+    Users go in user_id order, in batches: one read for the batch's daily rows,
+    bounded-concurrency recomputes (an LLM call where the insight inputs changed), one upsert. The last user_id of
+    each finished batch is checkpointed, so an interrupted run resumes after it.
+    """
+    run_key = run_key or dt.datetime.utcnow().date().isoformat()
+    cp = await db.get_job_checkpoint(JOB_NAME)
+    if cp is not None and cp.run_key == run_key and cp.finished_at is not None:
+        print(f"Daily analytics recomputation {run_key} already finished.")
+        return
+    if cp is not None and cp.run_key == run_key:
+        after, processed = cp.last_key, cp.processed
+        print(f"Resuming daily analytics recomputation {run_key} after user {after!r} ({processed} done).")
+    else:
+        await db.start_job_checkpoint(JOB_NAME, run_key)
+        after, processed = None, 0
+        print(f"Starting daily analytics recomputation {run_key}...")
+
+    start_ts, first_day = window_bounds(WINDOW_DAYS)
+    dirty = await db.get_dirty_users(after=after)
+    user_ids = [r.user_id for r in dirty]
+    seen_write = {r.user_id: r.last_write_at for r in dirty}
+    total = processed + len(user_ids)
+    print(f"Found {len(user_ids)} dirty users to recompute analytics for.")
+
+    sem = asyncio.Semaphore(max(1, settings.ANALYTICS_JOB_CONCURRENCY))
+    step = max(1, settings.ANALYTICS_JOB_BATCH_SIZE)
+    t0 = time.perf_counter()
+    done = failed = 0
+    for i in range(0, len(user_ids), step):
+        batch = user_ids[i:i + step]
+        rows = await db.get_user_daily_stats_many(batch, first_day)
+        edges = await db.get_partial_day_deltas(batch, start_ts, first_day)
+        previous = await db.get_user_analytics_cache_many(batch)
+        results = await asyncio.gather(*(_recompute_user(u, rows.get(u, []), start_ts, edges.get(u), previous.get(u), sem)
+                                         for u in batch))
+        payloads = [r for r in results if r is not None]
+        await db.upsert_user_analytics_cache_many(payloads)
+        await db.clear_analytics_dirty([(p["user_id"], seen_write[p["user_id"]]) for p in payloads])
+        for p in payloads:
+            analytics_cache.invalidate(p["user_id"])
+        await db.advance_job_checkpoint(JOB_NAME, batch[-1], processed + done + len(batch))
+
+        done += len(batch)
+        failed += len(batch) - len(payloads)
+        _users_done.inc(len(payloads))
+        _users_failed.inc(len(batch) - len(payloads))
+        rate = done / max(time.perf_counter() - t0, 1e-6)
+        _throughput.set(round(rate, 2))
+        print(f"[JOB] analytics {processed + done}/{total} users ({rate:.1f} users/s)")
+
+    await db.finish_job_checkpoint(JOB_NAME)
+    elapsed = time.perf_counter() - t0
+    print(f"Daily analytics recomputation finished: {done} users in {elapsed:.1f}s "
+          f"({done / max(elapsed, 1e-6):.1f} users/s), {failed} failed.")
+
+async def resume_unfinished():
+    """
+    Run on election: continue a recomputation that was interrupted (crash, redeploy, lost
+    lease). Its job_runs row is only taken over once the previous holder's lease expired.
+    """
+    try:
+        cp = await db.get_job_checkpoint(JOB_NAME)
+        if cp is not None and cp.finished_at is None:
+            await leader.resume_job(SCHEDULED_JOB, lambda: recompute_all_users_analytics(run_key=cp.run_key))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[WARN] Could not resume analytics recomputation: {e}")
+
+async def refresh_dirty_once() -> int:
+    """
+    Recompute users whose writes have settled (no write for the debounce period), or who
+    have waited longer than the max delay while writing continuously. Returns how many
+    were taken (refreshed or deferred). A failed user backs off exponentially; after ANALYTICS_DIRTY_MAX_ATTEMPTS failures it
+    waits for the nightly pass.
+    """
+    now = dt.datetime.utcnow()
+    due = await db.get_due_dirty_users(
+        quiet_before=now - dt.timedelta(seconds=settings.ANALYTICS_DIRTY_DEBOUNCE_SECONDS),
+        overdue_before=now - dt.timedelta(seconds=settings.ANALYTICS_DIRTY_MAX_DELAY_SECONDS),
+        limit=settings.ANALYTICS_JOB_BATCH_SIZE,
+        now=now,
+        max_attempts=settings.ANALYTICS_DIRTY_MAX_ATTEMPTS,
+    )
+    if not due:
+        return 0
+    sem = asyncio.Semaphore(max(1, settings.ANALYTICS_JOB_CONCURRENCY))
+
+    async def _one(row) -> tuple | None:
+        async with sem:
+            try:
+                await analytics_cache.refresh(row.user_id)
+                return (row.user_id, row.last_write_at)
+            except Exception as e:
+                print(f"[ERROR] Failed to refresh analytics for user {row.user_id}: {e}")
+                return None
+
+    results = await asyncio.gather(*(_one(r) for r in due))
+    done = [r for r in results if r is not None]
+    failed = [
+        (row.user_id, now + dt.timedelta(seconds=settings.ANALYTICS_DIRTY_RETRY_SECONDS * 2 ** row.attempts))
+        for row, r in zip(due, results) if r is None
+    ]
+    await db.clear_analytics_dirty(done)
+    await db.defer_analytics_dirty(failed)
+    _dirty_refreshed.inc(len(done))
+    _dirty_failed.inc(len(failed))
+    return len(due)
+
+async def run_dirty_refresher():
+    """Debounced recompute of dirty users; every worker runs the loop, only the leader acts."""
+    while True:
+        done = 0
+        try:
+            if leader.is_leader():
+                done = await refresh_dirty_once()
+                _dirty_backlog.set(await db.analytics_dirty_count())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[WARN] Dirty analytics refresh failed: {e}")
+        # Keep draining while full batches come back
+        if done < settings.ANALYTICS_JOB_BATCH_SIZE:
+            await asyncio.sleep(settings.ANALYTICS_DIRTY_POLL_SECONDS)
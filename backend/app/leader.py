@@ -0,0 +1,149 @@
+from __future__ import annotations
+import asyncio
+import datetime as dt
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, List, Set
+
+from . import db, metrics
+from .deps import get_settings
+
+# DB-backed leader lease for scheduled jobs. Every worker runs the scheduler, but a job
+# only executes in the process currently holding the "scheduler" lease. The leader renews
+# the lease every ttl/3; if it dies, another worker takes over once the lease expires.
+# job_runs is unique per (job, occurrence), so a hand-over mid-run cannot start the same
+# occurrence twice. Running jobs hold their own lease on their job_runs row, renewed with
+# the scheduler lease; a leader that fails to renew cancels every job it started, and a
+# new leader only resumes a run whose lease has expired.
+
+settings = get_settings()
+
+LEASE_NAME = "scheduler"
+HOLDER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_is_leader = False
+_on_elected: List[Callable[[], Awaitable[None]]] = []
+_tasks: Set[asyncio.Task] = set()
+
+_leader_gauge = metrics.gauge("scheduler_is_leader")
+_skipped = metrics.counter("scheduler_jobs_skipped")
+_cancelled = metrics.counter("scheduler_jobs_cancelled")
+
+def is_leader() -> bool:
+    return _is_leader
+
+def on_elected(fn: Callable[[], Awaitable[None]]):
+    """Register a coroutine function to run each time this process becomes leader."""
+    _on_elected.append(fn)
+    return fn
+
+def state() -> dict:
+    return {"holder": HOLDER, "leader": _is_leader, "tasks": len(_tasks)}
+
+def _track(task: asyncio.Task):
+    """Leader-owned work: cancelled as soon as this process stops holding the lease."""
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+def _cancel_tasks():
+    for task in list(_tasks):
+        if not task.done():
+            task.cancel()
+            _cancelled.inc()
+
+async def run_forever():
+    global _is_leader
+    interval = max(1.0, settings.SCHEDULER_LEASE_SECONDS / 3)
+    while True:
+        try:
+            held = await db.acquire_lease(LEASE_NAME, HOLDER, settings.SCHEDULER_LEASE_SECONDS)
+            if held:
+                await db.renew_job_runs(HOLDER, settings.SCHEDULER_LEASE_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # can't prove we still hold it, so act as if another worker already does
+            print(f"[WARN] Scheduler lease renewal failed: {e}")
+            held = False
+        if held and not _is_leader:
+            print(f"[LEADER] {HOLDER} is now the scheduler leader.")
+            _is_leader = True
+            for fn in _on_elected:
+                _track(asyncio.create_task(fn()))
+        elif not held and _is_leader:
+            print(f"[LEADER] {HOLDER} lost the scheduler lease; cancelling {len(_tasks)} job(s).")
+            _cancel_tasks()
+        _is_leader = held
+        _leader_gauge.set(int(held))
+        await asyncio.sleep(interval)
+
+async def release():
+    """Give the lease up on shutdown so another worker takes over without waiting for expiry."""
+    global _is_leader
+    if _is_leader:
+        _is_leader = False
+        _cancel_tasks()
+        try:
+            await db.release_lease(LEASE_NAME, HOLDER)
+        except Exception as e:
+            print(f"[WARN] Could not release scheduler lease: {e}")
+
+async def run_job(job_name: str, scheduled_for: str, fn: Callable[[], Awaitable[None]]):
+    """Run `fn` once for this occurrence and record it in job_runs."""
+    run_id = await db.start_job_run(job_name, scheduled_for, HOLDER, settings.SCHEDULER_LEASE_SECONDS)
+    if run_id is None:
+        _skipped.inc()
+        print(f"[JOB] {job_name} for {scheduled_for} already started elsewhere; skipping.")
+        return
+    await _execute(run_id, job_name, fn)
+
+async def resume_job(job_name: str, fn: Callable[[], Awaitable[None]]):
+    """
+    Continue work a previous run of `job_name` left unfinished (`fn` resumes from its own
+    checkpoint). A run still marked running is taken over only once its lease has expired,
+    i.e. its holder stopped renewing; until then this waits, so two copies never overlap.
+    """
+    while _is_leader:
+        run = await db.get_running_job_run(job_name)
+        if run is None:
+            # the interrupted run ended (failed, cancelled); resume under a new record
+            run_id = await db.start_job_run(job_name, f"resume:{dt.datetime.utcnow().isoformat()}", HOLDER,
+                                            settings.SCHEDULER_LEASE_SECONDS)
+        elif await db.take_over_job_run(run.id, HOLDER, settings.SCHEDULER_LEASE_SECONDS):
+            print(f"[JOB] Taking over {job_name} run {run.id} from {run.holder}.")
+            run_id = run.id
+        else:
+            await asyncio.sleep(max(1.0, settings.SCHEDULER_LEASE_SECONDS / 3))
+            continue
+        if run_id is not None:
+            await _execute(run_id, job_name, fn)
+        return
+
+async def _execute(run_id: int, job_name: str, fn: Callable[[], Awaitable[None]]):
+    t0 = time.perf_counter()
+    status, error = "ok", None
+    try:
+        await fn()
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except Exception as e:
+        status, error = "failed", str(e)[:500]
+        print(f"[ERROR] Scheduled job {job_name} failed: {e}")
+    finally:
+        await db.finish_job_run(run_id, status, error, int((time.perf_counter() - t0) * 1000))
+
+def scheduled(job_name: str, fn: Callable[[], Awaitable[None]]) -> Callable[[], Awaitable[None]]:
+    """Wrap a job for APScheduler so that only the leader runs it."""
+    async def _run():
+        if not _is_leader:
+            _skipped.inc()
+            return
+        # Occurrence key: the fire time to the minute (cron jobs here fire on whole minutes)
+        fired = dt.datetime.now(dt.timezone.utc).replace(second=0, microsecond=0)
+        _track(asyncio.current_task())
+        await run_job(job_name, fired.isoformat(), fn)
+    _run.__name__ = f"scheduled_{job_name}"
+    return _run
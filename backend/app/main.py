@@ -1,20 +1,27 @@
 from __future__ import annotations
+import asyncio
 import datetime as dt
 import json
-from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException, BackgroundTasks
+import time
+from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import pytz
 
 from .deps import get_settings
 from .schemas import HealthOut, GECSchemaOut, PhonemeOut, GECIn, UserResultsOut, AnalyticsOut, PaginatedWeaknessesOut, WeaknessSummaryOut
-from .utils_asr import transcribe_bytes, convert_audio_to_mono_wav
-from .utils_gec import GEC
-from .utils_phone import run_phoneme
 from . import db
-from .utils_openai import transcribe_audio_with_openai, categorize_grammar_error
-from .analytics import compute_last7d
-from .jobs import recompute_all_users_analytics
+from . import inference
+from . import metrics
+from . import gec_cache
+from . import phone_codec
+from . import phoneme_cache
+from . import enrichment
+from . import leader
+from . import analytics_cache
+from .utils_openai import transcribe_audio_with_openai, close_client, breaker_state
+from .jobs import SCHEDULED_JOB, recompute_all_users_analytics, resume_unfinished, run_dirty_refresher
+from .pipeline import StagePipeline
 
 app = FastAPI(title="Tiny Speech→GEC Backend", version="0.2.0")
 settings = get_settings()
@@ -25,11 +32,31 @@ MAX_FILE_SIZE = 10 * 1024 * 1024
 @app.on_event("startup")
 async def startup_event():
     await db.init_db()
-    # Scheduler for daily analytics job
+    await gec_cache.invalidate_stale()
+    if settings.enrichment_active:
+        app.state.enrichment_task = asyncio.create_task(enrichment.run_forever())
+    # Scheduler for daily analytics job; every worker schedules it, only the lease holder runs it
+    leader.on_elected(resume_unfinished)
+    app.state.leader_task = asyncio.create_task(leader.run_forever())
+    app.state.dirty_task = asyncio.create_task(run_dirty_refresher())
     scheduler = AsyncIOScheduler(timezone=pytz.timezone(settings.TIMEZONE))
-    scheduler.add_job(recompute_all_users_analytics, 'cron', hour=3, minute=0) 
+    scheduler.add_job(leader.scheduled(SCHEDULED_JOB, recompute_all_users_analytics), 'cron', hour=3, minute=0)
     scheduler.start()
-    print(f"Scheduler started. Daily analytics job scheduled for 03:00 {settings.TIMEZONE}.")
+    app.state.scheduler = scheduler
+    print(f"Scheduler started ({leader.HOLDER}). Daily analytics job scheduled for 03:00 {settings.TIMEZONE}.")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for name in ("enrichment_task", "leader_task", "dirty_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    scheduler = getattr(app.state, "scheduler", None)
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+    await leader.release()
+    inference.shutdown_pools()
+    await close_client()
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,27 +66,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ---- Lazy GEC loader
-_gec = None
-def get_gec() -> GEC:
-    global _gec
-    if _gec is None:
-        _gec = GEC(settings.GEC_MODEL_ID, settings.HUGGINGFACE_TOKEN or None)
-    return _gec
-
 @app.get("/health", response_model=HealthOut)
 async def health():
     return HealthOut(status="ok", asr_ready=True, gec_ready=True)
 
+@app.get("/metrics")
+async def get_metrics():
+    return {**metrics.snapshot(), "inference_pools": inference.pool_stats(), "openai_circuit": breaker_state(), "scheduler": leader.state()}
+
+@app.get("/jobs")
+async def get_job_runs(limit: int = Query(20, ge=1, le=200)):
+    """Recent scheduled-job runs (who ran them, status, duration)."""
+    rows = await db.recent_job_runs(limit=limit)
+    return {"scheduler": leader.state(), "runs": [
+        {**r._asdict(), "started_at": str(r.started_at), "finished_at": str(r.finished_at) if r.finished_at else None}
+        for r in rows
+    ]}
+
 # ---- Analytics Endpoints ----
 
+def _iso(v) -> str:
+    # SQLite hands timestamps back as strings, Postgres as datetimes
+    return v.isoformat() if hasattr(v, "isoformat") else str(v)
+
 def format_analytics_response(data) -> dict:
     # Convert SQLAlchemy row object to a dictionary for easier access
     data_dict = data._asdict()
     return {
         "user_id": data_dict["user_id"],
         "window": data_dict["window_label"],
-        "range": {"from_ts": data_dict["from_ts"].isoformat(), "to_ts": data_dict["to_ts"].isoformat()},
+        "range": {"from_ts": _iso(data_dict["from_ts"]), "to_ts": _iso(data_dict["to_ts"])},
         "attempts": {"phoneme": data_dict["attempts_phoneme"], "grammar": data_dict["attempts_grammar"]},
         "pronunciation": {
             "avg_per_sle": data_dict["per_sle_avg"],
@@ -74,39 +110,33 @@ def format_analytics_response(data) -> dict:
         },
         "badge": data_dict["badge"],
         "headline_msg": data_dict["headline_msg"],
-        "updated_at": data_dict["updated_at"].isoformat(),
-        "expires_at": data_dict["expires_at"].isoformat(),
+        "updated_at": _iso(data_dict["updated_at"]),
+        "expires_at": _iso(data_dict["expires_at"]),
     }
 
 @app.get("/analytics/{user_id}", response_model=AnalyticsOut)
 async def get_analytics(user_id: str, force: bool = False):
-    if not force:
-        cached_data = await db.get_user_analytics_cache(user_id)
-        if cached_data and cached_data.expires_at.replace(tzinfo=None) > dt.datetime.utcnow():
-            return format_analytics_response(cached_data)
-    
-    analytics_data = await compute_last7d(user_id)
-    await db.upsert_user_analytics_cache(analytics_data)
-    # Re-fetch from DB to get a consistent row object
-    newly_cached_data = await db.get_user_analytics_cache(user_id)
-    return format_analytics_response(newly_cached_data)
+    # Expired rows are served immediately and refreshed in the background
+    row = await (analytics_cache.refresh(user_id) if force else analytics_cache.get(user_id))
+    return format_analytics_response(row)
 
 @app.post("/analytics/{user_id}/recompute", response_model=AnalyticsOut)
-async def recompute_analytics(user_id: str, background_tasks: BackgroundTasks):
-    analytics_data = await compute_last7d(user_id)
-    background_tasks.add_task(db.upsert_user_analytics_cache, analytics_data)
-    return format_analytics_response(analytics_data)
+async def recompute_analytics(user_id: str):
+    return format_analytics_response(await analytics_cache.refresh(user_id))
 
 
 @app.get("/weakness/{user_id}", response_model=PaginatedWeaknessesOut)
 async def get_user_weaknesses(
     user_id: str, 
-    offset: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
 ):
-    """Fetches a paginated list of all weaknesses for a user."""
-    items = await db.fetch_user_weaknesses(user_id, offset=offset, limit=limit)
-    return PaginatedWeaknessesOut(items=items)
+    """Fetches a page of a user's weaknesses, newest first."""
+    try:
+        page = await db.fetch_user_weaknesses(user_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PaginatedWeaknessesOut(**page)
 
 
 @app.get("/weakness/summary/{user_id}", response_model=WeaknessSummaryOut)
@@ -118,22 +148,59 @@ async def get_weakness_summary(user_id: str, limit: int = Query(100, ge=10, le=1
 
 # ---- Grammar & Phoneme Endpoints ----
 
+async def correct_grammar(text: str, sle_mode: bool = True, return_edits: bool = True, max_new_tokens: int = 96) -> dict:
+    """
+    GEC served from the result cache when possible. Weakness categories are only present
+    when already known; otherwise the saved row is categorized by the enrichment worker.
+    """
+    # long inputs are corrected sentence by sentence, and cached under their own key
+    spans = await inference.gec_sentence_spans(text, max_new_tokens)
+    cached = await gec_cache.lookup(text, sle_mode, return_edits, max_new_tokens, split=bool(spans))
+    if cached is not None:
+        return cached
+
+    result = await inference.gec_respond(
+        text, sle_mode=sle_mode, return_edits=return_edits, max_new_tokens=max_new_tokens, spans=spans
+    )
+
+    await gec_cache.store(text, sle_mode, return_edits, max_new_tokens, result, split=bool(spans))
+    return result
+
+async def predict_phones(audio: bytes) -> tuple[list, str]:
+    """pred_phones for an upload (cache, else decode + batched forward pass) and its SHA-256."""
+    audio_sha = phoneme_cache.audio_sha256(audio)
+    _, pred_phones = await phoneme_cache.lookup(audio_sha, None)
+    if pred_phones is None:
+        wav = await inference.decode(audio)
+        pred_phones = await inference.phoneme_pred_phones(wav)
+        phoneme_cache.remember_phones(audio_sha, pred_phones)
+    return pred_phones, audio_sha
+
+async def score_pronunciation(audio: bytes, ref_text: str | None = None) -> tuple[dict, dict]:
+    """
+    Phoneme scoring with dedup on the upload's SHA-256. Returns the result and the
+    keyword arguments `db.save_phoneme_result` needs to record it.
+    """
+    audio_sha = phoneme_cache.audio_sha256(audio)
+    save_kwargs = {"audio_sha256": audio_sha, **phoneme_cache.revisions()}
+    cached, pred_phones = await phoneme_cache.lookup(audio_sha, ref_text)
+    if cached is not None:
+        return cached, save_kwargs
+    if pred_phones is None:
+        wav = await inference.decode(audio)
+        pred_phones = await inference.phoneme_pred_phones(wav)
+        phoneme_cache.remember_phones(audio_sha, pred_phones)
+    return await inference.phoneme_rescore(pred_phones, ref_text=ref_text), save_kwargs
+
 @app.post("/gec/correct", response_model=GECSchemaOut)
 async def gec_correct(payload: GECIn):
-    gec = get_gec()
-    result = gec.respond(
+    result = await correct_grammar(
         payload.text,
         sle_mode=payload.sle_mode,
         return_edits=payload.return_edits,
         max_new_tokens=payload.max_new_tokens,
     )
 
-    # Categorize grammar error
-    if result.get("gec") and result["gec"].get("final_text") and payload.text != result["gec"]["final_text"]:
-        categories = await categorize_grammar_error(payload.text, result["gec"]["final_text"])
-        if categories:
-            result["weakness_categories"] = categories
-
     await db.save_grammar_result(user_id=payload.user_id, input_text=payload.text, result=result)
     return result
 
@@ -144,16 +211,10 @@ async def gec_speech(
     return_edits: bool = True,
     user_id: str = Form(...),
 ):
-    gec = get_gec()
     audio = await file.read()
-    text, segs, info = transcribe_bytes(audio, language="en", model_size=settings.WHISPER_SIZE)
-    result = gec.respond(text, sle_mode=sle_mode, return_edits=return_edits)
-
-    # Categorize grammar error
-    if result.get("gec") and result["gec"].get("final_text") and text != result["gec"]["final_text"]:
-        categories = await categorize_grammar_error(text, result["gec"]["final_text"])
-        if categories:
-            result["weakness_categories"] = categories
+    wav = await inference.decode(audio)
+    text, segs, info = await inference.transcribe(wav, language="en", model_size=settings.WHISPER_SIZE)
+    result = await correct_grammar(text, sle_mode=sle_mode, return_edits=return_edits)
 
     await db.save_grammar_result(user_id=user_id, input_text=text, result=result)
     return result
@@ -165,14 +226,22 @@ async def phoneme_align(
     ref_text: str | None = Form(None),
 ):
     audio = await file.read()
-    converted_audio = convert_audio_to_mono_wav(audio)
-    result = run_phoneme(converted_audio, ref_text=ref_text)
-    await db.save_phoneme_result(user_id=user_id, audio_bytes=audio, result=result)
-    return result
+    result, save_kwargs = await score_pronunciation(audio, ref_text=ref_text)
+    await db.save_phoneme_result(user_id=user_id, audio_bytes=audio, result=result, **save_kwargs)
+    return phone_codec.render(result)
 
 @app.get("/user/{user_id}/results", response_model=UserResultsOut)
-async def get_user_results(user_id: str, limit: int = Query(50, ge=1, le=500)):
-    data = await db.fetch_user_results(user_id=user_id, limit=limit)
+async def get_user_results(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+):
+    try:
+        data = await db.fetch_user_results(user_id=user_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for p in data["phoneme"]:
+        p["ops_raw"] = phone_codec.describe_ops(p["ops_raw"])
     return UserResultsOut(user_id=user_id, **data)
 
 @app.post("/analyze/both")
@@ -183,44 +252,71 @@ async def analyze_both(
     sle_mode: bool = Form(True),
     return_edits: bool = Form(True),
 ):
-    gec = get_gec()
-
     audio = await file.read()
     if len(audio) > MAX_FILE_SIZE:
         raise HTTPException(status_code=413, detail=f"File size exceeds limit of {MAX_FILE_SIZE // 1024 // 1024}MB")
 
-    transcribed_text = None
-    if text is None:
-        transcribed_text = await transcribe_audio_with_openai(audio)
-        text_to_use = transcribed_text
-    else:
-        text_to_use = text
-
-    converted_audio = convert_audio_to_mono_wav(audio)
-    phoneme_result = run_phoneme(converted_audio, ref_text=text_to_use)
-    grammar_result = gec.respond(
-        text_to_use, sle_mode=sle_mode, return_edits=return_edits
+    # Stage graph: phoneme forward pass never waits on GEC, and with a supplied
+    # reference text nothing waits on transcription.
+    #   transcript ─┬─> grammar ──────────┐
+    #   phones ─────┴─> phoneme ──────────┴─> save
+    t0 = time.perf_counter()
+
+    async def _transcript():
+        if text is not None:
+            return text
+        return await transcribe_audio_with_openai(audio)
+
+    async def _phones():
+        if text is not None:
+            # Reference known up front: full scoring (incl. dedup cache) starts immediately
+            return await score_pronunciation(audio, ref_text=text)
+        return await predict_phones(audio)
+
+    async def _phoneme(transcript, phones):
+        if text is not None:
+            return phones
+        pred_phones, audio_sha = phones
+        result = await inference.phoneme_rescore(pred_phones, ref_text=transcript)
+        return result, {"audio_sha256": audio_sha, **phoneme_cache.revisions()}
+
+    async def _grammar(transcript):
+        return await correct_grammar(transcript, sle_mode=sle_mode, return_edits=return_edits)
+
+    async def _save(transcript, phoneme, grammar):
+        if not user_id:
+            return
+        phoneme_result, phoneme_save_kwargs = phoneme
+        saves = await asyncio.gather(
+            db.save_phoneme_result(user_id=user_id, audio_bytes=audio, result=phoneme_result, **phoneme_save_kwargs),
+            db.save_grammar_result(user_id=user_id, input_text=transcript, result=grammar),
+            return_exceptions=True,
+        )
+        for e in saves:
+            if isinstance(e, Exception):
+                print(f"[WARN] DB save failed: {e}")
+
+    pipeline = (
+        StagePipeline()
+        .add("transcript", _transcript)
+        .add("phones", _phones)
+        .add("phoneme", _phoneme, deps=["transcript", "phones"])
+        .add("grammar", _grammar, deps=["transcript"])
+        .add("save", _save, deps=["transcript", "phoneme", "grammar"])
     )
-
-    # Categorize grammar error
-    if grammar_result.get("gec") and grammar_result["gec"].get("final_text") and text_to_use != grammar_result["gec"]["final_text"]:
-        categories = await categorize_grammar_error(text_to_use, grammar_result["gec"]["final_text"])
-        if categories:
-            grammar_result["weakness_categories"] = categories
+    out = await pipeline.run()
+    text_to_use = out["transcript"]
+    transcribed_text = None if text is not None else text_to_use
+    phoneme_result, _ = out["phoneme"]
+    grammar_result = out["grammar"]
 
     # Simplify grammar output
     grammar_result.pop("id", None)
     grammar_result.pop("model", None)
     grammar_result.pop("metrics", None)
 
-    try:
-        if user_id:
-            await db.save_phoneme_result(user_id=user_id, audio_bytes=audio, result=phoneme_result)
-            await db.save_grammar_result(user_id=user_id, input_text=text_to_use, result=grammar_result)
-    except Exception as e:
-        print(f"[WARN] DB save failed: {e}")
-
     # Remove details block from phoneme result before returning
+    phone_codec.render(phoneme_result)
     if "details" in phoneme_result:
         del phoneme_result["details"]
 
@@ -228,4 +324,8 @@ async def analyze_both(
         "input": {"text": text_to_use, "has_audio": True, "transcribed_text": transcribed_text},
         "phoneme": phoneme_result,
         "grammar": grammar_result,
+        "metrics": {
+            "stages_ms": pipeline.timings_ms,
+            "total_ms": int((time.perf_counter() - t0) * 1000),
+        },
     }
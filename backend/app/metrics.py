@@ -0,0 +1,93 @@
+from __future__ import annotations
+import bisect
+import threading
+from typing import Any, Dict, List, Sequence
+
+# Simple in-process metrics, exposed as JSON on /metrics.
+# Values are per worker process; they reset on restart.
+
+_lock = threading.Lock()
+
+class Counter:
+    def __init__(self, name: str):
+        self.name = name
+        self.value = 0
+
+    def inc(self, n: int = 1):
+        with _lock:
+            self.value += n
+
+    def snapshot(self) -> int:
+        return self.value
+
+
+class Gauge:
+    def __init__(self, name: str):
+        self.name = name
+        self.value: float | None = None
+
+    def set(self, v: float | None):
+        self.value = v
+
+    def snapshot(self) -> float | None:
+        return self.value
+
+
+class Histogram:
+    """Fixed-bucket histogram; `buckets` are inclusive upper bounds, the last bucket is +Inf."""
+
+    def __init__(self, name: str, buckets: Sequence[float]):
+        self.name = name
+        self.buckets: List[float] = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, v: float):
+        idx = bisect.bisect_left(self.buckets, v)
+        with _lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += v
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"le_{b:g}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "avg": round(self.sum / self.count, 3) if self.count else None,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+_counters: Dict[str, Counter] = {}
+_gauges: Dict[str, Gauge] = {}
+_histograms: Dict[str, Histogram] = {}
+
+def counter(name: str) -> Counter:
+    with _lock:
+        if name not in _counters:
+            _counters[name] = Counter(name)
+        return _counters[name]
+
+def gauge(name: str) -> Gauge:
+    with _lock:
+        if name not in _gauges:
+            _gauges[name] = Gauge(name)
+        return _gauges[name]
+
+def histogram(name: str, buckets: Sequence[float]) -> Histogram:
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, buckets)
+        return _histograms[name]
+
+def snapshot() -> Dict[str, Any]:
+    return {
+        "counters": {k: c.snapshot() for k, c in sorted(_counters.items())},
+        "gauges": {k: g.snapshot() for k, g in sorted(_gauges.items())},
+        "histograms": {k: h.snapshot() for k, h in sorted(_histograms.items())},
+    }
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+WAIT_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 2500)
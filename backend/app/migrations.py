@@ -0,0 +1,132 @@
+from __future__ import annotations
+from typing import List, Tuple
+
+# Versioned schema changes applied by db.init_db after the base DDL. Each entry runs once
+# and is recorded in schema_migrations. Statements are idempotent (IF NOT EXISTS) so a
+# partially applied version can simply be retried.
+#
+# On Postgres, index builds use CONCURRENTLY (run outside a transaction) so large tables
+# stay writable while the index is created.
+#
+# Versions that also need a data step (backfills) register it in db._MIGRATION_HOOKS; it
+# runs after the version is recorded and must be safe to resume after a crash.
+#
+# (version, description, sqlite statements, postgres statements)
+Migration = Tuple[int, str, List[str], List[str]]
+
+# Partial-index predicates must match the query text in db.py term for term,
+# otherwise SQLite will not consider the index. Only v3 uses them; v10 drops its indexes.
+HAS_GRAMMAR_WEAKNESS = "weakness_categories IS NOT NULL AND weakness_categories != '[]' AND weakness_categories != 'null'"
+HAS_OPS = "ops_raw IS NOT NULL AND ops_raw != '[]' AND ops_raw != 'null'"
+
+MIGRATIONS: List[Migration] = [
+    (
+        1,
+        "grammar enrichment queue index",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_grammar_results_enrich ON grammar_results (weakness_status, id) "
+            "WHERE weakness_status IN ('pending', 'processing')",
+        ],
+        [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_grammar_results_enrich ON grammar_results (weakness_status, id) "
+            "WHERE weakness_status IN ('pending', 'processing')",
+        ],
+    ),
+    (
+        2,
+        "per-user time-ordered indexes",
+        [
+            # SQLite appends the rowid (= id) to every index entry, so these also order ties by id
+            "CREATE INDEX IF NOT EXISTS idx_phoneme_results_user_created ON phoneme_results (user_id, created_at DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_grammar_results_user_created ON grammar_results (user_id, created_at DESC)",
+        ],
+        [
+            # INCLUDE the small columns the analytics window reads, for index-only scans
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_phoneme_results_user_created "
+            "ON phoneme_results (user_id, created_at DESC, id DESC) INCLUDE (per_sle)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_grammar_results_user_created "
+            "ON grammar_results (user_id, created_at DESC, id DESC) INCLUDE (latency_ms)",
+        ],
+    ),
+    (
+        3,
+        "partial indexes for rows with weaknesses",
+        [
+            f"CREATE INDEX IF NOT EXISTS idx_grammar_results_user_weak ON grammar_results (user_id, created_at DESC) WHERE {HAS_GRAMMAR_WEAKNESS}",
+            f"CREATE INDEX IF NOT EXISTS idx_phoneme_results_user_weak ON phoneme_results (user_id, created_at DESC) WHERE {HAS_GRAMMAR_WEAKNESS}",
+            f"CREATE INDEX IF NOT EXISTS idx_phoneme_results_user_ops ON phoneme_results (user_id, created_at DESC) WHERE {HAS_OPS}",
+        ],
+        [
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_grammar_results_user_weak ON grammar_results (user_id, created_at DESC, id DESC) WHERE {HAS_GRAMMAR_WEAKNESS}",
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_phoneme_results_user_weak ON phoneme_results (user_id, created_at DESC, id DESC) WHERE {HAS_GRAMMAR_WEAKNESS}",
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_phoneme_results_user_ops ON phoneme_results (user_id, created_at DESC, id DESC) WHERE {HAS_OPS}",
+        ],
+    ),
+    (
+        4,
+        "user_daily_stats backfill",
+        # table comes from the base DDL; db.backfill_user_daily_stats does the work
+        [],
+        [],
+    ),
+    (
+        5,
+        "user_daily_stats quantile sketches backfill",
+        # columns come from the base DDL / ALTER list; db.backfill_daily_sketches does the work
+        [],
+        [],
+    ),
+    (
+        6,
+        "active-user index on user_daily_stats",
+        ["CREATE INDEX IF NOT EXISTS idx_user_daily_stats_day ON user_daily_stats (day, user_id)"],
+        ["CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_daily_stats_day ON user_daily_stats (day, user_id)"],
+    ),
+    (
+        7,
+        "weakness_events indexes",
+        [
+            # feed/summary scans: one user's events of one source and kind, newest first
+            "CREATE INDEX IF NOT EXISTS idx_weakness_events_user ON weakness_events (user_id, source, kind, created_at DESC, result_id DESC)",
+            # events of one result (feed join, backfill NOT EXISTS)
+            "CREATE INDEX IF NOT EXISTS idx_weakness_events_result ON weakness_events (source, result_id)",
+        ],
+        [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_weakness_events_user "
+            "ON weakness_events (user_id, source, kind, created_at DESC, result_id DESC) INCLUDE (label)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_weakness_events_result ON weakness_events (source, result_id)",
+        ],
+    ),
+    (
+        8,
+        "weakness_events backfill",
+        # table comes from the base DDL; db.backfill_weakness_events does the work
+        # (also runnable by hand: python -m app.backfill)
+        [],
+        [],
+    ),
+    (
+        9,
+        "compact phoneme alignment storage",
+        # alignment column comes from the base DDL / ALTER list. On SQLite the NOT NULL is
+        # relaxed by a table rebuild (db._SQLITE_SCHEMA_STEPS); db.compact_phoneme_alignments
+        # then re-encodes old rows
+        [],
+        ["ALTER TABLE phoneme_results ALTER COLUMN pred_phones DROP NOT NULL"],
+    ),
+    (
+        10,
+        "drop weakness partial indexes",
+        # weakness reads go through weakness_events since v7; nothing queries these predicates
+        [
+            "DROP INDEX IF EXISTS idx_grammar_results_user_weak",
+            "DROP INDEX IF EXISTS idx_phoneme_results_user_weak",
+            "DROP INDEX IF EXISTS idx_phoneme_results_user_ops",
+        ],
+        [
+            "DROP INDEX CONCURRENTLY IF EXISTS idx_grammar_results_user_weak",
+            "DROP INDEX CONCURRENTLY IF EXISTS idx_phoneme_results_user_weak",
+            "DROP INDEX CONCURRENTLY IF EXISTS idx_phoneme_results_user_ops",
+        ],
+    ),
+]
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import json
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+# Compact storage for a pronunciation alignment (phoneme_results.alignment), instead of
+# JSON phone lists and op dicts that each repeat g/p and an English description:
+#
+#   header   <BHHHH   version, n_pred, n_ref, n_ops, n_words  (ABSENT = field was None)
+#   pred     n_pred x uint8   vocab ids
+#   ref      n_ref  x uint8   vocab ids
+#   ops      n_ops  x <BHH    op code, i (gold index), j (pred index), g/p come from ref[i] / pred[j]
+#   words    n_words x <HB + utf-8   ops in the word, word length, word
+#
+# word_analysis assigns ops to words in order (utils_phone._map_phone_errors_to_words), so
+# a per-word op count is enough to rebuild it. Descriptions are rendered at response time.
+# Ids are persisted: vocab.json may only ever be appended to.
+
+VERSION = 1
+ABSENT = 0xFFFF
+MAX_LEN = ABSENT - 1
+
+_HEADER = struct.Struct("<BHHHH")
+_OP = struct.Struct("<BHH")
+_WORD = struct.Struct("<HB")
+
+_OP_CODES = {"S": 1, "I": 2, "D": 3}
+_CATEGORIES = {"S": "Substitution", "D": "Deletion", "I": "Insertion"}
+
+with open(Path(__file__).with_name("vocab.json"), "r", encoding="utf-8") as _f:
+    _vocab: Dict[str, int] = json.load(_f)
+SYMBOLS: Dict[int, str] = {i: s.upper() for s, i in _vocab.items()}
+IDS: Dict[str, int] = {s: i for i, s in SYMBOLS.items() if i < 256}
+_BY_ID: List[str | None] = [SYMBOLS.get(i) for i in range(256)]
+
+def _ids(phones: List[str] | None) -> bytes:
+    return bytes(IDS[p] for p in phones) if phones is not None else b""
+
+def _expected_op(op: Dict[str, Any], ref: List[str], pred: List[str]) -> Dict[str, Any]:
+    kind, i, j = op["op"], op["i"], op["j"]
+    return {
+        "op": kind,
+        "g": ref[i] if kind in ("S", "D") else None,
+        "p": pred[j] if kind in ("S", "I") else None,
+        "i": i,
+        "j": j,
+    }
+
+def encode(pred_phones: List[str], ref_phones: List[str] | None, ops: List[Dict[str, Any]] | None,
+           word_analysis: List[Dict[str, Any]] | None) -> bytes | None:
+    """Pack an alignment; None if it can't be stored losslessly (caller keeps the JSON columns)."""
+    try:
+        ref = ref_phones or []
+        if len(pred_phones) > MAX_LEN or len(ref) > MAX_LEN or len(ops or []) > MAX_LEN or len(word_analysis or []) > MAX_LEN:
+            return None
+        if ops and ref_phones is None:
+            return None
+        parts = [
+            _HEADER.pack(
+                VERSION, len(pred_phones),
+                ABSENT if ref_phones is None else len(ref),
+                ABSENT if ops is None else len(ops),
+                ABSENT if word_analysis is None else len(word_analysis),
+            ),
+            _ids(pred_phones),
+            _ids(ref_phones),
+        ]
+        for op in ops or []:
+            if {k: op.get(k) for k in ("op", "g", "p", "i", "j")} != _expected_op(op, ref, pred_phones):
+                return None
+            parts.append(_OP.pack(_OP_CODES[op["op"]], op["i"], op["j"]))
+
+        # word_analysis must be the ops split into consecutive runs, in order
+        consumed = 0
+        for w in word_analysis or []:
+            errors = w.get("phoneme_errors") or []
+            word = (w.get("word") or "").encode("utf-8")
+            if len(word) > 255 or [_strip(e) for e in errors] != [_strip(o) for o in (ops or [])[consumed:consumed + len(errors)]]:
+                return None
+            if w.get("weakness_categories") != _word_categories(errors):
+                return None
+            consumed += len(errors)
+            parts.append(_WORD.pack(len(errors), len(word)))
+            parts.append(word)
+        return b"".join(parts)
+    except (KeyError, IndexError, TypeError, struct.error):
+        return None
+
+def _word_categories(errors: List[Dict[str, Any]]) -> List[str]:
+    return sorted({_CATEGORIES[o["op"]] for o in errors})
+
+def _strip(op: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in op.items() if k != "description"}
+
+def decode(blob: bytes) -> Tuple[List[str], List[str] | None, List[Dict[str, Any]] | None, List[Dict[str, Any]] | None]:
+    """(pred_phones, ref_phones, ops, word_analysis) as stored by `encode`, without descriptions."""
+    blob = bytes(blob)
+    version, n_pred, n_ref, n_ops, n_words = _HEADER.unpack_from(blob, 0)
+    if version != VERSION:
+        raise ValueError(f"Unknown alignment encoding version {version}")
+    pos = _HEADER.size
+    by_id = _BY_ID
+    pred = [by_id[b] for b in blob[pos:pos + n_pred]]
+    pos += n_pred
+    ref = None
+    if n_ref != ABSENT:
+        ref = [by_id[b] for b in blob[pos:pos + n_ref]]
+        pos += n_ref
+
+    ops = None
+    if n_ops != ABSENT:
+        ops = []
+        for code, i, j in _OP.iter_unpack(blob[pos:pos + n_ops * _OP.size]):
+            if code == 1:
+                ops.append({"op": "S", "g": ref[i], "p": pred[j], "i": i, "j": j})
+            elif code == 3:
+                ops.append({"op": "D", "g": ref[i], "p": None, "i": i, "j": j})
+            else:
+                ops.append({"op": "I", "g": None, "p": pred[j], "i": i, "j": j})
+        pos += n_ops * _OP.size
+
+    words = None
+    if n_words != ABSENT:
+        words, consumed = [], 0
+        for _ in range(n_words):
+            n_err, n_bytes = _WORD.unpack_from(blob, pos)
+            pos += _WORD.size
+            word = blob[pos:pos + n_bytes].decode("utf-8")
+            pos += n_bytes
+            errors = ops[consumed:consumed + n_err] if n_err else []
+            consumed += n_err
+            words.append({
+                "word": word,
+                "phoneme_errors": errors,
+                "weakness_categories": _word_categories(errors),
+            })
+    return pred, ref, ops, words
+
+# --- Response-time rendering ---
+
+def describe(op: Dict[str, Any]) -> str:
+    if op["op"] == "S":
+        return f"Substitution: {op['g']} sound was replaced with {op['p']} sound"
+    if op["op"] == "D":
+        return f"Deletion: {op['g']} sound was deleted"
+    return f"Insertion: {op['p']} sound was inserted"
+
+def describe_ops(ops: List[Dict[str, Any]] | None) -> List[Dict[str, Any]] | None:
+    if ops is None:
+        return None
+    return [{**o, "description": describe(o)} for o in ops]
+
+def render(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Add op descriptions to a pronunciation result (fresh or stored) before returning it."""
+    for w in result.get("word_analysis") or []:
+        w["phoneme_errors"] = describe_ops(w.get("phoneme_errors") or [])
+    details = result.get("details")
+    if details and details.get("ops_after_rules") is not None:
+        details["ops_after_rules"] = describe_ops(details["ops_after_rules"])
+    return result
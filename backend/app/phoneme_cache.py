@@ -0,0 +1,83 @@
+from __future__ import annotations
+import hashlib
+from typing import Any, Dict, List, Tuple
+
+from . import db, metrics
+from .cache import TTLCache
+from .deps import get_settings
+from .utils_phone import norm_text, model_revision, rules_revision
+
+# Dedup for pronunciation scoring, keyed by the SHA-256 of the uploaded audio.
+#  - full hit:   same audio + same normalized ref_text + same model/guardrails -> stored result
+#  - phones hit: same audio + same model -> reuse pred_phones, redo only G2P + alignment
+
+settings = get_settings()
+_phones = TTLCache(maxsize=settings.PHONEME_CACHE_SIZE, ttl_seconds=settings.PHONEME_CACHE_TTL_SECONDS)
+
+_hits_full = metrics.counter("phoneme_cache_hits_full")
+_hits_phones = metrics.counter("phoneme_cache_hits_phones")
+_misses = metrics.counter("phoneme_cache_misses")
+
+def audio_sha256(audio: bytes) -> str:
+    return hashlib.sha256(audio).hexdigest()
+
+def revisions() -> Dict[str, str]:
+    return {"model_rev": settings.PHONEME_MODEL_REV or model_revision(), "rules_rev": rules_revision()}
+
+def _result_from_row(row) -> Dict[str, Any]:
+    alignment = db.phoneme_alignment(row)
+    pred_phones = alignment["pred_phones"] or []
+    return {
+        "pred_phones": pred_phones,
+        "phoneme_error_rate": row.per_sle,
+        "word_analysis": alignment["word_analysis"],
+        "weakness_categories": db.parse_json(row.weakness_categories),
+        "details": {
+            "ref_text": row.ref_text,
+            "pred_phones": pred_phones,
+            "ref_phones": alignment["ref_phones"],
+            "ops_after_rules": alignment["ops_raw"] or [],
+            "per_strict": row.per_strict,
+            "per_sle": row.per_sle,
+        },
+    }
+
+async def lookup(audio_sha: str, ref_text: str | None) -> Tuple[Dict[str, Any] | None, List[str] | None]:
+    """
+    Returns (full_result, pred_phones). A full result means nothing needs to run;
+    pred_phones alone means the forward pass can be skipped.
+    """
+    if not settings.PHONEME_CACHE_ENABLED:
+        return None, None
+    revs = revisions()
+    phones = _phones.get((audio_sha, revs["model_rev"]))
+    rows = []
+    # Stored results only help with a reference to match, or to recover phones after a restart
+    if ref_text or phones is None:
+        rows = await db.find_phoneme_results_by_audio(audio_sha, revs["model_rev"])
+
+    if ref_text:
+        norm_ref = norm_text(ref_text)
+        for row in rows:
+            if row.rules_rev == revs["rules_rev"] and row.ref_text and norm_text(row.ref_text) == norm_ref:
+                _hits_full.inc()
+                result = _result_from_row(row)
+                result["details"]["ref_text"] = ref_text
+                _phones.set((audio_sha, revs["model_rev"]), result["pred_phones"])
+                return result, result["pred_phones"]
+
+    if phones is None:
+        for row in rows:
+            phones = db.phoneme_alignment(row)["pred_phones"]
+            if phones is not None:
+                _phones.set((audio_sha, revs["model_rev"]), phones)
+                break
+    if phones is not None:
+        _hits_phones.inc()
+    else:
+        _misses.inc()
+    return None, phones
+
+def remember_phones(audio_sha: str, pred_phones: List[str]):
+    if settings.PHONEME_CACHE_ENABLED:
+        _phones.set((audio_sha, revisions()["model_rev"]), pred_phones)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+import json
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+from .sketch import DDSketch
+
+# Pure helpers for the user_daily_stats rollup: turning one saved result into a delta,
+# folding deltas into a stored day row, and merging day rows into a window.
+# db.py owns the SQL; analytics.py consumes merge_days().
+
+COUNT_FIELDS = ("phoneme_attempts", "per_sle_count", "grammar_attempts", "latency_count")
+SUM_FIELDS = ("per_sle_sum", "edits100_sum", "latency_sum")
+MAP_FIELDS = ("sub_pairs", "pron_weaknesses", "grammar_weaknesses")
+SKETCH_FIELDS = ("per_sketch", "latency_sketch")      # sketch.DDSketch.to_dict()
+
+def empty_day() -> Dict[str, Any]:
+    day: Dict[str, Any] = {f: 0 for f in COUNT_FIELDS}
+    day.update({f: 0.0 for f in SUM_FIELDS})
+    day.update({f: {} for f in MAP_FIELDS})
+    day.update({f: None for f in SKETCH_FIELDS})
+    return day
+
+def pick(delta: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    """A delta restricted to `fields` (backfills that only rebuild some columns)."""
+    d = empty_day()
+    d.update({f: delta[f] for f in fields})
+    return d
+
+def _load_map(v) -> Dict[str, int]:
+    if isinstance(v, str):
+        try:
+            v = json.loads(v)
+        except json.JSONDecodeError:
+            return {}
+    return dict(v) if isinstance(v, dict) else {}
+
+def _load_sketch(v) -> DDSketch | None:
+    if isinstance(v, str):
+        try:
+            v = json.loads(v)
+        except json.JSONDecodeError:
+            return None
+    return DDSketch.from_dict(v) if isinstance(v, dict) else None
+
+def phoneme_delta(per_sle: float | None, ops: Iterable[Dict[str, Any]] | None, weakness_categories: List[str] | None) -> Dict[str, Any]:
+    d = empty_day()
+    d["phoneme_attempts"] = 1
+    if per_sle is not None:
+        d["per_sle_count"] = 1
+        d["per_sle_sum"] = float(per_sle)
+        d["per_sketch"] = DDSketch().add(per_sle).to_dict()
+    subs = Counter(f"{op['g']}->{op['p']}" for op in (ops or []) if op.get("op") == "S" and op.get("g") and op.get("p"))
+    d["sub_pairs"] = dict(subs)
+    d["pron_weaknesses"] = dict(Counter(weakness_categories or []))
+    return d
+
+def grammar_delta(final_text: str | None, edits: List[Any] | None, latency_ms: int | None,
+                  weakness_categories: List[str] | None) -> Dict[str, Any]:
+    d = empty_day()
+    d["grammar_attempts"] = 1
+    words = max(1, len((final_text or "").split()))
+    d["edits100_sum"] = len(edits or []) * 100.0 / words
+    if latency_ms is not None:
+        d["latency_count"] = 1
+        d["latency_sum"] = float(latency_ms)
+        d["latency_sketch"] = DDSketch().add(latency_ms).to_dict()
+    d["grammar_weaknesses"] = dict(Counter(weakness_categories or []))
+    return d
+
+def grammar_weakness_delta(weakness_categories: List[str] | None) -> Dict[str, Any]:
+    """Late-arriving categories (enrichment worker) for an already counted grammar attempt."""
+    d = empty_day()
+    d["grammar_weaknesses"] = dict(Counter(weakness_categories or []))
+    return d
+
+def merge(into: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold `delta` into `into` (a stored row as a dict; JSON columns may still be strings)."""
+    out = dict(into)
+    for f in COUNT_FIELDS:
+        out[f] = int(out.get(f) or 0) + int(delta.get(f) or 0)
+    for f in SUM_FIELDS:
+        out[f] = float(out.get(f) or 0.0) + float(delta.get(f) or 0.0)
+    for f in MAP_FIELDS:
+        m = Counter(_load_map(out.get(f)))
+        m.update(_load_map(delta.get(f)))
+        out[f] = dict(m)
+    for f in SKETCH_FIELDS:
+        a, b = _load_sketch(out.get(f)), _load_sketch(delta.get(f))
+        merged = a.merge(b) if a and b else (a or b)
+        out[f] = merged.to_dict() if merged else None
+    return out
+
+def merge_days(rows: Iterable[Any]) -> Dict[str, Any]:
+    total = empty_day()
+    for r in rows:
+        total = merge(total, r._asdict() if hasattr(r, "_asdict") else r)
+    return total
+
+def quantile(day: Dict[str, Any], field: str, q: float) -> float | None:
+    sk = _load_sketch(day.get(field))
+    return sk.quantile(q) if sk else None
@@ -61,6 +61,7 @@ class UserResultsOut(BaseModel):
     user_id: str
     grammar: List[Dict[str, Any]]
     phoneme: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None   # pass back as ?cursor= for the next page; None = no more
 
 # --- Analytics ---
 
@@ -105,6 +106,7 @@ class WeaknessOut(BaseModel):
 
 class PaginatedWeaknessesOut(BaseModel):
     items: List[WeaknessOut]
+    next_cursor: Optional[str] = None
 
 # --- Weakness Summary ---
 
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import math
+from typing import Any, Dict, Iterable
+
+# DDSketch-style quantile sketch (Masson et al., VLDB 2019), stored per user per day in
+# user_daily_stats and merged to answer any window of days.
+#
+# Accuracy: values are counted in logarithmic buckets of ratio gamma = (1+a)/(1-a). For
+# every q, quantile(q) is within relative error `a` of the exact lower quantile
+# (numpy.quantile(values, q, method="lower")), however many values or sketches were
+# merged. Values <= ZERO_THRESHOLD (PER 0.0) are counted exactly in a separate bucket.
+# With a = 1%, PER (0..~300) and latencies (1 ms..10 min) need a few hundred buckets.
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+ZERO_THRESHOLD = 1e-9
+MAX_BINS = 2048
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min: float | None = None
+        self.max: float | None = None
+
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        # midpoint (in relative terms) of (gamma^(k-1), gamma^k]
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, n: int = 1) -> "DDSketch":
+        value = float(value)
+        if value <= ZERO_THRESHOLD:
+            self.zero_count += n
+        else:
+            k = self._key(value)
+            self.bins[k] = self.bins.get(k, 0) + n
+            if len(self.bins) > MAX_BINS:
+                self._collapse()
+        self.count += n
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def _collapse(self):
+        # Fold the lowest buckets together; only the smallest quantiles lose accuracy
+        keys = sorted(self.bins)
+        extra = keys[: len(keys) - MAX_BINS + 1]
+        self.bins[keys[len(extra)]] += sum(self.bins.pop(k) for k in extra)
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        if not math.isclose(other.relative_accuracy, self.relative_accuracy):
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for k, c in other.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + c
+        if len(self.bins) > MAX_BINS:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        for attr, pick in (("min", min), ("max", max)):
+            a, b = getattr(self, attr), getattr(other, attr)
+            setattr(self, attr, b if a is None else (a if b is None else pick(a, b)))
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        if not 0 <= q <= 1:
+            raise ValueError("q must be in [0, 1]")
+        rank = int(q * (self.count - 1))
+        if rank < self.zero_count:
+            return 0.0 if self.min is None or self.min <= ZERO_THRESHOLD else self.min
+        seen = self.zero_count
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            if seen > rank:
+                return min(max(self._value(k), self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "a": self.relative_accuracy,
+            "n": self.count,
+            "z": self.zero_count,
+            "min": self.min,
+            "max": self.max,
+            "b": {str(k): c for k, c in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any] | None) -> "DDSketch":
+        s = cls((d or {}).get("a", DEFAULT_RELATIVE_ACCURACY))
+        if d:
+            s.count = int(d.get("n", 0))
+            s.zero_count = int(d.get("z", 0))
+            s.min, s.max = d.get("min"), d.get("max")
+            s.bins = {int(k): int(c) for k, c in (d.get("b") or {}).items()}
+        return s
+
+    @classmethod
+    def of(cls, values: Iterable[float], relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> "DDSketch":
+        s = cls(relative_accuracy)
+        for v in values:
+            s.add(v)
+        return s
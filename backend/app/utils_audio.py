@@ -0,0 +1,82 @@
+from __future__ import annotations
+import io
+import subprocess
+from math import gcd
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+
+TARGET_SR = 16000
+
+def to_mono_16k(wav: np.ndarray, sr: int) -> np.ndarray:
+    """Ensure mono 16 kHz float32 using exact rational resampling."""
+    if wav.ndim > 1:
+        wav = wav.mean(axis=1)
+    if sr == TARGET_SR:
+        return wav.astype(np.float32, copy=False)
+    g = gcd(sr, TARGET_SR)
+    up, down = TARGET_SR // g, sr // g
+    return resample_poly(wav, up, down).astype(np.float32, copy=False)
+
+_FFMPEG_CMD = [
+    "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+    "-i", "pipe:0",
+    "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(TARGET_SR),
+    "pipe:1",
+]
+
+def _decode_ffmpeg(audio_bytes: bytes) -> np.ndarray:
+    # bytes in on stdin, raw float32 out on stdout; nothing touches the disk
+    proc = subprocess.run(_FFMPEG_CMD, input=audio_bytes, capture_output=True)
+    if proc.returncode != 0 or not proc.stdout:
+        raise ValueError(f"Could not decode audio: {proc.stderr.decode(errors='replace').strip()[:200]}")
+    return np.frombuffer(proc.stdout, dtype=np.float32)
+
+def decode_audio(audio_bytes: bytes) -> np.ndarray:
+    """
+    Decode an upload straight to a mono 16 kHz float32 buffer. Formats libsndfile
+    understands (WAV, FLAC, OGG, ...) are read in-process; anything else is piped
+    through ffmpeg, which does the downmix and resampling itself.
+    """
+    try:
+        y, sr = sf.read(io.BytesIO(audio_bytes), dtype="float32", always_2d=False)
+        y = to_mono_16k(y, int(sr))
+    except Exception:
+        y = _decode_ffmpeg(audio_bytes)
+    if not isinstance(y, np.ndarray) or y.size == 0:
+        raise ValueError("Invalid or empty audio.")
+    return y
+
+def vad_windows(y: np.ndarray, max_seconds: float, overlap_seconds: float = 0.5, frame: int = 320,
+                silence_db: float = -40.0, min_silence_ms: float = 200.0) -> list[tuple[int, int, int, int]]:
+    """
+    Cut a long mono 16 kHz buffer into windows of at most `max_seconds` plus `overlap_seconds`
+    of context on each side. Energy VAD: `frame`-sample frames more than `silence_db` below the
+    loudest one are quiet, and each cut goes in the middle of the longest pause of at least
+    `min_silence_ms` in the second half of the window (a hard cut at `max_seconds` if there is none).
+
+    Returns (start, end, keep_start, keep_end) sample offsets. The keep ranges tile the buffer
+    and every offset except the buffer end is a multiple of `frame`.
+    """
+    n = len(y)
+    max_f = max(1, int(max_seconds * TARGET_SR) // frame)
+    if n <= max_f * frame:
+        return [(0, n, 0, n)]
+    n_frames = n // frame
+    energy = np.square(y[: n_frames * frame].reshape(n_frames, frame), dtype=np.float64).mean(axis=1)
+    db = 10 * np.log10(energy + 1e-12)
+    quiet = np.concatenate(([0], (db < db.max() + silence_db).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(quiet))
+    starts, ends = edges[::2], edges[1::2]
+    long_enough = (ends - starts) * frame >= min_silence_ms * TARGET_SR / 1000
+    pauses = [(int(e - s), int(s + e) // 2) for s, e in zip(starts[long_enough], ends[long_enough])]
+
+    cuts = [0]
+    while n - cuts[-1] * frame > max_f * frame:
+        lo, hi = cuts[-1] + max_f // 2, cuts[-1] + max_f
+        best = max((p for p in pauses if lo < p[1] <= hi), default=None)
+        cuts.append(best[1] if best else hi)
+    overlap = -(-int(overlap_seconds * TARGET_SR) // frame) * frame
+    bounds = [c * frame for c in cuts] + [n]
+    return [(max(0, a - overlap), min(n, b + overlap), a, b) for a, b in zip(bounds, bounds[1:])]
@@ -1,7 +1,8 @@
 from __future__ import annotations
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 from typing import List, Dict, Any, Tuple
-import uuid, time, difflib, torch, re
+import uuid, time, difflib, torch, re, json, hashlib
+from . import metrics
 
 def _inflect_like(src_head: str, base: str) -> str:
     s = src_head.lower()
@@ -39,6 +40,9 @@ SLE_RULES = [
     ("SLE-PV-001", "cope up with", "suggest_review", "Frequent SLE usage; review before change", "PV", None),
 ]
 
+# Fingerprint of the rule set; cached corrections made under another rule set are discarded
+GUARDRAILS_VERSION = hashlib.sha256(json.dumps(SLE_RULES, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
 def _infl_regex(base: str) -> re.Pattern:
     """Match simple inflections on the first word: discuss(ed|es|ing) about"""
     base = base.strip().lower()
@@ -134,6 +138,34 @@ def build_token_diff_edits(src: str, hyp: str) -> List[Dict[str, Any]]:
         })
     return edits
 
+def build_segment_diff_edits(segments: List[Tuple[int, str, str]]) -> List[Dict[str, Any]]:
+    """build_token_diff_edits per (token offset, source, hypothesis) segment, spans shifted into the full text."""
+    edits: List[Dict[str, Any]] = []
+    for offset, src, hyp in segments:
+        for e in build_token_diff_edits(src, hyp):
+            e["span_src"]["start_tok"] += offset
+            e["span_src"]["end_tok"] += offset
+            edits.append(e)
+    return edits
+
+# --- sentence segmentation for long inputs (spans are over str.split() tokens, like the edits)
+_SENT_END_RE = re.compile(r"[.!?]+[\"'’”)\]]*$")
+_ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "vs.", "e.g.", "i.e.", "no."}
+
+def split_sentences(text: str, max_words: int = 64) -> List[Tuple[int, int]]:
+    """[start, end) token spans of text.split(), one per sentence; longer runs are cut every max_words."""
+    toks = text.split()
+    spans: List[Tuple[int, int]] = []
+    start = 0
+    for i, t in enumerate(toks):
+        ends = _SENT_END_RE.search(t) is not None and t.lower() not in _ABBREVIATIONS
+        if ends or i + 1 - start >= max_words:
+            spans.append((start, i + 1))
+            start = i + 1
+    if start < len(toks):
+        spans.append((start, len(toks)))
+    return spans
+
 # --- lightweight heuristics to label model edits when no guardrail applies
 _PUNCT_RE = re.compile(r"^[^\w\s]+$")
 _VERB_AUX = {"am","is","are","was","were","be","being","been","has","have","had","do","does","did"}
@@ -157,29 +189,133 @@ def _overlap(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
     return not (ea <= sb or eb <= sa)
 
 # ========= GEC wrapper =========
+GEC_BACKENDS = ("torch", "torch-int8", "onnx")
+GEC_DECODING = ("beam", "adaptive")
+NUM_BEAMS = 4
+
+# Which decoding path each sentence took
+_decode_beam = metrics.counter("gec_decode_beam")                          # GEC_DECODING=beam
+_decode_greedy = metrics.counter("gec_decode_greedy_accepted")             # adaptive: greedy kept
+_escalated_edit = metrics.counter("gec_decode_escalated_edit")             # adaptive: greedy proposed an edit
+_escalated_conf = metrics.counter("gec_decode_escalated_low_confidence")   # adaptive: no edit, but unsure
+
+def gec_model_rev(model_id: str, backend: str, decoding: str = "beam") -> str:
+    """Identity of the corrections a model + backend + decoding produce; cached corrections are tied to it."""
+    rev = model_id if backend == "torch" else f"{model_id}+{backend}"
+    return rev if decoding == "beam" else f"{rev}+{decoding}"
+
 class GEC:
-    def __init__(self, model_id: str, token: str | None = None):
+    def __init__(self, model_id: str, token: str | None = None, backend: str = "torch", onnx_path: str | None = None,
+                 decoding: str = "beam", min_greedy_logprob: float = -0.2, token_ratio: float = 1.5):
+        if backend not in GEC_BACKENDS:
+            raise ValueError(f"Unknown GEC_BACKEND {backend!r}, expected one of {GEC_BACKENDS}")
+        if decoding not in GEC_DECODING:
+            raise ValueError(f"Unknown GEC_DECODING {decoding!r}, expected one of {GEC_DECODING}")
         self.model_id = model_id
+        self.backend = backend
+        self.decoding = decoding
+        self.min_greedy_logprob = min_greedy_logprob
+        self.token_ratio = token_ratio
         self.tokenizer = AutoTokenizer.from_pretrained(model_id, use_fast=True, token=token)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_id, use_safetensors=False, token=token)
         self.device = torch.device("cpu")
-        self.model.to(self.device).eval()
+        if backend == "onnx":
+            # optional dependency; encoder + decoder-with-past graphs from `python -m app.export_onnx gec`,
+            # so each decoding step feeds back the cached keys/values instead of re-running the prefix
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+            self.model = ORTModelForSeq2SeqLM.from_pretrained(onnx_path, use_cache=True)
+        else:
+            self.model = AutoModelForSeq2SeqLM.from_pretrained(model_id, use_safetensors=False, token=token)
+            self.model.to(self.device).eval()
+            if backend == "torch-int8":
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
 
-    def _model_correct(self, text: str, max_new_tokens: int = 64) -> str:
-        inputs = self.tokenizer([text], return_tensors="pt", truncation=True, padding=True)
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+    def correct_batch(self, texts: List[str], max_new_tokens: int = 64) -> List[str]:
+        """Run one padded `generate` over several sentences; outputs keep input order."""
+        if not texts:
+            return []
+        if self.decoding == "adaptive":
+            return self._correct_adaptive(texts, max_new_tokens)
+        _decode_beam.inc(len(texts))
+        return self._correct_beam(self._tokenize(texts), texts, max_new_tokens)
+
+    def _tokenize(self, texts: List[str]) -> Dict[str, torch.Tensor]:
+        inputs = self.tokenizer(texts, return_tensors="pt", truncation=True, padding=True)
+        return {k: v.to(self.device) for k, v in inputs.items()}
+
+    def _correct_beam(self, inputs: Dict[str, torch.Tensor], texts: List[str], max_new_tokens: int) -> List[str]:
+        with torch.no_grad():
+            out = self.model.generate(
+                **inputs, do_sample=False, num_beams=NUM_BEAMS, max_new_tokens=max_new_tokens, early_stopping=True
+            )
+        decoded = self.tokenizer.batch_decode(out, skip_special_tokens=True)
+        return [d.strip() or t for d, t in zip(decoded, texts)]
+
+    def _token_budget(self, input_tokens: int, max_new_tokens: int) -> int:
+        # A correction is about as long as its input; the request's limit is only a ceiling
+        return min(max_new_tokens, max(8, int(input_tokens * self.token_ratio) + 8))
+
+    def _correct_adaptive(self, texts: List[str], max_new_tokens: int) -> List[str]:
+        """
+        Greedy first. A greedy output identical to the input (up to whitespace) whose mean
+        token log-prob is at least `min_greedy_logprob` is kept as a confident no-edit;
+        everything else is re-decoded with beam search, so edits always come from beams.
+        """
+        inputs = self._tokenize(texts)
+        lengths = inputs["attention_mask"].sum(dim=1).tolist()
         with torch.no_grad():
             out = self.model.generate(
-                **inputs, do_sample=False, num_beams=4, max_new_tokens=max_new_tokens, early_stopping=True
+                **inputs, do_sample=False, num_beams=1, output_scores=True, return_dict_in_generate=True,
+                max_new_tokens=max(self._token_budget(n, max_new_tokens) for n in lengths),
             )
-        return self.tokenizer.decode(out[0], skip_special_tokens=True).strip() or text
+            steps = self.model.compute_transition_scores(out.sequences, out.scores, normalize_logits=True)
+        generated = out.sequences[:, -steps.shape[1]:]
+        mask = (generated != self.tokenizer.pad_token_id).to(steps.dtype)
+        mean_logprob = ((steps * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)).tolist()
+        decoded = self.tokenizer.batch_decode(out.sequences, skip_special_tokens=True)
+
+        results: List[str | None] = [None] * len(texts)
+        escalate: List[int] = []
+        for i, (text, hyp, lp) in enumerate(zip(texts, decoded, mean_logprob)):
+            hyp = hyp.strip() or text
+            if hyp.split() != text.split():
+                _escalated_edit.inc()
+                escalate.append(i)
+            elif lp < self.min_greedy_logprob:
+                _escalated_conf.inc()
+                escalate.append(i)
+            else:
+                _decode_greedy.inc()
+                results[i] = hyp
+        if escalate:
+            sub = [texts[i] for i in escalate]
+            budget = max(self._token_budget(lengths[i], max_new_tokens) for i in escalate)
+            for i, hyp in zip(escalate, self._correct_beam(self._tokenize(sub), sub, budget)):
+                results[i] = hyp
+        return results
+
+    def _model_correct(self, text: str, max_new_tokens: int = 64) -> str:
+        return self.correct_batch([text], max_new_tokens=max_new_tokens)[0]
 
-    def respond(self, text: str, sle_mode: bool = True, return_edits: bool = True, max_new_tokens: int = 96):
-        t0 = time.time()
-        raw = self._model_correct(text, max_new_tokens=max_new_tokens)
+    def respond(self, text: str, sle_mode: bool = True, return_edits: bool = True, max_new_tokens: int = 96,
+                raw: str | None = None, started_at: float | None = None,
+                segments: List[Tuple[int, str, str]] | None = None):
+        """
+        Correct `text` and apply guardrails. Pass `raw` when the model output was already
+        produced elsewhere (e.g. by the batching queue); `started_at` lets latency include that time.
+        `segments` ((token offset, sentence, corrected sentence), as from split_sentences) makes
+        the model edits per-sentence diffs instead of one diff over the whole text.
+        """
+        t0 = started_at if started_at is not None else time.time()
+        if raw is None:
+            raw = self._model_correct(text, max_new_tokens=max_new_tokens)
 
         # 1) Model-proposed edits (diff)
-        model_edits = build_token_diff_edits(text, raw) if (return_edits or sle_mode) else []
+        if not (return_edits or sle_mode):
+            model_edits = []
+        elif segments:
+            model_edits = build_segment_diff_edits(segments)
+        else:
+            model_edits = build_token_diff_edits(text, raw)
 
         # 2) Guardrail hits
         hits = find_guardrail_hits(text) if sle_mode else []
@@ -248,7 +384,7 @@ class GEC:
         payload = {
             "id": f"utt_{uuid.uuid4().hex[:8]}",
             "input": text,
-            "model": {"hf_id": self.model_id, "device": "cpu"},
+            "model": {"hf_id": self.model_id, "device": "cpu", "backend": self.backend},
             "gec": {
                 "raw_corrected": raw,
                 "edits": edits,
@@ -1,23 +1,144 @@
 
 from __future__ import annotations
+import asyncio
+import time
 import openai
+import httpx
 import json
 from fastapi import HTTPException
 from .deps import get_settings
+from . import metrics
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive upstream failures;
+    open -> half-open after `reset_timeout` seconds, letting one probe call through;
+    the probe's outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+# ---- Shared client: one keep-alive connection pool per process
+
+_client: openai.AsyncOpenAI | None = None
+_settings = get_settings()
+_breaker = CircuitBreaker(_settings.OPENAI_BREAKER_FAILURES, _settings.OPENAI_BREAKER_RESET_SECONDS)
+_limiter = asyncio.Semaphore(_settings.OPENAI_MAX_CONCURRENCY)
+_short_circuited = metrics.counter("openai_short_circuited")
+_failures = metrics.counter("openai_failures")
+
+def get_client() -> openai.AsyncOpenAI:
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=_settings.OPENAI_MAX_CONCURRENCY,
+                max_keepalive_connections=_settings.OPENAI_MAX_CONCURRENCY,
+                keepalive_expiry=60.0,
+            ),
+            timeout=httpx.Timeout(_settings.OPENAI_TIMEOUT_SECONDS, connect=_settings.OPENAI_CONNECT_TIMEOUT_SECONDS),
+        )
+        _client = openai.AsyncOpenAI(
+            api_key=_settings.OPENAI_API_KEY,
+            base_url=_settings.OPENAI_BASE_URL or None,   # point at a local stub server in tests
+            http_client=http_client,
+            max_retries=_settings.OPENAI_MAX_RETRIES,
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+def breaker_state() -> str:
+    return _breaker.state
+
+def _is_upstream_failure(e: openai.APIError) -> bool:
+    # Timeouts, connection errors, 5xx and 429 mean the upstream is unhealthy; other 4xx are our fault
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code >= 500 or e.status_code == 429
+    return True
+
+async def _call(make_request):
+    """Run one upstream call behind the circuit breaker and the concurrency limiter."""
+    if not _breaker.allow():
+        _short_circuited.inc()
+        raise CircuitOpenError("OpenAI circuit is open")
+    try:
+        async with _limiter:
+            response = await make_request(get_client())
+    except openai.APIError as e:
+        if _is_upstream_failure(e):
+            _failures.inc()
+            _breaker.record_failure()
+        else:
+            _breaker.record_success()
+        raise
+    except BaseException:
+        # e.g. cancellation: don't leave a half-open probe stuck
+        _breaker.release_probe()
+        raise
+    _breaker.record_success()
+    return response
 
 async def transcribe_audio_with_openai(audio_bytes: bytes) -> str:
     settings = get_settings()
     if not settings.OPENAI_API_KEY:
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
 
-    client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-
     try:
-        response = await client.audio.transcriptions.create(
+        response = await _call(lambda client: client.audio.transcriptions.create(
             model="whisper-1",
             file=("audio.wav", audio_bytes),
-        )
+            timeout=settings.OPENAI_TRANSCRIBE_TIMEOUT_SECONDS,
+        ))
         return response.text
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="Transcription service temporarily unavailable")
     except openai.APIError as e:
         raise HTTPException(status_code=500, detail=f"OpenAI API error: {e}")
 
@@ -30,10 +151,8 @@ async def generate_insight_openai(payload: dict) -> dict | None:
     if not settings.OPENAI_API_KEY:
         return None # Optional feature, so don't raise an error
 
-    client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-
     try:
-        response = await client.chat.completions.create(
+        response = await _call(lambda client: client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
@@ -41,10 +160,9 @@ async def generate_insight_openai(payload: dict) -> dict | None:
             ],
             response_format={"type": "json_object"},
             temperature=0.7,
-            timeout=8.0,
-        )
+        ))
         return json.loads(response.choices[0].message.content)
-    except (openai.APIError, json.JSONDecodeError) as e:
+    except (openai.APIError, json.JSONDecodeError, CircuitOpenError) as e:
         print(f"[WARN] OpenAI insight generation failed: {e}")
         return None
 
@@ -58,34 +176,51 @@ GRAMMAR_TOPICS_PROMPT = """
 "countable and uncountable nouns", "confusable ex: accept vs except"
 """
 
-GRAMMAR_SYSTEM_PROMPT = f"""You are an expert English grammar teacher. Analyze the following change and categorize the grammatical error based on the user's final corrected text. Choose the most relevant category from the provided list. Your response must be a JSON object with a key 'categories' containing a list of the identified category strings.
+GRAMMAR_BATCH_SYSTEM_PROMPT = f"""You are an expert English grammar teacher. You will receive a JSON object with a list 'items'; each item has an 'id', the learner's 'original' text and the 'corrected' text. For every item, categorize the grammatical error(s) fixed by the correction, choosing the most relevant categories from the provided list. Your response must be a JSON object with a key 'results' containing one object per item: {{"id": <item id>, "categories": [<category strings>]}}.
 
 Available categories:
 {GRAMMAR_TOPICS_PROMPT}
 """
 
-async def categorize_grammar_error(original_text: str, corrected_text: str) -> list[str] | None:
+async def categorize_grammar_errors(pairs: list[tuple[str, str]]) -> list[list[str] | None] | None:
+    """
+    Categorize several (original, corrected) pairs in one LLM call. Returns one entry per
+    pair (None where the model gave nothing back), or None if the call itself failed.
+    """
     settings = get_settings()
-    if not settings.OPENAI_API_KEY:
+    if not settings.OPENAI_API_KEY or not pairs:
         return None
 
-    client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-
-    user_prompt = f"Original: {original_text}\nCorrected: {corrected_text}"
+    items = [{"id": i, "original": o, "corrected": c} for i, (o, c) in enumerate(pairs)]
 
     try:
-        response = await client.chat.completions.create(
+        response = await _call(lambda client: client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": GRAMMAR_SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
+                {"role": "system", "content": GRAMMAR_BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps({"items": items})}
             ],
             response_format={"type": "json_object"},
             temperature=0.2,
-            timeout=8.0,
-        )
+        ))
         result = json.loads(response.choices[0].message.content)
-        return result.get("categories", [])
+    except CircuitOpenError:
+        return None
     except (openai.APIError, json.JSONDecodeError) as e:
-        print(f"[WARN] OpenAI grammar categorization failed: {e}")
+        print(f"[WARN] OpenAI batch grammar categorization failed: {e}")
+        return None
+    if not isinstance(result, dict):
+        print(f"[WARN] OpenAI batch grammar categorization returned {type(result).__name__}, expected an object")
         return None
+
+    out: list[list[str] | None] = [None] * len(pairs)
+    replies = result.get("results")
+    for r in replies if isinstance(replies, list) else []:
+        try:
+            idx = int(r.get("id"))
+        except (TypeError, ValueError, AttributeError):
+            continue
+        cats = r.get("categories")
+        if 0 <= idx < len(pairs) and isinstance(cats, list):
+            out[idx] = [str(c) for c in cats]
+    return out
@@ -1,14 +1,15 @@
 from __future__ import annotations
-import io, json
+import json, threading, hashlib, os
+from types import SimpleNamespace
 from typing import List, Dict, Any, Tuple
 import numpy as np
-import soundfile as sf
-from scipy.signal import resample_poly
 import torch
-from transformers import AutoFeatureExtractor, AutoModelForCTC
+from transformers import AutoConfig, AutoFeatureExtractor, AutoModelForCTC
 from g2p_en import G2p
 from rapidfuzz.distance import Levenshtein as L
 from unidecode import unidecode
+from .deps import get_settings
+from .utils_audio import decode_audio, vad_windows
 import re, inflect
 NUM = inflect.engine()
 
@@ -30,6 +31,7 @@ _id2sym: Dict[int, str] | None = None
 _rules = None
 _g2p = None
 _blank_id: int | None = None
+_load_lock = threading.Lock()
 
 # utils_phone.py (add near imports)
 def _ensure_nltk_data():
@@ -60,14 +62,64 @@ def _infer_blank_id(model_cfg, id2sym: Dict[int, str]) -> int:
     return 0
 
 
+PHONEME_BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+class _OnnxCTC:
+    """wav2vec2 CTC graph exported by `python -m app.export_onnx phoneme`, run on ONNX Runtime."""
+
+    def __init__(self, path: str, config):
+        import onnxruntime as ort   # optional dependency, only for PHONEME_BACKEND=onnx
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.config = config
+        if getattr(config, "add_adapter", False):
+            raise ValueError("ONNX phoneme backend does not support adapter layers")
+
+    def __call__(self, input_values: torch.Tensor, attention_mask: torch.Tensor | None = None):
+        feeds = {"input_values": input_values.numpy()}
+        if attention_mask is not None and "attention_mask" in self.input_names:
+            feeds["attention_mask"] = attention_mask.numpy().astype(np.int64)
+        (logits,) = self.session.run(["logits"], feeds)
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def _get_feat_extract_output_lengths(self, lengths: torch.Tensor) -> torch.Tensor:
+        # Same as the HF model: each conv layer maps L -> floor((L - kernel) / stride) + 1
+        for kernel, stride in zip(self.config.conv_kernel, self.config.conv_stride):
+            lengths = torch.div(lengths - kernel, stride, rounding_mode="floor") + 1
+        return lengths
+
+
+def _load_ctc_model(backend: str):
+    """The CTC model for PHONEME_BACKEND: fp32 PyTorch, dynamic int8 Linear layers, or ONNX Runtime."""
+    if backend not in PHONEME_BACKENDS:
+        raise ValueError(f"Unknown PHONEME_BACKEND {backend!r}, expected one of {PHONEME_BACKENDS}")
+    if backend == "onnx":
+        return _OnnxCTC(get_settings().PHONEME_ONNX_PATH, AutoConfig.from_pretrained("app/model"))
+    model = AutoModelForCTC.from_pretrained("app/model", torch_dtype=torch.float32).to(DEVICE).eval()
+    if backend == "torch-int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
 def _load_once():
+    # _g2p is assigned last, so once it is set every other singleton is ready
+    if _g2p is not None:
+        return _model, _feat, _id2sym, _rules, _pron_guardrails, _g2p, _blank_id
+    with _load_lock:
+        return _load_locked()
+
+
+def _load_locked():
     global _model, _feat, _id2sym, _rules, _pron_guardrails, _g2p, _blank_id
-    if _model is not None:
+    if _g2p is not None:
         return _model, _feat, _id2sym, _rules, _pron_guardrails, _g2p, _blank_id
 
     # Feature extractor & model from local folder
     _feat = AutoFeatureExtractor.from_pretrained("app/model")   # uses preprocessor_config.json
-    _model = AutoModelForCTC.from_pretrained("app/model", torch_dtype=torch.float32).to(DEVICE).eval()
+    _model = _load_ctc_model(get_settings().PHONEME_BACKEND)
 
     # Invert vocab: symbol->id  ==>  id(int)->symbol(str, UPPER)
     with open("app/vocab.json", "r", encoding="utf-8") as f:
@@ -101,16 +153,48 @@ def _load_once():
     return _model, _feat, _id2sym, _rules, _pron_guardrails, _g2p, _blank_id
 
 
-def _to_mono_16k(wav: np.ndarray, sr: int) -> np.ndarray:
-    """Ensure mono 16 kHz float32 using exact rational resampling."""
-    if wav.ndim > 1:
-        wav = wav.mean(axis=1)
-    if sr == 16000:
-        return wav.astype(np.float32, copy=False)
-    from math import gcd
-    g = gcd(sr, 16000)
-    up, down = 16000 // g, sr // g
-    return resample_poly(wav, up, down).astype(np.float32, copy=False)
+def _file_digest(h, path: str):
+    try:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    except FileNotFoundError:
+        h.update(b"-")
+
+
+_model_rev: str | None = None
+_rules_rev: str | None = None
+
+def model_revision() -> str:
+    """Fingerprint of the CTC model (config, vocab, weight size, backend); cached predictions are tied to it."""
+    global _model_rev
+    if _model_rev is None:
+        h = hashlib.sha256()
+        backend = get_settings().PHONEME_BACKEND
+        if backend != "torch":
+            # quantized / exported graphs decode slightly differently from fp32
+            h.update(f"backend:{backend}".encode())
+            if backend == "onnx":
+                _file_digest(h, get_settings().PHONEME_ONNX_PATH)
+        s = get_settings()
+        if s.PHONEME_CHUNK_SECONDS > 0:
+            # long recordings are decoded window by window
+            h.update(f"chunk:{s.PHONEME_CHUNK_SECONDS}:{s.PHONEME_CHUNK_OVERLAP_SECONDS}:{s.PHONEME_VAD_SILENCE_DB}".encode())
+        for path in ("app/model/config.json", "app/model/preprocessor_config.json", "app/vocab.json"):
+            _file_digest(h, path)
+        for weights in ("app/model/model.safetensors", "app/model/pytorch_model.bin"):
+            if os.path.exists(weights):
+                h.update(f"{weights}:{os.path.getsize(weights)}".encode())
+        _model_rev = h.hexdigest()[:16]
+    return _model_rev
+
+def rules_revision() -> str:
+    """Fingerprint of the pronunciation guardrails; cached scores are tied to it."""
+    global _rules_rev
+    if _rules_rev is None:
+        h = hashlib.sha256()
+        _file_digest(h, "app/pronunciation_guardrails.json")
+        _rules_rev = h.hexdigest()[:16]
+    return _rules_rev
 
 
 def _decode_ids(ids: List[int], id2sym: Dict[int, str], blank_id: int) -> List[str]:
@@ -173,18 +257,15 @@ def _g2p_word_level(norm_text: str, g2p: G2p) -> List[Dict[str, Any]]:
 
 
 def _align_ops(gold: List[str], pred: List[str]) -> List[Dict[str, Any]]:
-    """Levenshtein ops with readable symbols & indices."""
+    """Levenshtein ops with readable symbols & indices (descriptions: phone_codec.describe)."""
     ops: List[Dict[str, Any]] = []
     for op, i, j in L.editops(gold, pred):
             if op == "replace":
-                description = f"Substitution: {gold[i]} sound was replaced with {pred[j]} sound"
-                ops.append({"op": "S", "g": gold[i], "p": pred[j], "i": i, "j": j, "description": description})
+                ops.append({"op": "S", "g": gold[i], "p": pred[j], "i": i, "j": j})
             elif op == "delete":
-                description = f"Deletion: {gold[i]} sound was deleted"
-                ops.append({"op": "D", "g": gold[i], "p": None,    "i": i, "j": j, "description": description})
+                ops.append({"op": "D", "g": gold[i], "p": None,    "i": i, "j": j})
             elif op == "insert":
-                description = f"Insertion: {pred[j]} sound was inserted"
-                ops.append({"op": "I", "g": None,    "p": pred[j], "i": i, "j": j, "description": description})
+                ops.append({"op": "I", "g": None,    "p": pred[j], "i": i, "j": j})
     return ops
 
 
@@ -226,25 +307,92 @@ def _apply_pronunciation_guardrails(ops: List[Dict[str, Any]], guardrails_json:
 
 
 
-def run_phoneme(file_bytes: bytes, ref_text: str | None = None) -> Dict[str, Any]:
-    model, feat, id2sym, rules, pron_guardrails, g2p, blank_id = _load_once()
+def bucket_by_length(lengths: List[int], max_ratio: float = 1.25) -> List[List[int]]:
+    """
+    Group indices so that within a group the longest item is at most `max_ratio` times
+    the shortest. Keeps padding waste per batch under (max_ratio - 1).
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    groups: List[List[int]] = []
+    for i in order:
+        if groups and lengths[i] <= max_ratio * max(1, lengths[groups[-1][0]]):
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+    return groups
+
 
-    # Read & resample audio
-    buf = file_bytes if isinstance(file_bytes, (bytes, bytearray)) else file_bytes.read()
-    y, sr = sf.read(io.BytesIO(buf), dtype="float32", always_2d=False)
-    if not isinstance(y, np.ndarray) or y.size == 0:
-        raise ValueError("Invalid or empty audio.")
-    y = _to_mono_16k(y, int(sr))
+def phoneme_logits_batch(waves: List[np.ndarray], max_ratio: float = 1.25) -> List[torch.Tensor]:
+    """
+    CTC logits for several mono 16 kHz utterances. Utterances of similar length share one
+    padded forward pass; each result is sliced back to its own frame count ([T_i, vocab]).
+    Models whose extractor takes no attention mask would see the zero padding as audio,
+    so those run one utterance per pass.
+    """
+    model, feat, *_ = _load_once()
+    out: List[torch.Tensor | None] = [None] * len(waves)
+    if getattr(feat, "return_attention_mask", True):
+        groups = bucket_by_length([len(w) for w in waves], max_ratio=max_ratio)
+    else:
+        groups = [[i] for i in range(len(waves))]
+    for group in groups:
+        batch = [waves[i] for i in group]
+        with torch.no_grad():
+            inputs = feat(batch, sampling_rate=16000, padding=True, return_attention_mask=True, return_tensors="pt")
+            if not getattr(feat, "return_attention_mask", True):
+                inputs.pop("attention_mask", None)
+            for k in inputs:
+                inputs[k] = inputs[k].to(DEVICE)
+            logits = model(**inputs).logits.cpu()   # [B, T, vocab]
+            n_frames = model._get_feat_extract_output_lengths(torch.tensor([len(w) for w in batch]))
+        for row, i in enumerate(group):
+            out[i] = logits[row, : int(n_frames[row])]
+    return out
 
-    # Forward pass
-    with torch.no_grad():
-        inputs = feat(y, sampling_rate=16000, return_tensors="pt")
-        for k in inputs:
-            inputs[k] = inputs[k].to(DEVICE)
-        logits = model(**inputs).logits[0].cpu()   # [T, vocab]
-        ids = logits.argmax(dim=-1).tolist()      # greedy
 
-    pred_phones = _decode_ids(ids, id2sym, int(blank_id))
+def is_long_recording(n_samples: int) -> bool:
+    chunk = get_settings().PHONEME_CHUNK_SECONDS
+    return chunk > 0 and n_samples > chunk * 16000
+
+
+def phoneme_logits_long(y: np.ndarray, max_seconds: float, overlap_seconds: float = 0.5, batch_size: int = 8,
+                        max_ratio: float = 1.25, silence_db: float = -40.0) -> torch.Tensor:
+    """
+    CTC logits ([T, vocab]) for a recording of any length with bounded memory. The audio is cut
+    into VAD windows (see vad_windows), `batch_size` windows share a forward pass, and each window
+    contributes only the frames of its own keep range, so the overlap is context, never output.
+    """
+    model, *_ = _load_once()
+    stride = int(np.prod(model.config.conv_stride))   # samples per logit frame
+    windows = vad_windows(y, max_seconds, overlap_seconds, frame=stride, silence_db=silence_db)
+    parts: List[torch.Tensor] = []
+    for i in range(0, len(windows), batch_size):
+        group = windows[i:i + batch_size]
+        logits = phoneme_logits_batch([y[a:b] for a, b, _, _ in group], max_ratio=max_ratio)
+        for (a, _, keep_a, keep_b), lg in zip(group, logits):
+            parts.append(lg[(keep_a - a) // stride: -(-(keep_b - a) // stride)])
+    return torch.cat(parts)
+
+
+def phoneme_logits(y: np.ndarray) -> torch.Tensor:
+    """CTC logits for one buffer: one forward pass, or stitched windows for long recordings."""
+    s = get_settings()
+    if not is_long_recording(len(y)):
+        return phoneme_logits_batch([y])[0]
+    return phoneme_logits_long(y, s.PHONEME_CHUNK_SECONDS, s.PHONEME_CHUNK_OVERLAP_SECONDS,
+                               batch_size=s.PHONEME_BATCH_MAX_SIZE, max_ratio=s.PHONEME_BUCKET_MAX_RATIO,
+                               silence_db=s.PHONEME_VAD_SILENCE_DB)
+
+
+def pred_phones_from_logits(logits: torch.Tensor) -> List[str]:
+    _, _, id2sym, _, _, _, blank_id = _load_once()
+    ids = logits.argmax(dim=-1).tolist()      # greedy
+    return _decode_ids(ids, id2sym, int(blank_id))
+
+
+def score_phonemes(pred_phones: List[str], ref_text: str | None = None) -> Dict[str, Any]:
+    """Align predicted phones against the reference text's G2P phones and score them."""
+    _, _, _, _, pron_guardrails, g2p, _ = _load_once()
     out: Dict[str, Any] = {"pred_phones": pred_phones}
 
     if ref_text:
@@ -255,7 +403,7 @@ def run_phoneme(file_bytes: bytes, ref_text: str | None = None) -> Dict[str, Any
         ops = _align_ops(gold_phones, pred_phones)
         denom = max(1, len(gold_phones))
         per_strict = 100.0 * sum(1 for o in ops if o["op"] in ("S", "I", "D")) / denom
-        kept, dropped = _apply_pronunciation_guardrails(ops, _pron_guardrails)
+        kept, dropped = _apply_pronunciation_guardrails(ops, pron_guardrails)
         per_sle = 100.0 * sum(1 for o in kept if o["op"] in ("S", "I", "D")) / denom
 
         word_analysis, overall_weaknesses = _analyze_word_level(norm_ref.split(), words_and_phones, kept)
@@ -276,6 +424,13 @@ def run_phoneme(file_bytes: bytes, ref_text: str | None = None) -> Dict[str, Any
     return out
 
 
+def run_phoneme(audio: bytes | np.ndarray, ref_text: str | None = None) -> Dict[str, Any]:
+    """Score raw upload bytes or an already-decoded mono 16 kHz buffer."""
+    y = audio if isinstance(audio, np.ndarray) else decode_audio(audio)
+    logits = phoneme_logits(y)
+    return score_phonemes(pred_phones_from_logits(logits), ref_text=ref_text)
+
+
 def _map_phone_errors_to_words(words_and_phones: List[Dict[str, Any]], phone_errors: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
     """Distributes phone errors back to word indices."""
     word_errors = {i: [] for i in range(len(words_and_phones))}
@@ -0,0 +1,111 @@
+"""
+Parity test and latency/throughput comparison for the GEC backends
+(GEC_BACKEND = torch | torch-int8 | onnx) on a regression corpus.
+
+    cd backend && python -m bench.bench_gec_backends
+    cd backend && python -m bench.bench_gec_backends --corpus bench/data/gec_regression.txt --backends torch torch-int8
+    cd backend && python -m bench.bench_gec_backends --decoding adaptive
+
+The corpus has one sentence per line. Each backend runs in its own process. For every
+sentence the full path (generate + GEC.respond guardrails) is timed at batch size 1
+after one warm-up call; final_text must match the fp32 torch backend exactly. The
+reference is always fp32 with 4-beam decoding; --decoding applies to the other runs, and
+with --decoding adaptive the fp32 backend is run a second time as "torch/adaptive".
+
+Reported per backend: generated tokens/s, p50 / p99 latency, load time, and the number of
+sentences whose final_text differs from fp32 (listed below the table). Exits with status 1
+if any backend has more than --max-mismatches differences.
+"""
+from __future__ import annotations
+import argparse
+import multiprocessing as mp
+import os
+import statistics
+import sys
+import time
+
+def _pct(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def _run_backend(backend: str, decoding: str, sentences: list, max_new_tokens: int) -> dict:
+    os.environ["GEC_BACKEND"] = backend
+    from app import metrics
+    from app.deps import get_settings
+    get_settings.cache_clear()
+    from app.utils_gec import GEC
+
+    settings = get_settings()
+    t0 = time.perf_counter()
+    gec = GEC(settings.GEC_MODEL_ID, settings.HUGGINGFACE_TOKEN or None, backend=backend, onnx_path=settings.GEC_ONNX_PATH,
+              decoding=decoding, min_greedy_logprob=settings.GEC_GREEDY_MIN_LOGPROB, token_ratio=settings.GEC_TOKEN_RATIO)
+    load_s = time.perf_counter() - t0
+
+    gec.correct_batch([sentences[0]], max_new_tokens=max_new_tokens)   # warm-up
+    latencies, tokens, finals = [], 0, []
+    for text in sentences:
+        t0 = time.perf_counter()
+        raw = gec.correct_batch([text], max_new_tokens=max_new_tokens)[0]
+        final = gec.respond(text, raw=raw)["gec"]["final_text"]
+        latencies.append((time.perf_counter() - t0) * 1000)
+        tokens += len(gec.tokenizer(raw).input_ids)
+        finals.append(final)
+    paths = {k[len("gec_decode_"):]: v for k, v in metrics.snapshot()["counters"].items() if k.startswith("gec_decode_")}
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "tokens_per_s": tokens / (sum(latencies) / 1000),
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": _pct(latencies, 0.99),
+        "finals": finals,
+        "paths": paths,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", default=os.path.join(os.path.dirname(__file__), "data", "gec_regression.txt"))
+    ap.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"])
+    ap.add_argument("--max-new-tokens", type=int, default=96)
+    ap.add_argument("--max-mismatches", type=int, default=0)
+    ap.add_argument("--decoding", choices=["beam", "adaptive"], default="beam")
+    args = ap.parse_args()
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()]
+    # fp32 beam is the reference
+    runs = [("torch", "torch", "beam")]
+    if args.decoding != "beam":
+        runs.append((f"torch/{args.decoding}", "torch", args.decoding))
+    runs += [(b, b, args.decoding) for b in args.backends if b != "torch"]
+    ctx = mp.get_context("spawn")
+    results = {}
+    for label, backend, decoding in runs:
+        with ctx.Pool(1) as pool:
+            try:
+                results[label] = pool.apply(_run_backend, (backend, decoding, sentences, args.max_new_tokens))
+            except Exception as e:
+                print(f"[WARN] backend {label} failed: {e}")
+
+    if "torch" not in results:
+        print("fp32 reference backend failed; nothing to compare against.")
+        sys.exit(2)
+    ref = results["torch"]["finals"]
+    print(f"{len(sentences)} sentences from {args.corpus}")
+    print(f"{'backend':>16} {'tokens/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'load s':>7} {'mismatch':>9}  decode paths")
+    failed, diffs = [], []
+    for backend, r in results.items():
+        bad = [i for i, (a, b) in enumerate(zip(r["finals"], ref)) if a != b]
+        paths = ", ".join(f"{k}={v}" for k, v in r["paths"].items() if v)
+        print(f"{backend:>16} {r['tokens_per_s']:>9.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['load_s']:>7.1f} {len(bad):>9}  {paths}")
+        diffs += [(backend, i, r["finals"][i]) for i in bad]
+        if len(bad) > args.max_mismatches:
+            failed.append(backend)
+    for backend, i, got in diffs:
+        print(f"\n[{backend}] {sentences[i]}\n   fp32: {ref[i]}\n   {backend}: {got}")
+    if failed:
+        print(f"\nParity FAILED for {', '.join(failed)} (more than {args.max_mismatches} final_text differences)")
+        sys.exit(1)
+    print("\nParity OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Query plans and latencies for the per-user result queries, before and after the
+versioned indexes in app/migrations.py, on a synthetic SQLite dataset.
+
+    cd backend && python -m bench.bench_indexes --rows 10000000 --users 50000
+
+--rows is the total across phoneme_results and grammar_results (split evenly).
+Generating 10M rows takes a few minutes and ~3 GB of disk; use --db to keep the file
+between runs (existing data is reused, indexes are dropped before the "before" pass).
+"""
+from __future__ import annotations
+import argparse
+import datetime as dt
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from app.migrations import MIGRATIONS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS phoneme_results (
+  id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, audio_sha256 TEXT NOT NULL, ref_text TEXT,
+  pred_phones TEXT NOT NULL, ref_phones TEXT, ops_raw TEXT, per_strict REAL, per_sle REAL, wer REAL,
+  word_analysis TEXT, weakness_categories TEXT, created_at TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS grammar_results (
+  id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, text_sha256 TEXT NOT NULL, input_text TEXT NOT NULL,
+  raw_corrected TEXT NOT NULL, final_text TEXT NOT NULL, edits TEXT, guardrails TEXT, latency_ms INTEGER,
+  weakness_categories TEXT, weakness_status TEXT, weakness_claimed_at TIMESTAMP, created_at TIMESTAMP NOT NULL
+);
+"""
+
+# Mirrors the SQL in app/db.py (named parameters kept identical). Weakness reads go through
+# weakness_events, a table this bench does not populate.
+QUERIES = {
+    "fetch_user_results/grammar": """
+      SELECT input_text, raw_corrected, final_text, edits, guardrails, latency_ms, created_at
+      FROM grammar_results WHERE user_id = :user_id ORDER BY created_at DESC LIMIT :limit""",
+    "fetch_user_results/phoneme": """
+      SELECT ref_text, pred_phones, ref_phones, ops_raw, per_strict, per_sle, created_at
+      FROM phoneme_results WHERE user_id = :user_id ORDER BY created_at DESC LIMIT :limit""",
+    "last_n_days/phoneme": """
+      SELECT per_sle, ops_raw, weakness_categories, created_at FROM phoneme_results
+      WHERE user_id = :user_id AND created_at >= :start_date""",
+    "last_n_days/grammar": """
+      SELECT final_text, edits, latency_ms, weakness_categories, created_at FROM grammar_results
+      WHERE user_id = :user_id AND created_at >= :start_date""",
+}
+
+CATS = ["articles a an the", "present simple", "subject verb agreement", "past simple tense", "modal verbs"]
+PHONES = ["AH", "IH", "T", "D", "S", "Z", "TH", "DH", "AE", "R", "L", "N"]
+
+def _ts(base: dt.datetime, rnd: random.Random) -> str:
+    return (base - dt.timedelta(seconds=rnd.randint(0, 90 * 86400))).isoformat(" ")
+
+def populate(conn: sqlite3.Connection, rows: int, users: int, seed: int = 7):
+    rnd = random.Random(seed)
+    now = dt.datetime.utcnow()
+    per_table = rows // 2
+    chunk = 50_000
+    t0 = time.perf_counter()
+    for start in range(0, per_table, chunk):
+        n = min(chunk, per_table - start)
+        ph, gr = [], []
+        for _ in range(n):
+            uid = f"u{rnd.randrange(users)}"
+            ops = [{"op": "S", "g": rnd.choice(PHONES), "p": rnd.choice(PHONES), "i": 1, "j": 1}] if rnd.random() < 0.6 else []
+            cats = ["Substitution"] if ops else []
+            ph.append((uid, "x" * 64, "he was happy", '["HH","IY"]', '["HH","IY"]', json.dumps(ops),
+                       rnd.random() * 40, rnd.random() * 40, json.dumps(cats), _ts(now, rnd)))
+            gcats = [rnd.choice(CATS)] if rnd.random() < 0.3 else []
+            gr.append((rnd.choice([uid, f"u{rnd.randrange(users)}"]), "y" * 64, "he go to school", "he goes to school",
+                       "he goes to school", "[]", "[]", rnd.randint(50, 900), json.dumps(gcats), _ts(now, rnd)))
+        conn.executemany(
+            "INSERT INTO phoneme_results (user_id, audio_sha256, ref_text, pred_phones, ref_phones, ops_raw, per_strict, per_sle, weakness_categories, created_at) "
+            "VALUES (?,?,?,?,?,?,?,?,?,?)", ph)
+        conn.executemany(
+            "INSERT INTO grammar_results (user_id, text_sha256, input_text, raw_corrected, final_text, edits, guardrails, latency_ms, weakness_categories, created_at) "
+            "VALUES (?,?,?,?,?,?,?,?,?,?)", gr)
+        conn.commit()
+        done = start + n
+        if done % 500_000 < chunk:
+            print(f"  generated {2 * done:,} rows ({time.perf_counter() - t0:.0f}s)")
+
+def drop_indexes(conn: sqlite3.Connection):
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL").fetchall():
+        conn.execute(f"DROP INDEX {name}")
+    conn.commit()
+
+def apply_indexes(conn: sqlite3.Connection):
+    for version, name, sqlite_stmts, _ in MIGRATIONS:
+        t0 = time.perf_counter()
+        try:
+            for stmt in sqlite_stmts:
+                conn.execute(stmt)
+        except sqlite3.OperationalError as e:
+            # tables this bench doesn't create (weakness_events, ...)
+            conn.rollback()
+            print(f"  v{version} {name}: skipped ({e})")
+            continue
+        conn.commit()
+        print(f"  v{version} {name}: {time.perf_counter() - t0:.1f}s")
+    conn.execute("ANALYZE")
+    conn.commit()
+
+def measure(conn: sqlite3.Connection, users: int, samples: int, label: str):
+    rnd = random.Random(11)
+    params = {"limit": 50, "offset": 0, "start_date": (dt.datetime.utcnow() - dt.timedelta(days=7)).isoformat(" ")}
+    print(f"\n=== {label} ===")
+    for name, sql in QUERIES.items():
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, {**params, "user_id": "u1"}).fetchall()
+        lat = []
+        for _ in range(samples):
+            p = {**params, "user_id": f"u{rnd.randrange(users)}"}
+            t0 = time.perf_counter()
+            conn.execute(sql, p).fetchall()
+            lat.append((time.perf_counter() - t0) * 1000)
+        lat.sort()
+        p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+        print(f"\n{name}: p50={statistics.median(lat):.2f} ms  p95={p95:.2f} ms")
+        for row in plan:
+            print(f"    {row[-1]}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--users", type=int, default=50_000)
+    ap.add_argument("--samples", type=int, default=50)
+    ap.add_argument("--db", help="SQLite file to (re)use; defaults to a temp file")
+    args = ap.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_indexes.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    have = conn.execute("SELECT COUNT(*) FROM phoneme_results").fetchone()[0]
+    if have == 0:
+        print(f"Generating {args.rows:,} rows for {args.users:,} users in {path}")
+        populate(conn, args.rows, args.users)
+    else:
+        print(f"Reusing {path} ({have:,} phoneme rows)")
+
+    drop_indexes(conn)
+    # Before: only base-DDL indexes, as production had them
+    measure(conn, args.users, max(3, args.samples // 10), "before (no per-user indexes)")
+    print("\nApplying migrations")
+    apply_indexes(conn)
+    measure(conn, args.users, args.samples, "after")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
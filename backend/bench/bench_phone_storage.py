@@ -0,0 +1,122 @@
+"""
+Size and read throughput of phoneme_results alignments stored as JSON (pred_phones,
+ref_phones, ops_raw, word_analysis with op descriptions) versus the packed
+phoneme_results.alignment column from app/phone_codec.py, on a synthetic SQLite dataset.
+
+    cd backend && python -m bench.bench_phone_storage --rows 200000
+
+"read" is a full scan of the alignment columns and decoding every row to Python
+objects (json.loads vs phone_codec.decode), as the results and cache paths do.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from app import phone_codec
+
+PHONES = [s for i, s in sorted(phone_codec.SYMBOLS.items()) if i > 0]
+WORDS = ["she", "sells", "sea", "shells", "by", "the", "shore", "three", "thin", "thieves", "think", "through"]
+
+def synth(rnd: random.Random):
+    """One scored attempt: ~8 words, ~3.5 phones per word, ~12% phone errors."""
+    words, ref = [], []
+    for _ in range(rnd.randint(4, 12)):
+        w = rnd.choice(WORDS)
+        phones = [rnd.choice(PHONES) for _ in range(rnd.randint(2, 5))]
+        words.append((w, len(ref), len(phones)))
+        ref += phones
+    pred, ops = [], []
+    for i, g in enumerate(ref):
+        r = rnd.random()
+        if r < 0.08:
+            p = rnd.choice(PHONES)
+            if p != g:
+                ops.append({"op": "S", "g": g, "p": p, "i": i, "j": len(pred)})
+            pred.append(p)
+        elif r < 0.10:
+            ops.append({"op": "D", "g": g, "p": None, "i": i, "j": len(pred)})
+        elif r < 0.12:
+            p = rnd.choice(PHONES)
+            ops.append({"op": "I", "g": None, "p": p, "i": i, "j": len(pred)})
+            pred += [p, g]
+        else:
+            pred.append(g)
+    ops = phone_codec.describe_ops(ops)     # as stored before: every op carries its description
+    analysis = []
+    for w, start, n in words:
+        errors = [o for o in ops if start <= o["i"] < start + n]
+        analysis.append({"word": w, "phoneme_errors": errors,
+                         "weakness_categories": sorted({phone_codec._CATEGORIES[o["op"]] for o in errors})})
+    return pred, ref, ops, analysis
+
+def table_bytes(conn: sqlite3.Connection, name: str) -> int:
+    # dbstat needs SQLITE_ENABLE_DBSTAT_VTAB, fall back to the summed column lengths
+    try:
+        return conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (name,)).fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    path = os.path.join(tempfile.mkdtemp(), "bench_phone_storage.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE json_rows (id INTEGER PRIMARY KEY, pred_phones TEXT, ref_phones TEXT, ops_raw TEXT, word_analysis TEXT);
+        CREATE TABLE packed_rows (id INTEGER PRIMARY KEY, alignment BLOB);
+    """)
+
+    json_rows, packed_rows = [], []
+    encode_s = 0.0
+    for _ in range(args.rows):
+        pred, ref, ops, analysis = synth(rnd)
+        json_rows.append((json.dumps(pred), json.dumps(ref), json.dumps(ops), json.dumps(analysis)))
+        t0 = time.perf_counter()
+        blob = phone_codec.encode(pred, ref, ops, analysis)
+        encode_s += time.perf_counter() - t0
+        assert blob is not None
+        packed_rows.append((blob,))
+
+    results = {}
+    for table, cols, rows in (
+        ("json_rows", "pred_phones, ref_phones, ops_raw, word_analysis", json_rows),
+        ("packed_rows", "alignment", packed_rows),
+    ):
+        placeholders = ", ".join("?" for _ in cols.split(","))
+        t0 = time.perf_counter()
+        conn.executemany(f"INSERT INTO {table} ({cols}) VALUES ({placeholders})", rows)
+        conn.commit()
+        write_s = time.perf_counter() - t0
+        payload = sum(len(v) for r in rows for v in r)
+
+        t0 = time.perf_counter()
+        if table == "json_rows":
+            for r in conn.execute(f"SELECT {cols} FROM {table}"):
+                [json.loads(v) for v in r]
+        else:
+            for (blob,) in conn.execute(f"SELECT {cols} FROM {table}"):
+                phone_codec.decode(blob)
+        read_s = time.perf_counter() - t0
+        results[table] = (payload, table_bytes(conn, table), write_s, read_s)
+
+    print(f"{args.rows:,} rows ({path}); packed encode {args.rows / encode_s:,.0f} rows/s")
+    print(f"{'storage':>8} {'payload B/row':>14} {'table B/row':>12} {'write rows/s':>13} {'read+decode rows/s':>19}")
+    for label, table in (("json", "json_rows"), ("packed", "packed_rows")):
+        payload, on_disk, write_s, read_s = results[table]
+        disk = f"{on_disk / args.rows:,.0f}" if on_disk else "n/a"
+        print(f"{label:>8} {payload / args.rows:>14,.0f} {disk:>12} {args.rows / write_s:>13,.0f} {args.rows / read_s:>19,.0f}")
+    j, p = results["json_rows"], results["packed_rows"]
+    print(f"payload {j[0] / p[0]:.1f}x smaller, read+decode {j[3] / p[3]:.1f}x faster")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
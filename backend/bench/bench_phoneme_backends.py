@@ -0,0 +1,134 @@
+"""
+Accuracy guard and speed/memory comparison for the wav2vec2 phoneme backends
+(PHONEME_BACKEND = torch | torch-int8 | onnx) on a held-out set.
+
+    cd backend && python -m bench.bench_phoneme_backends --manifest heldout.jsonl
+    cd backend && python -m bench.bench_phoneme_backends --manifest heldout.jsonl --backends torch torch-int8
+
+The manifest has one JSON object per line: {"audio": "path/to/file.wav", "text": "reference sentence"}.
+Each backend runs in its own process so load time and peak RSS are not shared.
+
+Reported per backend:
+  PER          corpus phoneme error rate against the G2P of the reference text (as per_strict)
+  PER vs fp32  edit distance of the predicted phones to the torch backend's, per fp32 phone
+  RTF          forward-pass seconds / audio seconds (batch of one, after one warm-up call)
+  RSS          peak resident memory of the process, and the growth while loading the model
+  batch≠1      utterances whose phones differ when decoded in padded batches of
+               PHONEME_BATCH_MAX_SIZE (as the micro-batcher does) instead of one at a time
+
+Exits with status 1 if any backend's PER is more than --max-per-delta points above fp32,
+or if any backend has more than --max-batch-mismatches batch≠1 utterances.
+"""
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KiB on Linux
+
+def _run_backend(backend: str, items: list) -> dict:
+    os.environ["PHONEME_BACKEND"] = backend
+    from app.deps import get_settings
+    get_settings.cache_clear()
+    settings = get_settings()
+    from app import utils_phone
+    from app.utils_audio import decode_audio
+
+    waves = []
+    for item in items:
+        with open(item["audio"], "rb") as f:
+            waves.append(decode_audio(f.read()))
+    rss_before = _rss_mb()
+    t0 = time.perf_counter()
+    utils_phone._load_once()
+    load_s = time.perf_counter() - t0
+    rss_loaded = _rss_mb()
+
+    utils_phone.phoneme_logits_batch([waves[0]])       # warm-up
+    compute_s, audio_s, errors, ref_len, preds = 0.0, 0.0, 0.0, 0, []
+    for wav, item in zip(waves, items):
+        t0 = time.perf_counter()
+        logits = utils_phone.phoneme_logits_batch([wav])[0]
+        compute_s += time.perf_counter() - t0
+        audio_s += len(wav) / 16000
+        phones = utils_phone.pred_phones_from_logits(logits)
+        details = utils_phone.score_phonemes(phones, ref_text=item["text"])["details"]
+        n_ref = max(1, len(details["ref_phones"]))
+        errors += details["per_strict"] * n_ref / 100
+        ref_len += n_ref
+        preds.append(phones)
+
+    # Parity of padded batches against the single-utterance decode above
+    batch_size, batch_mismatch, max_diff = settings.PHONEME_BATCH_MAX_SIZE, 0, 0.0
+    for start in range(0, len(waves), batch_size):
+        chunk = waves[start:start + batch_size]
+        for k, lg in enumerate(utils_phone.phoneme_logits_batch(chunk, max_ratio=settings.PHONEME_BUCKET_MAX_RATIO)):
+            single = utils_phone.phoneme_logits_batch([chunk[k]])[0]
+            max_diff = max(max_diff, float((lg - single).abs().max()))
+            batch_mismatch += utils_phone.pred_phones_from_logits(lg) != preds[start + k]
+    return {
+        "backend": backend,
+        "per": 100.0 * errors / max(1, ref_len),
+        "rtf": compute_s / max(audio_s, 1e-9),
+        "load_s": load_s,
+        "rss_peak_mb": _rss_mb(),
+        "rss_model_mb": rss_loaded - rss_before,
+        "preds": preds,
+        "batch_mismatch": batch_mismatch,
+        "batch_max_diff": max_diff,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--manifest", required=True)
+    ap.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"])
+    ap.add_argument("--max-per-delta", type=float, default=0.5, help="allowed PER increase over fp32, in points")
+    ap.add_argument("--max-batch-mismatches", type=int, default=0, help="allowed batch≠1 utterances per backend")
+    args = ap.parse_args()
+
+    from rapidfuzz.distance import Levenshtein as L
+
+    with open(args.manifest, "r", encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]   # fp32 is the reference
+    ctx = mp.get_context("spawn")
+    results = {}
+    for backend in backends:
+        with ctx.Pool(1) as pool:
+            try:
+                results[backend] = pool.apply(_run_backend, (backend, items))
+            except Exception as e:
+                print(f"[WARN] backend {backend} failed: {e}")
+
+    if "torch" not in results:
+        print("fp32 reference backend failed; nothing to compare against.")
+        sys.exit(2)
+    ref = results["torch"]
+    ref_phones = sum(max(1, len(p)) for p in ref["preds"])
+    print(f"{len(items)} utterances from {args.manifest}")
+    print(f"{'backend':>11} {'PER':>7} {'vs fp32':>8} {'RTF':>7} {'load s':>7} {'RSS peak MB':>12} {'model MB':>9} "
+          f"{'batch≠1':>8} {'max |Δlogit|':>13}")
+    failed, batch_failed = [], []
+    for backend, r in results.items():
+        drift = 100.0 * sum(L.distance(a, b) for a, b in zip(r["preds"], ref["preds"])) / ref_phones
+        print(f"{backend:>11} {r['per']:>6.2f}% {drift:>7.2f}% {r['rtf']:>7.4f} {r['load_s']:>7.1f} "
+              f"{r['rss_peak_mb']:>12,.0f} {r['rss_model_mb']:>9,.0f} {r['batch_mismatch']:>8} {r['batch_max_diff']:>13.2e}")
+        if r["per"] > ref["per"] + args.max_per_delta:
+            failed.append(backend)
+        if r["batch_mismatch"] > args.max_batch_mismatches:
+            batch_failed.append(backend)
+    if batch_failed:
+        print(f"Batch parity FAILED for {', '.join(batch_failed)} (more than {args.max_batch_mismatches} utterances differ from batch of one)")
+    if failed:
+        print(f"PER guard FAILED for {', '.join(failed)} (more than {args.max_per_delta} points above fp32)")
+    if failed or batch_failed:
+        sys.exit(1)
+    print(f"PER guard OK (within {args.max_per_delta} points of fp32)")
+
+if __name__ == "__main__":
+    main()
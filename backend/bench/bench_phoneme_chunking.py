@@ -0,0 +1,76 @@
+"""
+Peak memory, speed and output drift of long-recording phoneme decoding: one wav2vec2 forward
+pass over the whole clip versus VAD windows with stitched logits (PHONEME_CHUNK_SECONDS).
+
+    cd backend && python -m bench.bench_phoneme_chunking --audio sample.wav
+    cd backend && python -m bench.bench_phoneme_chunking --audio sample.wav --durations 30 120 600
+
+The audio is tiled to each duration. Each (mode, duration) runs in its own process, so
+peak RSS is per run. Reported: peak RSS growth over the loaded model, RTF (compute seconds /
+audio seconds), and the phone edit distance of the chunked output to the one-pass output
+per one-pass phone. One-pass runs that fail (e.g. out of memory) are reported as such.
+"""
+from __future__ import annotations
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KiB on Linux
+
+def _run(audio_path: str, seconds: float, chunked: bool) -> dict:
+    import numpy as np
+    from app import utils_phone
+    from app.deps import get_settings
+    from app.utils_audio import decode_audio
+
+    with open(audio_path, "rb") as f:
+        clip = decode_audio(f.read())
+    n = int(seconds * 16000)
+    y = np.tile(clip, -(-n // len(clip)))[:n]
+    utils_phone._load_once()
+    utils_phone.phoneme_logits_batch([clip[:16000]])     # warm-up
+    rss_loaded = _rss_mb()
+
+    s = get_settings()
+    t0 = time.perf_counter()
+    if chunked:
+        logits = utils_phone.phoneme_logits_long(y, s.PHONEME_CHUNK_SECONDS or 20.0, s.PHONEME_CHUNK_OVERLAP_SECONDS,
+                                                 batch_size=s.PHONEME_BATCH_MAX_SIZE, silence_db=s.PHONEME_VAD_SILENCE_DB)
+    else:
+        logits = utils_phone.phoneme_logits_batch([y])[0]
+    compute_s = time.perf_counter() - t0
+    return {
+        "rtf": compute_s / seconds,
+        "rss_growth_mb": _rss_mb() - rss_loaded,
+        "phones": utils_phone.pred_phones_from_logits(logits),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--audio", required=True)
+    ap.add_argument("--durations", nargs="+", type=float, default=[30, 120, 300])
+    args = ap.parse_args()
+
+    from rapidfuzz.distance import Levenshtein as L
+
+    ctx = mp.get_context("spawn")
+    print(f"{'seconds':>8} {'mode':>9} {'RTF':>7} {'RSS growth MB':>14} {'drift':>7}")
+    for seconds in args.durations:
+        results = {}
+        for mode in ("one-pass", "chunked"):
+            with ctx.Pool(1) as pool:
+                try:
+                    results[mode] = pool.apply(_run, (args.audio, seconds, mode == "chunked"))
+                except Exception as e:
+                    print(f"{seconds:>8.0f} {mode:>9} failed: {e}")
+        ref = results.get("one-pass")
+        for mode, r in results.items():
+            drift = "n/a"
+            if ref is not None:
+                drift = f"{100.0 * L.distance(r['phones'], ref['phones']) / max(1, len(ref['phones'])):.2f}%"
+            print(f"{seconds:>8.0f} {mode:>9} {r['rtf']:>7.4f} {r['rss_growth_mb']:>14,.0f} {drift:>7}")
+
+if __name__ == "__main__":
+    main()
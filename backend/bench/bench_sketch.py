@@ -0,0 +1,89 @@
+"""
+Accuracy and cost of the per-day DDSketches in app/sketch.py against exact NumPy
+quantiles, on a synthetic history of PER and latency values.
+
+    cd backend && python -m bench.bench_sketch --values 2000000 --days 30
+
+Values are spread evenly over --days daily sketches; windows of 1, 7 and 30 days are
+answered by merging those sketches, as analytics.window_stats does. Relative error is
+reported against numpy.quantile(method="lower") (the sketch's guarantee) and against the
+interpolated np.median / np.percentile the analytics used before. "numpy ms" is
+the compute alone; the old path also had to fetch every raw row of the window.
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.sketch import DDSketch, DEFAULT_RELATIVE_ACCURACY
+
+QUANTILES = (0.5, 0.9, 0.99)
+WINDOWS = (1, 7, 30)
+
+def synth(kind: str, n: int, rng: np.random.Generator) -> np.ndarray:
+    if kind == "per_sle":
+        # ~10% perfect attempts, the rest a long-tailed error rate in percent
+        per = rng.gamma(shape=2.0, scale=9.0, size=n)
+        per[rng.random(n) < 0.1] = 0.0
+        return np.round(per, 2)
+    # GEC latency in ms: lognormal around ~180 ms with a slow tail
+    return np.round(rng.lognormal(mean=5.2, sigma=0.6, size=n))
+
+def rel_err(est: float, exact: float) -> float:
+    if exact == 0:
+        return 0.0 if est == 0 else float("inf")
+    return abs(est - exact) / abs(exact)
+
+def run(kind: str, values: np.ndarray, days: int, accuracy: float):
+    per_day = np.array_split(values, days)
+    t0 = time.perf_counter()
+    sketches = [DDSketch.of(chunk.tolist(), accuracy) for chunk in per_day]
+    build_s = time.perf_counter() - t0
+    sizes = [len(json.dumps(s.to_dict())) for s in sketches]
+
+    print(f"\n== {kind}: {len(values):,} values over {days} days, relative accuracy {accuracy:.2%}")
+    print(f"   build {build_s:.2f}s ({len(values) / build_s:,.0f} values/s); "
+          f"stored sketch {np.mean(sizes):,.0f} B/day avg, {max(sizes):,} B max")
+    print(f"   {'window':>6} {'n':>10} {'q':>5} {'sketch':>10} {'exact':>10} {'err':>7} {'np.pct':>10} {'err':>7} "
+          f"{'merge ms':>9} {'numpy ms':>9}")
+    worst = 0.0
+    for w in (w for w in WINDOWS if w <= days):
+        t0 = time.perf_counter()
+        merged = DDSketch(accuracy)
+        for s in sketches[-w:]:
+            # stored form round-trip, as the sketches come back from user_daily_stats
+            merged.merge(DDSketch.from_dict(json.loads(json.dumps(s.to_dict()))))
+        merge_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        raw = np.concatenate(per_day[-w:])
+        np.percentile(raw, 50)
+        numpy_ms = (time.perf_counter() - t0) * 1000
+
+        for q in QUANTILES:
+            est = merged.quantile(q)
+            exact = float(np.quantile(raw, q, method="lower"))
+            interp = float(np.percentile(raw, q * 100))
+            e1, e2 = rel_err(est, exact), rel_err(est, interp)
+            worst = max(worst, e1)
+            print(f"   {w:>5}d {raw.size:>10,} {q:>5} {est:>10.2f} {exact:>10.2f} {e1:>7.2%} {interp:>10.2f} {e2:>7.2%} "
+                  f"{merge_ms:>9.2f} {numpy_ms:>9.2f}")
+    status = "OK" if worst <= accuracy + 1e-12 else "BOUND EXCEEDED"
+    print(f"   worst error vs lower quantile: {worst:.3%} ({status})")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--values", type=int, default=2_000_000, help="values per metric")
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--accuracy", type=float, default=DEFAULT_RELATIVE_ACCURACY)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for kind in ("per_sle", "latency_ms"):
+        run(kind, synth(kind, args.values, rng), args.days, args.accuracy)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+# app.db builds its engine from DATABASE_URL at import time, so point it at a scratch file first
+_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="research-backend-tests-"), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_PATH}"
+
+
+def _run(coro):
+    from app import db
+
+    async def _main():
+        try:
+            return await coro
+        finally:
+            # pooled aiosqlite connections belong to this event loop
+            await db.engine.dispose()
+
+    return asyncio.run(_main())
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion against the test database."""
+    return _run
+
+
+@pytest.fixture
+def database():
+    """An empty SQLite database with the full schema (base DDL, ALTERs and migrations)."""
+    from app import db
+
+    _run(db.engine.dispose())
+    if os.path.exists(_DB_PATH):
+        os.remove(_DB_PATH)
+    _run(db.init_db())
+    return db
+
+
+# SQLite schema of the first release, before any migration existed
+BASELINE_DDL = """
+CREATE TABLE phoneme_results (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id TEXT NOT NULL,
+  audio_sha256 TEXT NOT NULL,
+  ref_text TEXT,
+  pred_phones TEXT NOT NULL,
+  ref_phones TEXT,
+  ops_raw TEXT,
+  per_strict REAL,
+  per_sle REAL,
+  wer REAL,
+  word_analysis TEXT,
+  weakness_categories TEXT,
+  created_at TIMESTAMP NOT NULL
+);
+CREATE TABLE grammar_results (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id TEXT NOT NULL,
+  text_sha256 TEXT NOT NULL,
+  input_text TEXT NOT NULL,
+  raw_corrected TEXT NOT NULL,
+  final_text TEXT NOT NULL,
+  edits TEXT,
+  guardrails TEXT,
+  latency_ms INTEGER,
+  weakness_categories TEXT,
+  created_at TIMESTAMP NOT NULL
+);
+CREATE TABLE user_analytics_cache (
+  user_id              VARCHAR(64) PRIMARY KEY,
+  window_label         VARCHAR(16) NOT NULL DEFAULT '7d',
+  from_ts              TIMESTAMP,
+  to_ts                TIMESTAMP,
+  attempts_phoneme     INT NOT NULL DEFAULT 0,
+  attempts_grammar     INT NOT NULL DEFAULT 0,
+  per_sle_avg          REAL,
+  per_sle_median       REAL,
+  edits_per_100w_avg   REAL,
+  latency_ms_p50       INT,
+  top_phone_subs       TEXT,
+  top_grammar_weaknesses   TEXT,
+  top_pronunciation_weaknesses TEXT,
+  badge                VARCHAR(64),
+  headline_msg         TEXT,
+  updated_at           TIMESTAMP NOT NULL,
+  expires_at           TIMESTAMP NOT NULL
+);
+CREATE INDEX idx_user_analytics_cache_expires ON user_analytics_cache (expires_at)
+"""
+
+
+@pytest.fixture
+def baseline_database():
+    """A database with the first release's schema and no migrations; fill it, then call db.init_db()."""
+    from app import db
+
+    _run(db.engine.dispose())
+    if os.path.exists(_DB_PATH):
+        os.remove(_DB_PATH)
+    con = sqlite3.connect(_DB_PATH)
+    con.executescript(BASELINE_DDL)
+    con.close()
+    # pred_phones is NOT NULL again; forget what an earlier test's database allowed
+    db._pred_phones_nullable, db._nullable_checked_at = False, None
+    return db
+
+
+@pytest.fixture
+def raw_sql():
+    """Run statements on the test database outside the app, e.g. to write rows in an old format."""
+    def execute(sql, rows=()):
+        con = sqlite3.connect(_DB_PATH)
+        with con:
+            if rows:
+                con.executemany(sql, rows)
+            else:
+                con.execute(sql)
+        con.close()
+    return execute
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.batching import MicroBatcher
+
+
+def test_results_go_back_to_their_callers():
+    seen = []
+
+    async def double(items):
+        seen.append(list(items))
+        return [i * 2 for i in items]
+
+    async def scenario():
+        batcher = MicroBatcher("test_double", double, max_batch_size=4, max_wait_ms=20)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+
+    assert asyncio.run(scenario()) == [0, 2, 4, 6, 8, 10]
+    assert [len(b) for b in seen] == [4, 2]
+
+
+def test_batch_failure_reaches_every_caller():
+    async def boom(items):
+        raise ValueError("model failed")
+
+    async def scenario():
+        batcher = MicroBatcher("test_boom", boom, max_batch_size=4, max_wait_ms=20)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_short_results_fail_the_whole_batch():
+    async def short(items):
+        return items[:-1]
+
+    async def scenario():
+        batcher = MicroBatcher("test_short", short, max_batch_size=4, max_wait_ms=20)
+        return await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True), 1.0
+        )
+
+    results = asyncio.run(scenario())
+    assert len(results) == 3
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_full_queue_rejects_with_503():
+    release = None
+
+    async def slow(items):
+        await release.wait()
+        return items
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        batcher = MicroBatcher("test_full", slow, max_batch_size=1, max_wait_ms=0, max_queue=1)
+        first = asyncio.create_task(batcher.submit(1))      # taken by the collector
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(batcher.submit(2))     # fills the queue
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as exc:
+            await batcher.submit(3)
+        release.set()
+        return exc.value.status_code, await first, await second
+
+    assert asyncio.run(scenario()) == (503, 1, 2)
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("g2p_en")
+from app.utils_phone import bucket_by_length  # noqa: E402
+
+
+def test_every_index_once():
+    lengths = [16000, 3200, 48000, 16500, 3300, 47000, 100]
+    groups = bucket_by_length(lengths)
+    assert sorted(i for g in groups for i in g) == list(range(len(lengths)))
+
+
+def test_groups_respect_max_ratio():
+    lengths = [100, 120, 125, 126, 200, 240, 250, 1000]
+    groups = bucket_by_length(lengths, max_ratio=1.25)
+    assert groups == [[0, 1, 2], [3], [4, 5, 6], [7]]
+    for g in groups:
+        assert max(lengths[i] for i in g) <= 1.25 * min(lengths[i] for i in g)
+
+
+def test_groups_are_sorted_by_length():
+    lengths = [300, 100, 290, 110]
+    assert bucket_by_length(lengths) == [[1, 3], [2, 0]]
+
+
+def test_ratio_one_groups_equal_lengths_only():
+    assert bucket_by_length([5, 5, 6, 5], max_ratio=1.0) == [[0, 1, 3], [2]]
+
+
+def test_empty_and_zero_lengths():
+    assert bucket_by_length([]) == []
+    assert bucket_by_length([0, 0, 1]) == [[0, 1, 2]]
@@ -0,0 +1,110 @@
+import base64
+
+import pytest
+
+from app import db
+
+
+def test_round_trip():
+    position = {"g": ["2024-05-01 10:00:00.123456", 42], "p": None}
+    token = db.encode_cursor(position)
+    assert "=" not in token
+    assert db.decode_cursor(token) == position
+
+
+def test_tokens_are_url_safe():
+    token = db.encode_cursor({"g": ["\xff\xfe?>" * 5, 1]})
+    assert set(token) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+@pytest.mark.parametrize("token", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b"{broken json").decode(),
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),        # valid JSON, but not a position
+    "",
+])
+def test_invalid_tokens_raise_value_error(token):
+    with pytest.raises(ValueError):
+        db.decode_cursor(token)
+
+
+def test_position_entries():
+    assert db._position(None) is None
+    assert db._position(["2024-05-01 10:00:00", "7"]) == ("2024-05-01 10:00:00", 7)
+    for bad in (["2024-05-01"], ["2024-05-01", "x"], 5):
+        with pytest.raises(ValueError):
+            db._position(bad)
+
+
+
+GRAMMAR = {"gec": {"raw_corrected": "x", "final_text": "x", "edits": []}, "guardrails": [], "metrics": {}}
+PHONEME = {"pred_phones": ["HH"], "ref_phones": ["HH"], "ops_after_rules": []}
+# rows share timestamps, so pages have to break ties on id
+TIMES = ["2024-05-01 09:00:00.000000", "2024-05-01 09:00:00.000000", "2024-05-01 08:00:00.000000",
+         "2024-05-01 08:00:00.000000", "2024-05-01 07:00:00.000000"]
+
+
+def _set_times(raw_sql, table, times, source=None):
+    raw_sql(f"UPDATE {table} SET created_at = ? WHERE id = ?", [(ts, i) for i, ts in enumerate(times, 1)])
+    if source:
+        raw_sql("UPDATE weakness_events SET created_at = ? WHERE source = ? AND result_id = ?",
+                [(ts, source, i) for i, ts in enumerate(times, 1)])
+
+
+async def _follow(fetch, page, limit):
+    """`page` and every page after it."""
+    pages = [page]
+    while page["next_cursor"]:
+        page = await fetch("u1", limit=limit, cursor=page["next_cursor"])
+        pages.append(page)
+    return pages
+
+
+def test_result_pages_cover_every_row_once(database, raw_sql, run):
+    db = database
+
+    async def save():
+        for i in range(5):
+            await db.save_grammar_result("u1", f"g{i}", GRAMMAR)
+        for i in range(3):
+            await db.save_phoneme_result("u1", b"audio", {"details": dict(PHONEME, ref_text=f"p{i}")})
+        await db.save_grammar_result("u2", "someone else", GRAMMAR)
+
+    run(save())
+    _set_times(raw_sql, "grammar_results", TIMES)
+    _set_times(raw_sql, "phoneme_results", TIMES[:3])
+
+    async def scenario():
+        first = await db.fetch_user_results("u1", limit=2)
+        await db.save_grammar_result("u1", "newer", GRAMMAR)        # must not shift the pages after it
+        return await _follow(db.fetch_user_results, first, 2)
+
+    pages = run(scenario())
+    assert [[r["input_text"] for r in p["grammar"]] for p in pages] == [["g1", "g0"], ["g3", "g2"], ["g4"]]
+    assert [[r["ref_text"] for r in p["phoneme"]] for p in pages] == [["p1", "p0"], ["p2"], []]
+    assert pages[-1]["next_cursor"] is None
+
+
+def test_weakness_pages_merge_both_sources(database, raw_sql, run):
+    db = database
+
+    async def save():
+        for i in range(5):
+            await db.save_grammar_result("u1", f"g{i}", dict(GRAMMAR, weakness_categories=[f"cat{i}"]))
+        for i in range(3):
+            await db.save_phoneme_result("u1", b"audio", {"details": dict(PHONEME, ref_text=f"p{i}"),
+                                                          "weakness_categories": ["Substitution"]})
+
+    run(save())
+    _set_times(raw_sql, "grammar_results", TIMES, source="grammar")
+    _set_times(raw_sql, "phoneme_results", TIMES[:3], source="pronunciation")
+
+    async def scenario():
+        return await _follow(db.fetch_user_weaknesses, await db.fetch_user_weaknesses("u1", limit=3), 3)
+
+    pages = run(scenario())
+    assert [[i["text"] for i in p["items"]] for p in pages] == [
+        ["g1", "g0", "p1"], ["p0", "g3", "g2"], ["p2", "g4"],       # grammar first at equal timestamps
+    ]
+    assert pages[0]["items"][0]["categories"] == ["cat1"]
+    assert pages[-1]["next_cursor"] is None
@@ -0,0 +1,107 @@
+import datetime as dt
+import json
+
+import pytest
+from sqlalchemy import text
+
+from app import rollups
+
+OPS = [{"op": "S", "g": "AH", "p": "EH", "i": 1, "j": 1}]
+PHONEME = {
+    "details": {"ref_text": "hello", "pred_phones": ["HH", "EH", "L", "OW"], "ref_phones": ["HH", "AH", "L", "OW"],
+                "ops_after_rules": OPS, "per_sle": 0.25},
+    "weakness_categories": ["Substitution"],
+}
+
+
+def _grammar(edits, latency_ms, categories):
+    return {
+        "gec": {"raw_corrected": "She goes to school.", "final_text": "She goes to school.", "edits": edits},
+        "guardrails": [], "metrics": {"latency_ms": latency_ms}, "weakness_categories": categories,
+    }
+
+
+async def _days(db):
+    async with db.engine.begin() as conn:
+        rows = await conn.execute(text("SELECT * FROM user_daily_stats ORDER BY user_id, day"))
+        return [r._asdict() for r in rows]
+
+
+def test_results_bump_the_day_row(database, run):
+    db = database
+
+    async def scenario():
+        await db.save_phoneme_result("u1", b"audio", PHONEME)
+        await db.save_grammar_result("u1", "she go to school", _grammar([{"src": "go", "tgt": "goes"}], 100, ["present simple"]))
+        await db.save_grammar_result("u1", "she go to school", _grammar([], 300, ["present simple"]))
+        return await _days(db)
+
+    [day] = run(scenario())
+    assert day["user_id"] == "u1"
+    assert (day["phoneme_attempts"], day["per_sle_count"], day["per_sle_sum"]) == (1, 1, 0.25)
+    assert json.loads(day["sub_pairs"]) == {"AH->EH": 1}
+    assert json.loads(day["pron_weaknesses"]) == {"Substitution": 1}
+    assert (day["grammar_attempts"], day["latency_count"], day["latency_sum"]) == (2, 2, 400)
+    assert day["edits100_sum"] == pytest.approx(25.0)       # one edit in four words, then none
+    assert json.loads(day["grammar_weaknesses"]) == {"present simple": 2}
+    assert rollups.quantile(rollups.merge_days([day]), "latency_sketch", 0.5) is not None
+
+
+LEGACY_PHONEME = ("INSERT INTO phoneme_results (user_id, audio_sha256, ref_text, pred_phones, ref_phones, ops_raw, per_sle, "
+                  "weakness_categories, created_at) VALUES (?, 'sha', 'hello', ?, ?, ?, ?, 'null', ?)")
+LEGACY_GRAMMAR = ("INSERT INTO grammar_results (user_id, text_sha256, input_text, raw_corrected, final_text, edits, guardrails, "
+                  "latency_ms, weakness_categories, created_at) VALUES (?, 'sha', 'a b', 'A b.', 'A b.', '[]', '[]', ?, ?, ?)")
+
+
+def test_upgrade_backfills_existing_results(baseline_database, raw_sql, run):
+    db = baseline_database
+    may1, may2 = "2024-05-01 09:00:00", "2024-05-02 09:00:00"
+    phones = json.dumps(PHONEME["details"]["pred_phones"])
+    ref = json.dumps(PHONEME["details"]["ref_phones"])
+    raw_sql(LEGACY_PHONEME, [("u1", phones, ref, json.dumps(OPS), 0.5, may1), ("u1", phones, ref, "[]", 0.1, may2)])
+    raw_sql(LEGACY_GRAMMAR, [("u1", 200, '["articles a an the"]', may1), ("u2", 400, "null", may1)])
+
+    async def scenario():
+        await db.init_db()
+        return await _days(db)
+
+    days = {(d["user_id"], str(d["day"])): d for d in run(scenario())}
+    assert sorted(days) == [("u1", "2024-05-01"), ("u1", "2024-05-02"), ("u2", "2024-05-01")]
+    u1 = days[("u1", "2024-05-01")]
+    assert (u1["phoneme_attempts"], u1["per_sle_sum"], u1["grammar_attempts"], u1["latency_sum"]) == (1, 0.5, 1, 200)
+    assert json.loads(u1["sub_pairs"]) == {"AH->EH": 1}
+    assert json.loads(u1["grammar_weaknesses"]) == {"articles a an the": 1}
+    assert u1["per_sketch"] is not None and u1["latency_sketch"] is not None
+    assert days[("u1", "2024-05-02")]["phoneme_attempts"] == 1
+    assert days[("u2", "2024-05-01")]["grammar_attempts"] == 1
+
+
+def test_interrupted_backfill_resumes(database, raw_sql, run, monkeypatch):
+    db = database
+    created = dt.datetime(2024, 5, 1, 9).isoformat(" ")
+    raw_sql(LEGACY_GRAMMAR, [("u1", 100, "null", created)] * 5)
+    raw_sql("DELETE FROM user_daily_stats")
+    raw_sql("DELETE FROM job_checkpoints")
+
+    bump = db._bump_daily_stats
+    calls = []
+
+    async def dies_on_second_batch(*args):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("killed mid-backfill")
+        await bump(*args)
+
+    async def scenario():
+        monkeypatch.setattr(db, "_bump_daily_stats", dies_on_second_batch)
+        with pytest.raises(RuntimeError):
+            await db.backfill_user_daily_stats(batch_size=2)
+        monkeypatch.setattr(db, "_bump_daily_stats", bump)
+        checkpoint = await db.get_job_checkpoint("backfill_user_daily_stats")
+        await db.backfill_user_daily_stats(batch_size=2)
+        return checkpoint, await _days(db), await db.get_job_checkpoint("backfill_user_daily_stats")
+
+    crashed, [day], finished = run(scenario())
+    assert (crashed.last_key, crashed.processed, crashed.finished_at) == ("g:2", 2, None)
+    assert day["grammar_attempts"] == 5                     # batches before the crash are not counted twice
+    assert finished.processed == 5 and finished.finished_at is not None
@@ -0,0 +1,126 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+from app import utils_openai
+from app.deps import get_settings
+
+
+@pytest.fixture
+def api_key(monkeypatch):
+    monkeypatch.setattr(get_settings(), "OPENAI_API_KEY", "sk-test")
+
+
+def _reply(monkeypatch, content):
+    async def fake_call(make_request):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+    monkeypatch.setattr(utils_openai, "_call", fake_call)
+
+
+@pytest.mark.parametrize("content", ["[]", '"results"', "null", "3"])
+def test_non_object_reply_counts_as_failed_call(api_key, monkeypatch, run, content):
+    _reply(monkeypatch, content)
+    assert run(utils_openai.categorize_grammar_errors([("a", "b")])) is None
+
+
+def test_reply_maps_categories_by_id(api_key, monkeypatch, run):
+    _reply(monkeypatch, json.dumps({"results": [
+        {"id": 1, "categories": ["articles a an the"]},
+        {"id": "x", "categories": ["ignored"]},
+        "not an item",
+    ]}))
+    assert run(utils_openai.categorize_grammar_errors([("a", "b"), ("c", "d")])) == [None, ["articles a an the"]]
+
+
+def test_malformed_results_field(api_key, monkeypatch, run):
+    _reply(monkeypatch, json.dumps({"results": 7}))
+    assert run(utils_openai.categorize_grammar_errors([("a", "b")])) == [None]
+
+
+async def _pending(db, n):
+    result = {"gec": {"raw_corrected": "She goes.", "final_text": "She goes.", "edits": []}, "guardrails": [], "metrics": {}}
+    for _ in range(n):
+        await db.save_grammar_result("u1", "she go.", result)
+
+
+async def _statuses(db):
+    async with db.engine.begin() as conn:
+        rows = await conn.execute(text("SELECT weakness_status, weakness_attempts FROM grammar_results ORDER BY id"))
+        return [tuple(r) for r in rows]
+
+
+def test_claim_and_release(api_key, database, run):
+    db = database
+
+    async def scenario():
+        await _pending(db, 3)
+        claimed = await db.claim_pending_grammar_rows(2)
+        again = await db.claim_pending_grammar_rows(10)
+        await db.release_grammar_rows([claimed[0].id])
+        await db.release_grammar_rows([claimed[1].id], count_attempt=True)
+        return claimed, again, await _statuses(db)
+
+    claimed, again, statuses = run(scenario())
+    assert [r.id for r in claimed] == [1, 2]
+    assert [r.id for r in again] == [3]                    # claimed rows are not handed out twice
+    assert statuses == [("pending", 0), ("pending", 1), ("processing", 0)]
+
+
+def test_stale_claims_are_reclaimed(api_key, database, run):
+    db = database
+
+    async def scenario():
+        await _pending(db, 1)
+        await db.claim_pending_grammar_rows(10)
+        fresh = await db.claim_pending_grammar_rows(10, stale_after_s=300)
+        stale = await db.claim_pending_grammar_rows(10, stale_after_s=-1)
+        return fresh, stale
+
+    fresh, stale = run(scenario())
+    assert fresh == []
+    assert [r.id for r in stale] == [1]
+
+
+def test_complete_writes_categories_and_events(api_key, database, run):
+    db = database
+
+    async def scenario():
+        await _pending(db, 2)
+        rows = await db.claim_pending_grammar_rows(10)
+        await db.complete_grammar_enrichment([{"id": rows[0].id, "weakness_categories": ["present simple"]}])
+        async with db.engine.begin() as conn:
+            events = (await conn.execute(text("SELECT result_id, label FROM weakness_events"))).fetchall()
+            stats = (await conn.execute(text("SELECT grammar_weaknesses FROM user_daily_stats"))).scalar()
+        return await _statuses(db), events, stats
+
+    statuses, events, stats = run(scenario())
+    assert statuses == [("done", 0), ("processing", 0)]
+    assert [tuple(e) for e in events] == [(1, "present simple")]
+    assert json.loads(stats) == {"present simple": 1}
+
+
+def test_failing_chunk_releases_only_its_rows(api_key, database, run, monkeypatch):
+    pytest.importorskip("transformers")
+    from app import enrichment
+
+    db = database
+    monkeypatch.setattr(enrichment.settings, "ENRICH_ITEMS_PER_CALL", 1)
+
+    async def categorize(chunk):
+        if chunk[0][0] == "bad input":
+            raise AttributeError("'list' object has no attribute 'get'")
+        return [["present simple"]]
+    monkeypatch.setattr(enrichment, "categorize_grammar_errors", categorize)
+
+    async def scenario():
+        result = {"gec": {"raw_corrected": "Fixed.", "final_text": "Fixed.", "edits": []}, "guardrails": [], "metrics": {}}
+        await db.save_grammar_result("u1", "bad input", result)
+        await db.save_grammar_result("u1", "good input", result)
+        done = await enrichment.enrich_once()
+        return done, await _statuses(db)
+
+    done, statuses = run(scenario())
+    assert done == 1
+    assert statuses == [("pending", 1), ("done", 0)]
@@ -0,0 +1,40 @@
+from sqlalchemy import text
+
+
+def _result(latency_ms, cache=None):
+    metrics = {"latency_ms": latency_ms}
+    if cache is not None:
+        metrics["cache"] = cache
+    return {
+        "input": "she go to school",
+        "gec": {"raw_corrected": "She goes to school.", "final_text": "She goes to school.",
+                "edits": [{"src": "go", "tgt": "goes"}]},
+        "guardrails": [],
+        "metrics": metrics,
+        "weakness_categories": ["subject verb agreement"],
+    }
+
+
+async def _latency(db):
+    async with db.engine.begin() as conn:
+        rows = (await conn.execute(text("SELECT latency_ms FROM grammar_results ORDER BY id"))).fetchall()
+        stats = (await conn.execute(text(
+            "SELECT grammar_attempts, latency_count, latency_sum FROM user_daily_stats WHERE user_id = 'u1'"
+        ))).fetchone()
+    return [r.latency_ms for r in rows], stats
+
+
+def test_cache_hits_stay_out_of_latency(database, run):
+    db = database
+
+    async def scenario():
+        await db.save_grammar_result("u1", "she go to school", _result(420))
+        await db.save_grammar_result("u1", "she go to school", _result(0, cache="memory"))
+        await db.save_grammar_result("u1", "she go to school", _result(3, cache="db"))
+        return await _latency(db)
+
+    latencies, stats = run(scenario())
+    assert latencies == [420, None, None]
+    assert stats.grammar_attempts == 3
+    assert stats.latency_count == 1
+    assert stats.latency_sum == 420
@@ -0,0 +1,123 @@
+import asyncio
+import datetime as dt
+
+import pytest
+from sqlalchemy import text
+
+from app import leader
+
+
+async def _runs(db):
+    async with db.engine.begin() as conn:
+        rows = await conn.execute(text("SELECT id, holder, status, error FROM job_runs ORDER BY id"))
+        return [tuple(r) for r in rows]
+
+
+def test_lease_is_exclusive_until_it_expires(database, run):
+    db = database
+
+    async def scenario():
+        return [
+            await db.acquire_lease("scheduler", "a", 60),
+            await db.acquire_lease("scheduler", "b", 60),
+            await db.acquire_lease("scheduler", "a", -1),      # renew, but let it lapse
+            await db.acquire_lease("scheduler", "b", 60),
+            await db.release_lease("scheduler", "a"),          # not the holder any more: no effect
+            await db.acquire_lease("scheduler", "a", 60),
+        ]
+
+    assert run(scenario()) == [True, False, True, True, None, False]
+
+
+def test_an_occurrence_runs_once(database, run):
+    db = database
+    calls = []
+
+    async def job():
+        calls.append(1)
+
+    async def failing():
+        raise ValueError("boom")
+
+    async def scenario():
+        await leader.run_job("nightly", "2024-05-01T02:00:00+00:00", job)
+        await leader.run_job("nightly", "2024-05-01T02:00:00+00:00", job)
+        await leader.run_job("nightly", "2024-05-02T02:00:00+00:00", failing)
+        return await _runs(db)
+
+    runs = run(scenario())
+    assert calls == [1]
+    assert [(r[2], r[3]) for r in runs] == [("ok", None), ("failed", "boom")]
+
+
+@pytest.fixture
+def as_leader(monkeypatch):
+    monkeypatch.setattr(leader, "_is_leader", True)
+
+
+def test_resume_takes_over_an_expired_run(database, as_leader, run):
+    db = database
+    calls = []
+
+    async def job():
+        calls.append(1)
+
+    async def scenario():
+        run_id = await db.start_job_run("nightly", "2024-05-01T02:00:00+00:00", "dead-host:1", -1)
+        await leader.resume_job("nightly", job)
+        return run_id, await _runs(db)
+
+    run_id, runs = run(scenario())
+    assert calls == [1]
+    assert runs == [(run_id, leader.HOLDER, "ok", None)]
+
+
+def test_resume_waits_while_the_run_is_renewed(database, as_leader, run):
+    db = database
+    calls = []
+
+    async def job():
+        calls.append(1)
+
+    async def scenario():
+        await db.start_job_run("nightly", "2024-05-01T02:00:00+00:00", "live-host:1", 60)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(leader.resume_job("nightly", job), 0.2)
+        return await _runs(db)
+
+    runs = run(scenario())
+    assert calls == []
+    assert [(r[1], r[2]) for r in runs] == [("live-host:1", "running")]
+
+
+def test_losing_the_lease_cancels_leader_work(database, run, monkeypatch):
+    db = database
+    answers = iter([True, False])
+    cancelled = []
+
+    async def acquire(*args):
+        return next(answers, False)
+
+    async def long_job():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(dt.datetime.utcnow())
+            raise
+
+    monkeypatch.setattr(db, "acquire_lease", acquire)
+    monkeypatch.setattr(leader, "_on_elected", [long_job])
+    monkeypatch.setattr(leader, "_is_leader", False)
+    monkeypatch.setattr(leader.settings, "SCHEDULER_LEASE_SECONDS", 3)     # re-check every second
+
+    async def scenario():
+        loop = asyncio.create_task(leader.run_forever())
+        for _ in range(60):
+            await asyncio.sleep(0.05)
+            if cancelled:
+                break
+        loop.cancel()
+        return leader.is_leader()
+
+    assert run(scenario()) is False
+    assert len(cancelled) == 1
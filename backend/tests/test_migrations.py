@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy import text
+
+from app.migrations import MIGRATIONS
+
+
+async def _migrations(db):
+    async with db.engine.begin() as conn:
+        rows = await conn.execute(text("SELECT version, applied_at, hook_done_at FROM schema_migrations ORDER BY version"))
+        return {r.version: (r.applied_at, r.hook_done_at) for r in rows}
+
+
+async def _indexes(db):
+    async with db.engine.begin() as conn:
+        rows = await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"))
+        return {r.name for r in rows}
+
+
+def test_upgrade_from_baseline(baseline_database, run):
+    db = baseline_database
+
+    async def scenario():
+        await db.init_db()
+        first = await _migrations(db)
+        await db.init_db()          # a restart applies nothing
+        return first, await _migrations(db), await _indexes(db)
+
+    first, second, indexes = run(scenario())
+    assert sorted(first) == [m[0] for m in MIGRATIONS]
+    assert all(hook_done is not None for v, (_, hook_done) in first.items() if v in db._MIGRATION_HOOKS)
+    assert second == first
+    assert {"idx_phoneme_results_user_created", "idx_grammar_results_user_created", "idx_weakness_events_user"} <= indexes
+
+
+@pytest.fixture
+def extra_migration(database, monkeypatch):
+    """A v99 with a data hook that fails the first time it runs."""
+    db = database
+    calls = []
+
+    async def hook():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RuntimeError("killed mid-backfill")
+
+    monkeypatch.setattr(db, "MIGRATIONS", MIGRATIONS + [(99, "test backfill", [], [])])
+    monkeypatch.setitem(db._MIGRATION_HOOKS, 99, hook)
+    return db, calls
+
+
+def test_crashed_hook_runs_again(extra_migration, run):
+    db, calls = extra_migration
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await db.apply_migrations()
+        crashed = (await _migrations(db))[99]
+        await db.apply_migrations()
+        await db.apply_migrations()
+        return crashed, (await _migrations(db))[99]
+
+    crashed, done = run(scenario())
+    assert crashed[1] is None                   # recorded, but the hook did not finish
+    assert done[0] == crashed[0] and done[1] is not None
+    assert calls == [0, 1]                      # retried once, then left alone
+
+
+def test_hook_waits_for_the_lease_holder(extra_migration, run):
+    db, calls = extra_migration
+
+    async def scenario():
+        await db.acquire_lease("migration:v99", "other-host:1", 60)
+        await db.apply_migrations()
+        held = (await _migrations(db))[99]
+        await db.release_lease("migration:v99", "other-host:1")
+        with pytest.raises(RuntimeError):
+            await db.apply_migrations()
+        return held
+
+    held = run(scenario())
+    assert held[1] is None
+    assert calls == [0]                         # only ran once the other process let go
@@ -0,0 +1,52 @@
+import pytest
+
+from app import phone_codec
+
+
+REF = ["HH", "AH", "L", "OW", "W", "ER", "L", "D"]
+PRED = ["HH", "EH", "L", "OW", "W", "ER", "D", "Z"]
+OPS = [
+    {"op": "S", "g": "AH", "p": "EH", "i": 1, "j": 1},
+    {"op": "D", "g": "L", "p": None, "i": 6, "j": 6},
+    {"op": "I", "g": None, "p": "Z", "i": 8, "j": 7},
+]
+WORDS = [
+    {"word": "hello", "phoneme_errors": OPS[:1], "weakness_categories": ["Substitution"]},
+    {"word": "world", "phoneme_errors": OPS[1:], "weakness_categories": ["Deletion", "Insertion"]},
+]
+
+
+def test_round_trip():
+    blob = phone_codec.encode(PRED, REF, OPS, WORDS)
+    assert blob is not None
+    assert phone_codec.decode(blob) == (PRED, REF, OPS, WORDS)
+
+
+def test_round_trip_absent_fields():
+    blob = phone_codec.encode(PRED, None, None, None)
+    assert phone_codec.decode(blob) == (PRED, None, None, None)
+    assert phone_codec.decode(phone_codec.encode([], [], [], [])) == ([], [], [], [])
+
+
+def test_descriptions_are_not_stored():
+    ops = phone_codec.describe_ops(OPS)
+    words = [dict(w, phoneme_errors=phone_codec.describe_ops(w["phoneme_errors"])) for w in WORDS]
+    _, _, decoded_ops, decoded_words = phone_codec.decode(phone_codec.encode(PRED, REF, ops, words))
+    assert decoded_ops == OPS
+    assert decoded_words == WORDS
+
+
+def test_unpackable_alignments_are_rejected():
+    # callers keep the JSON columns when encode returns None
+    assert phone_codec.encode(["NOT_A_PHONE"], None, None, None) is None
+    assert phone_codec.encode(PRED, None, OPS, None) is None                       # ops need ref
+    assert phone_codec.encode(PRED, REF, [dict(OPS[0], g="IY")], None) is None     # g must be ref[i]
+    assert phone_codec.encode(PRED, REF, OPS, WORDS[::-1]) is None                 # words out of op order
+    assert phone_codec.encode(PRED, REF, OPS, [dict(WORDS[0], weakness_categories=[])] + WORDS[1:]) is None
+
+
+def test_unknown_version():
+    blob = bytearray(phone_codec.encode(PRED, REF, OPS, WORDS))
+    blob[0] = phone_codec.VERSION + 1
+    with pytest.raises(ValueError):
+        phone_codec.decode(bytes(blob))
@@ -0,0 +1,92 @@
+import json
+
+from sqlalchemy import text
+
+REF = ["HH", "AH", "L", "OW"]
+PRED = ["HH", "EH", "L", "OW"]
+OPS = [{"op": "S", "g": "AH", "p": "EH", "i": 1, "j": 1}]
+LEGACY = ("INSERT INTO phoneme_results (user_id, audio_sha256, ref_text, pred_phones, ref_phones, ops_raw, created_at) "
+          "VALUES ('u1', 'sha', 'hello', ?, ?, ?, ?)")
+
+
+def _legacy_rows(n, pred=PRED):
+    return [(json.dumps(pred), json.dumps(REF), json.dumps(OPS), f"2024-05-01 09:00:{i:02d}") for i in range(n)]
+
+
+async def _table_sql(db):
+    async with db.engine.begin() as conn:
+        return (await conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'phoneme_results'"))).scalar()
+
+
+async def _storage(db):
+    async with db.engine.begin() as conn:
+        rows = await conn.execute(text("SELECT id, pred_phones IS NULL AS json_cleared, alignment IS NOT NULL AS packed "
+                                       "FROM phoneme_results ORDER BY id"))
+        return [tuple(r) for r in rows]
+
+
+def test_upgrade_relaxes_and_compacts(baseline_database, raw_sql, run):
+    db = baseline_database
+    raw_sql(LEGACY, _legacy_rows(3) + _legacy_rows(1, pred=["NOT_A_PHONE"]))
+
+    async def scenario():
+        await db.init_db()
+        page = await db.fetch_user_results("u1", limit=10)
+        async with db.engine.begin() as conn:
+            indexes = (await conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'phoneme_results'"
+            ))).scalars().all()
+        return await _table_sql(db), await _storage(db), page, indexes
+
+    table_sql, storage, page, indexes = run(scenario())
+    assert "pred_phones TEXT NOT NULL" not in table_sql
+    assert storage == [(1, 1, 1), (2, 1, 1), (3, 1, 1), (4, 0, 0)]     # the unpackable row keeps its JSON
+    assert [p["pred_phones"] for p in page["phoneme"]] == [PRED, PRED, ["NOT_A_PHONE"], PRED]     # ids 3, 2, 4, 1
+    assert all(p["ops_raw"] == OPS for p in page["phoneme"])
+    assert "idx_phoneme_results_user_created" in indexes
+
+
+def test_writes_keep_json_until_the_rebuild_runs(baseline_database, raw_sql, run):
+    db = baseline_database
+    result = {"details": {"ref_text": "hello", "pred_phones": PRED, "ref_phones": REF, "ops_after_rules": OPS}}
+
+    # another process is rebuilding the table, so v9 is not recorded yet
+    raw_sql(next(stmt for stmt in db.DDL_SQLITE.split(";") if "TABLE IF NOT EXISTS scheduler_leases" in stmt))
+
+    async def scenario():
+        await db.acquire_lease("migration:v9:schema", "other-host:1", 60)
+        await db.init_db()
+        await db.save_phoneme_result("u1", b"audio", result)
+        before = await _storage(db)
+        await db.release_lease("migration:v9:schema", "other-host:1")
+        await db.init_db()
+        return before, await _storage(db), await db.fetch_user_results("u1")
+
+    before, after, page = run(scenario())
+    assert before == [(1, 0, 0)]
+    assert after == [(1, 1, 1)]
+    assert page["phoneme"][0]["pred_phones"] == PRED
+
+
+def test_interrupted_rebuild_resumes(baseline_database, raw_sql, run):
+    db = baseline_database
+    raw_sql(LEGACY, _legacy_rows(5))
+    # a previous attempt created the copy and got through the first two rows
+    raw_sql(
+        "CREATE TABLE phoneme_results_new (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+        "audio_sha256 TEXT NOT NULL, ref_text TEXT, pred_phones TEXT, ref_phones TEXT, ops_raw TEXT, per_strict REAL, "
+        "per_sle REAL, wer REAL, word_analysis TEXT, weakness_categories TEXT, created_at TIMESTAMP NOT NULL)"
+    )
+    raw_sql("INSERT INTO phoneme_results_new SELECT * FROM phoneme_results WHERE id <= 2")
+
+    async def scenario():
+        await db._sqlite_relax_pred_phones(batch_size=2)
+        async with db.engine.begin() as conn:
+            ids = (await conn.execute(text("SELECT id FROM phoneme_results ORDER BY id"))).scalars().all()
+            leftover = (await conn.execute(text("SELECT name FROM sqlite_master WHERE name = 'phoneme_results_new'"))).scalar()
+        return await _table_sql(db), ids, leftover
+
+    table_sql, ids, leftover = run(scenario())
+    assert "pred_phones TEXT NOT NULL" not in table_sql
+    assert ids == [1, 2, 3, 4, 5]
+    assert leftover is None
@@ -0,0 +1,63 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.sketch import DEFAULT_RELATIVE_ACCURACY, DDSketch
+
+QS = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+
+
+def _assert_within(sketch, values, a=DEFAULT_RELATIVE_ACCURACY):
+    for q in QS:
+        exact = float(np.quantile(values, q, method="lower"))
+        assert sketch.quantile(q) == pytest.approx(exact, rel=a, abs=1e-9), q
+
+
+def test_quantiles_within_relative_accuracy():
+    rnd = random.Random(3)
+    values = [rnd.lognormvariate(3, 1.5) for _ in range(5000)]
+    _assert_within(DDSketch.of(values), values)
+
+
+def test_zeros_are_exact():
+    values = [0.0] * 60 + [12.5, 30.0, 80.0] * 10
+    s = DDSketch.of(values)
+    assert s.quantile(0.5) == 0.0
+    _assert_within(s, values)
+
+
+def test_merge_matches_one_sketch_of_all_values():
+    rnd = random.Random(5)
+    days = [[rnd.uniform(0, 120) for _ in range(rnd.randint(0, 300))] for _ in range(7)]
+    merged = DDSketch()
+    for day in days:
+        merged.merge(DDSketch.of(day))
+    values = [v for day in days for v in day]
+    assert merged.count == len(values)
+    assert merged.to_dict() == DDSketch.of(values).to_dict()
+    _assert_within(merged, values)
+
+
+def test_dict_round_trip():
+    s = DDSketch.of([1.0, 2.0, 0.0, 250.0])
+    restored = DDSketch.from_dict(s.to_dict())
+    assert restored.to_dict() == s.to_dict()
+    assert [restored.quantile(q) for q in QS] == [s.quantile(q) for q in QS]
+    assert DDSketch.from_dict(None).quantile(0.5) is None
+
+
+def test_quantiles_stay_within_min_and_max():
+    values = [3.3, 7.0, 101.7]
+    s = DDSketch.of(values)
+    assert s.min == 3.3 and s.max == 101.7
+    assert all(3.3 <= s.quantile(q) <= 101.7 for q in QS)
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        DDSketch(0)
+    with pytest.raises(ValueError):
+        DDSketch.of([1.0]).quantile(1.5)
+    with pytest.raises(ValueError):
+        DDSketch(0.01).merge(DDSketch(0.02))
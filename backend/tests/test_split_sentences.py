@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+from app.utils_gec import split_sentences  # noqa: E402
+
+
+def _sentences(text, max_words=64):
+    toks = text.split()
+    return [" ".join(toks[a:b]) for a, b in split_sentences(text, max_words)]
+
+
+def test_sentence_ends():
+    assert _sentences("I goes home. She are happy! Is it ok?") == ["I goes home.", "She are happy!", "Is it ok?"]
+
+
+def test_spans_tile_the_tokens():
+    text = "One two.  Three\nfour five.   Six"
+    spans = split_sentences(text)
+    assert spans == [(0, 2), (2, 5), (5, 6)]
+
+
+def test_closing_quotes_and_brackets_end_a_sentence():
+    assert _sentences('He said "stop." Then (it ended.) Done') == ['He said "stop."', "Then (it ended.)", "Done"]
+
+
+def test_abbreviations_do_not_end_a_sentence():
+    assert _sentences("I met Dr. Smith and Mr. Lee, e.g. at work. Bye.") == ["I met Dr. Smith and Mr. Lee, e.g. at work.", "Bye."]
+
+
+def test_run_on_sentences_are_cut_at_max_words():
+    text = " ".join(f"w{i}" for i in range(10)) + "."
+    assert split_sentences(text, max_words=4) == [(0, 4), (4, 8), (8, 10)]
+
+
+def test_empty_text():
+    assert split_sentences("") == []
+    assert split_sentences("   ") == []
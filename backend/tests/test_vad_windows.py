@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("soundfile")
+from app.utils_audio import vad_windows  # noqa: E402
+
+SR = 16000
+FRAME = 320
+
+
+def _speech(seconds, seed=0):
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, int(seconds * SR)).astype(np.float32)
+
+
+def _check_tiling(windows, n, max_seconds, overlap_seconds):
+    assert windows[0][2] == 0 and windows[-1][3] == n
+    for (_, _, _, keep_b), (_, _, keep_a, _) in zip(windows, windows[1:]):
+        assert keep_b == keep_a
+    for start, end, keep_a, keep_b in windows:
+        assert start <= keep_a < keep_b <= end
+        assert keep_b - keep_a <= max_seconds * SR
+        assert keep_a - start <= overlap_seconds * SR + FRAME and end - keep_b <= overlap_seconds * SR + FRAME
+        assert all(o % FRAME == 0 for o in (start, keep_a) + ((keep_b,) if keep_b != n else ()))
+
+
+def test_short_buffer_is_one_window():
+    y = _speech(5)
+    assert vad_windows(y, max_seconds=20) == [(0, len(y), 0, len(y))]
+
+
+def test_hard_cuts_without_pauses():
+    y = _speech(61.3)
+    windows = vad_windows(y, max_seconds=20, overlap_seconds=0.5, frame=FRAME)
+    assert len(windows) == 4
+    _check_tiling(windows, len(y), 20, 0.5)
+    assert [w[2] for w in windows[1:]] == [20 * SR, 40 * SR, 60 * SR]
+
+
+def test_cuts_in_the_middle_of_a_pause():
+    # speech 0-15 s, silence 15-16 s, speech 16-30 s: the cut goes at 15.5 s, not at 20 s
+    y = np.concatenate([_speech(15, 1), np.zeros(SR, dtype=np.float32), _speech(14, 2)])
+    windows = vad_windows(y, max_seconds=20, overlap_seconds=0.5, frame=FRAME)
+    _check_tiling(windows, len(y), 20, 0.5)
+    assert len(windows) == 2
+    assert windows[0][3] == int(15.5 * SR)
+
+
+def test_short_pauses_are_ignored():
+    y = np.concatenate([_speech(15, 1), np.zeros(int(0.1 * SR), dtype=np.float32), _speech(14, 2)])
+    windows = vad_windows(y, max_seconds=20, overlap_seconds=0.5, frame=FRAME, min_silence_ms=200)
+    assert windows[0][3] == 20 * SR
@@ -0,0 +1,91 @@
+import json
+
+from sqlalchemy import text
+
+REF = ["HH", "AH", "L", "OW", "W", "ER", "L", "D"]
+PRED = ["HH", "EH", "L", "OW", "W", "ER", "D", "Z"]
+OPS = [
+    {"op": "S", "g": "AH", "p": "EH", "i": 1, "j": 1},
+    {"op": "D", "g": "L", "p": None, "i": 6, "j": 6},
+    {"op": "I", "g": None, "p": "Z", "i": 8, "j": 7},
+]
+PHONEME = {
+    "details": {"ref_text": "hello world", "pred_phones": PRED, "ref_phones": REF, "ops_after_rules": OPS, "per_sle": 0.3},
+    "weakness_categories": ["Substitution", "Deletion"],
+}
+GRAMMAR = {
+    "gec": {"raw_corrected": "She goes.", "final_text": "She goes.", "edits": []},
+    "guardrails": [], "metrics": {}, "weakness_categories": ["present simple", "subject verb agreement"],
+}
+
+
+async def _events(db):
+    async with db.engine.begin() as conn:
+        rows = await conn.execute(text("SELECT source, result_id, kind, label FROM weakness_events ORDER BY id"))
+        return [tuple(r) for r in rows]
+
+
+def test_saved_results_write_events(database, run):
+    db = database
+
+    async def scenario():
+        await db.save_phoneme_result("u1", b"audio", PHONEME)
+        await db.save_grammar_result("u1", "she go.", GRAMMAR)
+        await db.save_grammar_result("u1", "fine.", dict(GRAMMAR, weakness_categories=[]))
+        await db.save_grammar_result("u2", "he go.", GRAMMAR)
+        return (await _events(db), await db.fetch_user_weaknesses("u1"),
+                await db.fetch_user_weakness_summary("u1"))
+
+    events, page, summary = run(scenario())
+    assert events == [
+        ("pronunciation", 1, "category", "Substitution"),
+        ("pronunciation", 1, "category", "Deletion"),
+        ("phone", 1, "S", "AH -> EH"),
+        ("phone", 1, "D", "L"),
+        ("phone", 1, "I", "Z"),
+        ("grammar", 1, "category", "present simple"),
+        ("grammar", 1, "category", "subject verb agreement"),
+        ("grammar", 3, "category", "present simple"),
+        ("grammar", 3, "category", "subject verb agreement"),
+    ]
+    # newest first; the result without categories is not listed
+    assert [(i["type"], i["text"], i["categories"]) for i in page["items"]] == [
+        ("grammar", "she go.", ["present simple", "subject verb agreement"]),
+        ("pronunciation", "hello world", ["Substitution", "Deletion"]),
+    ]
+    assert page["next_cursor"] is None
+    assert summary["grammar_summary"] == [{"category": "present simple", "count": 1},
+                                          {"category": "subject verb agreement", "count": 1}]
+    assert summary["pronunciation_summary"] == {
+        "most_common_substitutions": [{"pair": "AH -> EH", "count": 1}],
+        "most_common_insertions": [{"phoneme": "Z", "count": 1}],
+        "most_common_deletions": [{"phoneme": "L", "count": 1}],
+    }
+
+
+def test_upgrade_backfills_events(baseline_database, raw_sql, run):
+    db = baseline_database
+    raw_sql(
+        "INSERT INTO phoneme_results (user_id, audio_sha256, ref_text, pred_phones, ref_phones, ops_raw, weakness_categories, created_at) "
+        "VALUES ('u1', 'sha', 'hello world', ?, ?, ?, ?, '2024-05-01 09:00:00')",
+        [(json.dumps(PRED), json.dumps(REF), json.dumps(OPS[:1]), '["Substitution"]')],
+    )
+    raw_sql(
+        "INSERT INTO grammar_results (user_id, text_sha256, input_text, raw_corrected, final_text, weakness_categories, created_at) "
+        "VALUES ('u1', 'sha', ?, 'x', 'x', ?, '2024-05-01 10:00:00')",
+        [("she go.", '["present simple"]'), ("fine.", "[]"), ("old row", "null")],
+    )
+
+    async def scenario():
+        await db.init_db()
+        events = await _events(db)
+        rerun = await db.backfill_weakness_events()
+        return events, rerun, await _events(db)
+
+    events, rerun, after = run(scenario())
+    assert sorted(events) == [
+        ("grammar", 1, "category", "present simple"),
+        ("phone", 1, "S", "AH -> EH"),
+        ("pronunciation", 1, "category", "Substitution"),
+    ]
+    assert rerun == (0, 0) and after == events          # safe to run again